@@ -0,0 +1,313 @@
+"""
+Benchmark suite: runs the tracker against mock_providers.py and reports
+throughput and cost per input source, size, engine, concurrency and cache state.
+
+    python benchmark.py                                  # default matrix
+    python benchmark.py --sources genius,manual --sizes 500 --workers 8,32
+    python benchmark.py --compare benchmark_results/baseline.json
+
+For every scenario it records songs/sec, p50/p95/p99 per-song latency (from the
+moment the engine takes a song from the listing until its result is yielded),
+API calls per song per provider (counted by the mock server), the time taken
+by export_results(), and the peak RSS of the process that ran it. Each scenario
+runs in a fresh subprocess with its own home directory, so caches, the artist
+ID map and peak memory never carry over between scenarios. Results are written
+as JSON; --compare flags scenarios that got slower than a previous results file.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+import mock_providers
+
+# --- Configuration ---
+SOURCES = {
+    'genius': "https://genius.com/artists/Mock-producer",
+    'playlist': f"https://open.spotify.com/playlist/{mock_providers.MOCK_PLAYLIST_ID}",
+    'album': f"https://open.spotify.com/album/{mock_providers.MOCK_ALBUM_ID}",
+    'manual': None,  # 'Song - Artist' lines built for the requested size
+}
+CACHE_MODES = ('off', 'cold', 'warm')
+DEFAULTS = {
+    'sources': ','.join(SOURCES),
+    'sizes': '50,200',
+    'workers': '4,16',
+    'engines': 'threads',
+    'cache': 'cold,warm',
+}
+# Client-side pacing when provider rate limits are not emulated, so the numbers
+# reflect the code rather than the production token buckets
+UNTHROTTLED_LIMITS = {provider: {'rate': 1000, 'burst': 1000} for provider in mock_providers.DEFAULT_PROFILES}
+DEFAULT_RESULTS_DIR = "benchmark_results"
+DEFAULT_TOLERANCE = 0.15
+
+
+# --- Measurements ---
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+
+
+def mock_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/_stats", timeout=10) as response:
+        return json.loads(response.read())
+
+
+def manual_source(size):
+    catalog = mock_providers.SyntheticCatalog(size)
+    return "\n".join(f"{catalog.title(i)} - {catalog.artist(i)}" for i in range(1, size + 1))
+
+
+def scenario_id(scenario):
+    return (f"{scenario['source']}-{scenario['size']}-{scenario['engine']}"
+            f"-w{scenario['workers']}-{scenario['cache']}")
+
+
+# --- Scenario Runner (subprocess) ---
+def run_scenario(scenario):
+    """Run one scenario in this process and return its measurements."""
+    # Imported here so the parent process stays small and its RSS is not measured
+    import placement_core as core
+    from placement_tracker import JobRunner
+
+    core.endpoint_router.configure(scenario['base_url'])
+    if not scenario['realistic_limits']:
+        core.rate_limiter.configure_from(UNTHROTTLED_LIMITS)
+    core.response_cache.configure({'enabled': scenario['cache'] != 'off',
+                                   'path': os.path.join(core.get_data_dir(), 'benchmark_cache.sqlite3')})
+    credentials = {key: 'benchmark' for key in core.REQUIRED_SECRETS}
+    source = SOURCES[scenario['source']] or manual_source(scenario['size'])
+
+    def timed_run():
+        session = core.shared_session(scenario['workers'] + core.GENIUS_PREFETCH_PAGES)
+        token = core.get_spotify_access_token(session, 'benchmark', 'benchmark')
+        before = mock_stats(scenario['base_url'])
+        taken = {}
+
+        def stamped(songs):
+            # Latency starts when the engine takes the song from the listing
+            for song in songs:
+                taken[core.song_key(song)] = time.perf_counter()
+                yield song
+
+        listing = core.list_songs(session, source, token, credentials['genius_token'], scenario['size'])
+        started = time.perf_counter()
+        rows, latencies, failed = [], [], 0
+        for result in core.track_placements(stamped(listing), credentials, engine=scenario['engine'],
+                                            limit=scenario['size'], max_workers=scenario['workers'],
+                                            async_concurrency=scenario['workers'], session=session):
+            finished = time.perf_counter()
+            key = core.song_key(result.song)
+            if key in taken:
+                latencies.append(finished - taken[key])
+            if result.ok:
+                rows.append(result.row)
+            else:
+                failed += 1
+        elapsed = time.perf_counter() - started
+        return rows, latencies, failed, elapsed, before, mock_stats(scenario['base_url'])
+
+    if scenario['cache'] == 'warm':
+        timed_run()  # fills the response cache
+    rows, latencies, failed, elapsed, before, after = timed_run()
+
+    class _Quiet:
+        def put(self, message):
+            pass
+
+    export_dir = os.path.join(core.get_data_dir(), 'benchmark_export')
+    os.makedirs(export_dir, exist_ok=True)
+    export_started = time.perf_counter()
+    JobRunner().export_results(rows, {'gui_queue': _Quiet(), 'save_dir': export_dir, 'file_name': 'benchmark',
+                                      'export_to_sheets': False, 'spreadsheet_id': '', 'sheet_name': ''})
+    export_seconds = time.perf_counter() - export_started
+
+    songs = len(rows) + failed
+    calls = {provider: after.get(provider, 0) - before.get(provider, 0) for provider in mock_providers.DEFAULT_PROFILES}
+    throttled = {provider: after.get(f"{provider}_throttled", 0) - before.get(f"{provider}_throttled", 0)
+                 for provider in mock_providers.DEFAULT_PROFILES}
+    return {
+        'songs': songs,
+        'ok': len(rows),
+        'failed': failed,
+        'seconds': round(elapsed, 3),
+        'songs_per_sec': round(songs / elapsed, 2) if elapsed else None,
+        'latency_ms': {f"p{pct}": round(percentile(latencies, pct) * 1000, 1) if latencies else None
+                       for pct in (50, 95, 99)},
+        'api_calls_per_song': {provider: round(count / songs, 3) if songs else None for provider, count in calls.items()},
+        'throttled': throttled,
+        'export_seconds': round(export_seconds, 4),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_in_subprocess(scenario, timeout):
+    """Run a scenario in a fresh interpreter with its own home directory."""
+    with tempfile.TemporaryDirectory(prefix='benchmark_home_') as home:
+        result_path = os.path.join(home, 'result.json')
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        command = [sys.executable, os.path.abspath(__file__), '--run-scenario', json.dumps(scenario),
+                   '--result-file', result_path]
+        try:
+            process = subprocess.run(command, env=env, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {'error': f"timed out after {timeout}s"}
+        if process.returncode != 0 or not os.path.exists(result_path):
+            lines = (process.stderr or process.stdout).strip().splitlines()
+            return {'error': lines[-1] if lines else f"exit code {process.returncode}"}
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+# --- Reporting ---
+def format_row(entry):
+    if 'error' in entry:
+        return f"{entry['id']:<40} ERROR: {entry['error']}"
+    latency = entry['latency_ms']
+    calls = " ".join(f"{provider[0]}={count}" for provider, count in entry['api_calls_per_song'].items())
+    return (f"{entry['id']:<40} {entry['songs_per_sec']:>8} songs/s  "
+            f"p50 {latency['p50']}ms p95 {latency['p95']}ms p99 {latency['p99']}ms  "
+            f"calls/song {calls}  export {entry['export_seconds']}s  rss {entry['peak_rss_mb']}MB")
+
+
+def compare_results(results, baseline_path, tolerance):
+    """Scenarios that are slower than in the baseline by more than `tolerance`, as messages."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {entry['id']: entry for entry in json.load(f)['results'] if 'error' not in entry}
+    regressions = []
+    for entry in results:
+        old = baseline.get(entry['id'])
+        if not old or 'error' in entry:
+            continue
+        if entry['songs_per_sec'] < old['songs_per_sec'] * (1 - tolerance):
+            regressions.append(f"{entry['id']}: {old['songs_per_sec']} -> {entry['songs_per_sec']} songs/s")
+        old_p95, new_p95 = old['latency_ms']['p95'], entry['latency_ms']['p95']
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + tolerance):
+            regressions.append(f"{entry['id']}: p95 latency {old_p95} -> {new_p95} ms")
+        if entry['export_seconds'] > max(old['export_seconds'] * (1 + tolerance), old['export_seconds'] + 0.05):
+            regressions.append(f"{entry['id']}: export {old['export_seconds']} -> {entry['export_seconds']} s")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def csv_option(value, allowed=None, cast=str):
+    items = [cast(item.strip()) for item in value.split(',') if item.strip()]
+    if allowed is not None:
+        unknown = [item for item in items if item not in allowed]
+        if unknown:
+            raise argparse.ArgumentTypeError(f"unknown value(s) {', '.join(map(str, unknown))}; "
+                                             f"expected {', '.join(allowed)}")
+    return items
+
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracker against local mock providers.")
+    parser.add_argument('--sources', default=DEFAULTS['sources'], help=f"comma-separated: {', '.join(SOURCES)}")
+    parser.add_argument('--sizes', default=DEFAULTS['sizes'], help="comma-separated song counts")
+    parser.add_argument('--workers', default=DEFAULTS['workers'], help="comma-separated concurrency levels")
+    parser.add_argument('--engines', default=DEFAULTS['engines'], help="comma-separated: threads, pipeline, asyncio")
+    parser.add_argument('--cache', default=DEFAULTS['cache'], help=f"comma-separated: {', '.join(CACHE_MODES)}")
+    parser.add_argument('--latency-scale', type=float, default=0.25, help="scale the mock latencies (1 = realistic)")
+    parser.add_argument('--realistic-limits', action='store_true',
+                        help="keep the app's rate limits and have the mock enforce its own (429s)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=int, default=900, help="seconds allowed per scenario")
+    parser.add_argument('--output', help=f"results file (default: {DEFAULT_RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument('--compare', metavar='RESULTS', help="fail if slower than this earlier results file")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, e.g. 0.15")
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(json.loads(args.run_scenario))
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    from placement_core import ENGINES
+    try:
+        sources = csv_option(args.sources, list(SOURCES))
+        sizes = csv_option(args.sizes, cast=int)
+        workers = csv_option(args.workers, cast=int)
+        engines = csv_option(args.engines, list(ENGINES))
+        cache_modes = csv_option(args.cache, CACHE_MODES)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    server = mock_providers.start_mock_server(songs=max(sizes), seed=args.seed, latency_scale=args.latency_scale,
+                                              rate_limits=args.realistic_limits)
+    scenarios = [{'source': source, 'size': size, 'engine': engine, 'workers': count, 'cache': cache,
+                  'base_url': server.base_url, 'realistic_limits': args.realistic_limits}
+                 for source in sources for size in sizes for engine in engines
+                 for count in workers for cache in cache_modes]
+    print(f"Running {len(scenarios)} scenarios against {server.base_url}...", file=sys.stderr)
+
+    results = []
+    try:
+        for scenario in scenarios:
+            entry = dict(id=scenario_id(scenario), **{k: scenario[k] for k in ('source', 'size', 'engine',
+                                                                               'workers', 'cache')})
+            entry.update(run_in_subprocess(scenario, args.timeout))
+            results.append(entry)
+            print(format_row(entry), file=sys.stderr)
+    finally:
+        server.shutdown()
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {'latency_scale': args.latency_scale, 'realistic_limits': args.realistic_limits,
+                         'seed': args.seed},
+            'results': results,
+        }, f, indent=2)
+    print(f"Results saved to {output}", file=sys.stderr)
+
+    failed = [entry['id'] for entry in results if 'error' in entry]
+    if args.compare:
+        regressions = compare_results(results, args.compare, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
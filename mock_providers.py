@@ -0,0 +1,461 @@
+"""
+Local stand-in for the Genius, Spotify, RapidAPI and YouTube endpoints the
+tracker calls, for offline, repeatable runs of the app, the CLI and benchmarks.
+
+    python mock_providers.py --songs 10000
+    python placement_tracker.py --manifest jobs.toml --endpoint http://127.0.0.1:8765
+
+Requests are answered from a cassette recorded with `--record` when one is
+given and has the request, otherwise from a synthetic catalog: one producer
+("Mock Producer", https://genius.com/artists/Mock-producer) credited on every
+song, plus a playlist and an album holding the same songs. Every provider
+answers with a log-normal latency and enforces its own token bucket, replying
+429 with a Retry-After header when it is exceeded, like the real APIs do.
+"""
+import argparse
+import datetime
+import html
+import json
+import math
+import random
+import re
+import signal
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from placement_core import PROVIDER_HOSTS, TokenBucket, cassette_key
+
+# --- Configuration ---
+DEFAULT_PORT = 8765
+DEFAULT_SONGS = 1000
+# Rate limiter provider for each path prefix (see placement_core.PROVIDER_HOSTS)
+PREFIX_PROVIDERS = {
+    '/genius-api': 'genius',
+    '/genius-web': 'genius',
+    '/spotify-accounts': 'spotify',
+    '/spotify-api': 'spotify',
+    '/rapidapi': 'rapidapi',
+    '/googleapis': 'youtube',
+}
+# Per provider: median latency (s), log-normal sigma, requests per second, burst
+DEFAULT_PROFILES = {
+    'genius': (0.12, 0.5, 10.0, 10),
+    'spotify': (0.06, 0.4, 20.0, 20),
+    'rapidapi': (0.25, 0.6, 2.0, 2),
+    'youtube': (0.08, 0.4, 20.0, 20),
+}
+MOCK_ARTIST_ID = 1000
+MOCK_ARTIST_SLUG = 'mock-producer'
+MOCK_PLAYLIST_ID = 'mockplaylist'
+MOCK_ALBUM_ID = 'mockalbum'
+GENIUS_MAX_PER_PAGE = 50
+SPOTIFY_PAGE_SIZES = {'playlists': 100, 'albums': 50}
+STREAM_HISTORY_DAYS = 60
+STREAM_HISTORY_START = datetime.date(2024, 1, 1)
+SONG_TITLE_RE = re.compile(r'Mock Song (\d+)')
+
+
+# --- Synthetic Catalog ---
+class SyntheticCatalog:
+    """
+    Deterministic songs 1..size. Every value (titles, credits, media, stream
+    histories, view counts) derives from the song number and the seed, so two
+    servers started with the same arguments answer identically.
+    """
+    def __init__(self, size, seed=1):
+        self.size = size
+        self.seed = seed
+
+    def _rng(self, i, salt):
+        return random.Random(f"{self.seed}:{salt}:{i}")
+
+    def has(self, i):
+        return 1 <= i <= self.size
+
+    @staticmethod
+    def title(i):
+        return f"Mock Song {i}"
+
+    @staticmethod
+    def artist(i):
+        return f"Mock Artist {i % 101}"
+
+    @staticmethod
+    def spotify_id(i):
+        return f"mk{i:020d}"
+
+    @staticmethod
+    def youtube_id(i):
+        return f"yt{i:09d}"
+
+    def song_number(self, text):
+        """The song a search query or title refers to, or None."""
+        match = SONG_TITLE_RE.search(text or '')
+        number = int(match.group(1)) if match else None
+        return number if number and self.has(number) else None
+
+    def genius_song(self, i):
+        rng = self._rng(i, 'song')
+        media = [{'provider': 'youtube', 'url': f"https://www.youtube.com/watch?v={self.youtube_id(i)}"}]
+        # Like real Genius data, only some songs carry their Spotify link
+        if rng.random() < 0.6:
+            media.append({'provider': 'spotify', 'native_uri': f"spotify:track:{self.spotify_id(i)}"})
+        label = f"Mock Label {rng.randint(1, 12)}"
+        producers = [{'name': 'Mock Producer'}] + [{'name': f"Mock Co-Producer {rng.randint(1, 40)}"}
+                                                   for _ in range(rng.randint(0, 2))]
+        return {
+            'id': i,
+            'title': self.title(i),
+            'primary_artist': {'name': self.artist(i)},
+            'producer_artists': producers,
+            'custom_performances': [
+                {'label': 'Label', 'artists': [{'name': label}]},
+                {'label': 'Copyright ©', 'artists': [{'name': label}]},
+                {'label': 'Phonographic Copyright ℗', 'artists': [{'name': f"{label} Records"}]},
+            ],
+            'media': media,
+        }
+
+    def spotify_track(self, i):
+        return {'id': self.spotify_id(i), 'name': self.title(i), 'artists': [{'name': self.artist(i)}]}
+
+    def stream_history(self, i):
+        rng = self._rng(i, 'streams')
+        streams, daily = rng.randint(10_000, 50_000_000), rng.randint(100, 200_000)
+        # Some songs trend up or down; a few spike on the last day
+        trend = rng.uniform(-0.02, 0.03)
+        spike = rng.random() < 0.05
+        history = []
+        for day in range(STREAM_HISTORY_DAYS):
+            daily = max(1, daily * (1 + trend))
+            boost = 5 if spike and day == STREAM_HISTORY_DAYS - 1 else 1
+            streams += int(daily * rng.uniform(0.8, 1.2) * boost)
+            date = STREAM_HISTORY_START + datetime.timedelta(days=day)
+            history.append({'date': date.isoformat(), 'streams': str(streams)})
+        return history
+
+    def view_count(self, i):
+        return self._rng(i, 'views').randint(1_000, 900_000_000)
+
+
+# --- Request Routing ---
+def json_body(data, status=200):
+    return status, 'application/json; charset=utf-8', json.dumps(data).encode('utf-8')
+
+
+NOT_FOUND = (404, 'application/json; charset=utf-8', b'{"error": "not found"}')
+
+
+def _genius_web(catalog, method, path, query):
+    match = re.fullmatch(r'/api/songs/(\d+)', path)
+    if match:
+        i = int(match.group(1))
+        return json_body({'response': {'song': catalog.genius_song(i)}}) if catalog.has(i) else NOT_FOUND
+    if path == '/api/search/artist':
+        hits = []
+        if 'mock' in query.get('q', '').lower():
+            hits.append({'result': {'id': MOCK_ARTIST_ID, 'name': 'Mock Producer',
+                                    'url': f"https://genius.com/artists/{MOCK_ARTIST_SLUG.capitalize()}"}})
+        return json_body({'response': {'sections': [{'type': 'artist', 'hits': hits}]}})
+    match = re.fullmatch(r'/artists/([^/]+)', path)
+    if match and match.group(1).lower() == MOCK_ARTIST_SLUG:
+        page_data = json.dumps({'tracking_data': [{'key': 'Artist ID', 'value': MOCK_ARTIST_ID}]})
+        page = (f'<!DOCTYPE html><html><head><title>Mock Producer</title>'
+                f'<meta content="{html.escape(page_data)}" itemprop="page_data">'
+                f'</head><body>{"<div></div>" * 2000}</body></html>')
+        return 200, 'text/html; charset=utf-8', page.encode('utf-8')
+    return NOT_FOUND
+
+
+def _genius_api(catalog, method, path, query):
+    match = re.fullmatch(r'/artists/(\d+)/songs', path)
+    if match:
+        if int(match.group(1)) != MOCK_ARTIST_ID:
+            return json_body({'response': {'songs': [], 'next_page': None}})
+        page = max(1, int(query.get('page', 1)))
+        per_page = min(GENIUS_MAX_PER_PAGE, max(1, int(query.get('per_page', 20))))
+        first = (page - 1) * per_page + 1
+        songs = [{'id': i, 'title': catalog.title(i)} for i in range(first, min(catalog.size, first + per_page - 1) + 1)]
+        next_page = page + 1 if first + per_page - 1 < catalog.size else None
+        return json_body({'response': {'songs': songs, 'next_page': next_page}})
+    if path == '/search':
+        i = catalog.song_number(query.get('q'))
+        hits = [{'type': 'song', 'result': {'id': i, 'title': catalog.title(i),
+                                            'primary_artist': {'name': catalog.artist(i)}}}] if i else []
+        return json_body({'response': {'hits': hits}})
+    return NOT_FOUND
+
+
+def _spotify_accounts(catalog, method, path, query):
+    if path == '/api/token' and method == 'POST':
+        return json_body({'access_token': 'mock-access-token', 'token_type': 'Bearer', 'expires_in': 3600})
+    return NOT_FOUND
+
+
+def _spotify_api(catalog, method, path, query):
+    if path == '/v1/search':
+        track = re.search(r'track:(.*?)\s+artist:', query.get('q', ''))
+        i = catalog.song_number(track.group(1) if track else None)
+        return json_body({'tracks': {'items': [catalog.spotify_track(i)] if i else []}})
+    match = re.fullmatch(r'/v1/(playlists|albums)/([^/]+)/tracks', path)
+    if match and match.group(2) in (MOCK_PLAYLIST_ID, MOCK_ALBUM_ID):
+        kind = match.group(1)
+        page_size = SPOTIFY_PAGE_SIZES[kind]
+        offset = max(0, int(query.get('offset', 0)))
+        limit = min(page_size, max(1, int(query.get('limit', page_size))))
+        numbers = range(offset + 1, min(catalog.size, offset + limit) + 1)
+        items = [{'track': catalog.spotify_track(i)} if kind == 'playlists' else catalog.spotify_track(i)
+                 for i in numbers]
+        next_url = None
+        if offset + limit < catalog.size:
+            next_url = (f"https://api.spotify.com/v1/{kind}/{match.group(2)}/tracks"
+                        f"?offset={offset + limit}&limit={limit}")
+        return json_body({'items': items, 'next': next_url, 'offset': offset, 'limit': limit,
+                          'total': catalog.size})
+    return NOT_FOUND
+
+
+def _rapidapi(catalog, method, path, query):
+    match = re.fullmatch(r'/v1/spotify/tracks/mk(\d{20})/streams', path)
+    if match and catalog.has(int(match.group(1))):
+        return json_body(catalog.stream_history(int(match.group(1))))
+    return NOT_FOUND
+
+
+def _googleapis(catalog, method, path, query):
+    if path == '/youtube/v3/videos':
+        items = []
+        for video_id in query.get('id', '').split(','):
+            match = re.fullmatch(r'yt(\d{9})', video_id)
+            if match and catalog.has(int(match.group(1))):
+                items.append({'id': video_id, 'statistics': {'viewCount': str(catalog.view_count(int(match.group(1))))}})
+        return json_body({'kind': 'youtube#videoListResponse', 'items': items})
+    return NOT_FOUND
+
+
+SYNTHETIC_ROUTES = {
+    '/genius-web': _genius_web,
+    '/genius-api': _genius_api,
+    '/spotify-accounts': _spotify_accounts,
+    '/spotify-api': _spotify_api,
+    '/rapidapi': _rapidapi,
+    '/googleapis': _googleapis,
+}
+
+
+def load_cassette(path):
+    """{cassette key: entry} from a cassette written with --record (later entries win)."""
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                entries[entry['key']] = entry
+    return entries
+
+
+def recorded_videos(cassette):
+    """
+    {video ID: statistics item} from every recorded YouTube batch. Batches are
+    formed as songs finish, so a replayed run rarely asks for the same groups;
+    answering per video keeps replays complete.
+    """
+    videos = {}
+    for entry in cassette.values():
+        if entry.get('provider') == 'youtube' and entry.get('status') == 200:
+            try:
+                for item in json.loads(entry['body']).get('items', []):
+                    videos[item.get('id')] = item
+            except (ValueError, AttributeError):
+                continue
+    return videos
+
+
+# --- Server ---
+class MockProviderServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the catalog, cassette, per-provider limits and request counts."""
+    daemon_threads = True
+
+    def __init__(self, address, songs=DEFAULT_SONGS, cassette=None, seed=1, latency_scale=1.0,
+                 rate_limits=True, profiles=None):
+        super().__init__(address, MockProviderHandler)
+        self.catalog = SyntheticCatalog(songs, seed)
+        self.cassette = load_cassette(cassette) if cassette else {}
+        self.videos = recorded_videos(self.cassette)
+        self.latency_scale = latency_scale
+        self.profiles = dict(DEFAULT_PROFILES, **(profiles or {}))
+        self.buckets = {provider: TokenBucket(rate, burst) for provider, (_, _, rate, burst) in self.profiles.items()
+                        if rate_limits and rate > 0}
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients drop connections on purpose (e.g. after finding the artist ID early)
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, *keys):
+        with self._lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def latency(self, provider, recorded=None):
+        """Seconds to wait before answering: the recorded latency, else a log-normal draw."""
+        if self.latency_scale <= 0:
+            return 0.0
+        if recorded is not None:
+            return recorded * self.latency_scale
+        median, sigma = self.profiles[provider][:2]
+        with self._lock:
+            return self._rng.lognormvariate(math.log(median), sigma) * self.latency_scale
+
+    def snapshot(self):
+        """
+        Request counts so far (also served at /_stats): {'<provider>': n,
+        '<provider>_throttled': n, 'replayed': n, 'synthetic': n}.
+        """
+        with self._lock:
+            return dict(self.stats)
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real APIs
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        parts = urllib.parse.urlsplit(self.path)
+        if parts.path == '/_stats':
+            return self._send(*json_body(self.server.snapshot()))
+        prefix = next((p for p in PREFIX_PROVIDERS if parts.path == p or parts.path.startswith(p + '/')), None)
+        if prefix is None:
+            return self._send(*NOT_FOUND)
+        provider = PREFIX_PROVIDERS[prefix]
+        server = self.server
+
+        bucket = server.buckets.get(provider)
+        wait = bucket.try_acquire() if bucket else 0.0
+        if wait > 0:
+            server.count(provider, f"{provider}_throttled")
+            return self._send(429, 'application/json', b'{"error": "rate limited"}',
+                              retry_after=f"{max(wait, 0.1):.1f}")
+        server.count(provider)
+
+        path = parts.path[len(prefix):] or '/'
+        host = next(h for h, p in PROVIDER_HOSTS.items() if p == prefix)
+        entry = server.cassette.get(cassette_key(method, f"{host}{path}?{parts.query}"))
+        if entry:
+            server.count('replayed')
+            time.sleep(server.latency(provider, entry.get('latency')))
+            return self._send(entry['status'], entry.get('content_type') or 'application/json',
+                              entry['body'].encode('utf-8'), retry_after=entry.get('retry_after'))
+
+        query = dict(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+        if prefix == '/googleapis' and server.videos:
+            video_ids = query.get('id', '').split(',')
+            if all(video_id in server.videos for video_id in video_ids):
+                server.count('replayed')
+                time.sleep(server.latency(provider))
+                return self._send(*json_body({'kind': 'youtube#videoListResponse',
+                                              'items': [server.videos[v] for v in video_ids]}))
+
+        server.count('synthetic')
+        time.sleep(server.latency(provider))
+        try:
+            self._send(*SYNTHETIC_ROUTES[prefix](server.catalog, method, path, query))
+        except ValueError:
+            self._send(400, 'application/json', b'{"error": "bad request"}')
+
+    def _send(self, status, content_type, body, retry_after=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if retry_after:
+            self.send_header('Retry-After', retry_after)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading early (e.g. an artist page scan)
+
+
+def start_mock_server(port=0, host='127.0.0.1', **options):
+    """Start a MockProviderServer on a background thread (port 0 picks a free one) and return it."""
+    server = MockProviderServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_rate_option(value):
+    """'provider=rate[:burst]' from the command line."""
+    try:
+        provider, limit = value.split('=', 1)
+        rate, _, burst = limit.partition(':')
+        rate = float(rate)
+        return provider.strip(), rate, int(burst) if burst else max(1, math.ceil(rate))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected provider=rate[:burst], got {value!r}")
+
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Serve mock Genius/Spotify/RapidAPI/YouTube endpoints for offline runs.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--songs', type=int, default=DEFAULT_SONGS, help="size of the synthetic catalog")
+    parser.add_argument('--seed', type=int, default=1, help="seed for synthetic data and latencies")
+    parser.add_argument('--cassette', help="replay responses recorded with placement_tracker.py --record")
+    parser.add_argument('--latency-scale', type=float, default=1.0, help="multiply every latency (0 = answer at once)")
+    parser.add_argument('--no-rate-limits', action='store_true', help="never answer 429")
+    parser.add_argument('--rate', type=parse_rate_option, action='append', default=[], metavar='PROVIDER=RATE[:BURST]',
+                        help="override a provider's requests per second (repeatable)")
+    args = parser.parse_args()
+
+    profiles = {}
+    for provider, rate, burst in args.rate:
+        if provider not in DEFAULT_PROFILES:
+            parser.error(f"unknown provider {provider!r}; expected one of {', '.join(DEFAULT_PROFILES)}")
+        profiles[provider] = DEFAULT_PROFILES[provider][:2] + (rate, burst)
+
+    server = MockProviderServer((args.host, args.port), songs=args.songs, cassette=args.cassette, seed=args.seed,
+                                latency_scale=args.latency_scale, rate_limits=not args.no_rate_limits,
+                                profiles=profiles)
+    print(f"Mock providers on {server.base_url} ({args.songs} songs, "
+          f"{len(server.cassette)} recorded responses). Ctrl+C to stop.")
+    print("Genius producer: https://genius.com/artists/Mock-producer")
+    print(f"Spotify playlist: https://open.spotify.com/playlist/{MOCK_PLAYLIST_ID}")
+    print(f"Spotify album: https://open.spotify.com/album/{MOCK_ALBUM_ID}")
+    # Stop cleanly (and print the counts) on SIGTERM too, e.g. when run in the background
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.snapshot(), indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
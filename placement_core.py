@@ -0,0 +1,4244 @@
+"""
+Placement Tracker core: everything that fetches, caches and exports placement
+data, with no GUI dependencies. The Tk app (placement_tracker.py) and the
+headless runner are thin clients of track_placements().
+"""
+import csv
+import requests
+import os
+import time
+import base64
+import json
+import sys
+import tomli
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+import pickle
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import queue
+import threading
+import email.utils
+import html
+import urllib.parse
+import re
+import sqlite3
+import hashlib
+import asyncio
+import random
+import warnings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from typing import NamedTuple, Optional
+try:
+    import aiohttp  # Only needed for the asyncio engine
+except ImportError:
+    aiohttp = None
+try:
+    import numpy  # Only needed for stream history analytics
+except ImportError:
+    numpy = None
+try:
+    import pyarrow  # Only needed for the Parquet and Arrow exports
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# --- Global Configuration ---
+# Google Sheets API scope
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+# Rows of an exported tab are matched on this column when syncing incrementally
+SHEETS_KEY_COLUMN = "Artist & Title"
+SHEETS_SYNC_MODES = ('incremental', 'replace')
+# Default token-bucket settings per provider: (requests per second, burst size).
+# Override any of these from a [rate_limits] table in secret.toml.
+DEFAULT_RATE_LIMITS = {
+    'genius': (5.0, 5),
+    'spotify': (10.0, 10),
+    'rapidapi': (1 / 1.1, 1),
+    'youtube': (10.0, 10),
+}
+# How many times a request is retried after a 429 before giving up
+MAX_THROTTLE_RETRIES = 2
+# HTTP transport defaults; override from an [http] table in secret.toml.
+# Idempotent requests that time out, fail to connect or get a 502/503/504 are
+# retried with jittered exponential backoff.
+DEFAULT_HTTP_SETTINGS = {
+    'timeouts': {'genius': 10, 'spotify': 10, 'rapidapi': 15, 'youtube': 10},
+    'retries': 3,
+    'backoff': 0.5,       # first retry waits 0.25-0.5s, doubling each attempt
+    'backoff_max': 8.0,
+}
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# Songs in flight at once when using the asyncio engine
+DEFAULT_ASYNC_CONCURRENCY = 200
+# The threads engine keeps at most this many songs per worker queued or running
+THREAD_POOL_WINDOW_FACTOR = 2
+# Response cache lifetimes per endpoint, in seconds. Credits and labels rarely
+# change; stream and view counts go stale within the day.
+HOUR = 60 * 60
+DAY = 24 * HOUR
+DEFAULT_CACHE_TTLS = {
+    'genius_song': 21 * DAY,
+    'genius_search': 7 * DAY,
+    'genius_artist_search': 7 * DAY,
+    'genius_artist_songs': DAY,
+    'spotify_search': 7 * DAY,
+    'spotify_playlist_page': HOUR,
+    'spotify_album_page': 7 * DAY,
+    'rapidapi_streams': 6 * HOUR,
+    'youtube_stats': 6 * HOUR,
+}
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# The YouTube videos endpoint accepts up to 50 IDs per call for the same quota cost
+YOUTUBE_BATCH_SIZE = 50
+YOUTUBE_VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+SPOTIFY_TRACK_ID_RE = re.compile(r'^[A-Za-z0-9]{22}$')
+# Genius artist song listing: songs per page (the API maximum) and pages fetched at once
+GENIUS_PAGE_SIZE = 50
+GENIUS_PREFETCH_PAGES = 4
+# Patterns for pulling the artist ID out of a Genius artist page's <meta> tags
+PAGE_DATA_ITEMPROP_RE = re.compile(r'\bitemprop\s*=\s*["\']page_data["\']', re.I)
+META_CONTENT_RE = re.compile(r'\bcontent\s*=\s*(["\'])(.*?)\1', re.S)
+ARTIST_ID_TRACKING_RE = re.compile(r'"key"\s*:\s*"Artist ID"\s*,\s*"value"\s*:\s*"?(\d+)')
+GENIUS_APP_ARTIST_RE = re.compile(r'genius://artists/(\d+)')
+
+
+# --- Path Management ---
+def get_resource_path(filename):
+    """
+    Get the absolute path to a resource, works for dev and for PyInstaller.
+    This is crucial for ensuring the packaged app can find its files.
+    """
+    # For PyInstaller-created temporary folder
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.join(sys._MEIPASS, filename)
+    
+    # For development (running as a .py script)
+    base_path = os.path.abspath(".")
+    return os.path.join(base_path, filename)
+
+def get_data_dir():
+    """
+    Per-user directory for persistent data (caches, etc.). Unlike resource
+    paths, this survives between runs of the packaged app.
+    """
+    return os.path.join(os.path.expanduser("~"), ".placement_tracker")
+
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate` per second
+    up to `burst`. The lock only guards the bookkeeping; callers never sleep
+    while holding it, so one slow provider cannot stall the others.
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without blocking. Returns 0 on success, otherwise the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block (outside the lock) until tokens are available. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """Like acquire(), but waits with asyncio.sleep so the event loop keeps running."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            await asyncio.sleep(wait)
+
+    def block_for(self, seconds):
+        """Stop handing out tokens for `seconds` (used for 429 / Retry-After)."""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = now
+
+    def configure(self, rate=None, burst=None):
+        """Change the rate and/or burst size of a live bucket."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if rate is not None:
+                self.rate = float(rate)
+            if burst is not None:
+                self.burst = max(1, int(burst))
+                self._tokens = min(self._tokens, self.burst)
+
+
+class ProviderRateLimiter:
+    """Holds one TokenBucket per API provider (genius, spotify, rapidapi, youtube)."""
+    def __init__(self, limits=None):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        for provider, (rate, burst) in (limits or DEFAULT_RATE_LIMITS).items():
+            self._buckets[provider] = TokenBucket(rate, burst)
+
+    def bucket(self, provider):
+        with self._lock:
+            if provider not in self._buckets:
+                rate, burst = DEFAULT_RATE_LIMITS.get(provider, (5.0, 5))
+                self._buckets[provider] = TokenBucket(rate, burst)
+            return self._buckets[provider]
+
+    def configure(self, provider, rate=None, burst=None):
+        self.bucket(provider).configure(rate, burst)
+
+    def configure_from(self, settings):
+        """Apply a mapping like {'rapidapi': {'rate': 2, 'burst': 2}} (e.g. from secret.toml)."""
+        for provider, values in (settings or {}).items():
+            if isinstance(values, dict):
+                self.configure(provider, values.get('rate'), values.get('burst'))
+
+    def try_acquire(self, provider, tokens=1):
+        return self.bucket(provider).try_acquire(tokens)
+
+    def acquire(self, provider, tokens=1, timeout=None):
+        return self.bucket(provider).acquire(tokens, timeout)
+
+    async def acquire_async(self, provider, tokens=1):
+        return await self.bucket(provider).acquire_async(tokens)
+
+    def throttle(self, provider, retry_after=None, default=1.0):
+        """Record a 429 for a provider. Returns the back-off applied, in seconds."""
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = default
+        self.bucket(provider).block_for(delay)
+        return delay
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared by every get_* function below
+rate_limiter = ProviderRateLimiter()
+
+
+def rate_limited_request(session, provider, method, url, endpoint=None, **kwargs):
+    """
+    Send a request once the provider's bucket allows it. A 429 response blocks
+    that provider's bucket for the Retry-After period and the request is retried
+    (up to MAX_THROTTLE_RETRIES times). Idempotent requests are also retried on
+    connection errors, timeouts and 502/503/504 (see http_settings). The final
+    response is returned either way (and recorded if a cassette is being
+    written); a final connection error is raised. Every attempt is counted in
+    endpoint_metrics under `endpoint` (default: the provider name).
+    """
+    kwargs.setdefault('timeout', http_settings.timeout(provider))
+    endpoint = endpoint or provider
+    routed_url = endpoint_router.route(url)
+    throttles = failures = 0
+    while True:
+        rate_limiter.acquire(provider)
+        slot = concurrency_limiter.acquire(provider)
+        started, latency, outcome, error = time.monotonic(), None, 'error', None
+        try:
+            response = session.request(method, routed_url, **kwargs)
+            latency, outcome = time.monotonic() - started, request_outcome(response.status_code)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        finally:
+            concurrency_limiter.release(slot, latency, outcome)
+        if error is not None:
+            endpoint_metrics.observe(endpoint, provider, 'error', time.monotonic() - started)
+        else:
+            # A streamed body is read by the caller, so only its declared length is known here
+            size = int(response.headers.get('Content-Length') or 0) if kwargs.get('stream') else len(response.content)
+            endpoint_metrics.observe(endpoint, provider, response.status_code, latency, size)
+
+        if http_settings.should_retry(method, failures, None if error else response.status_code):
+            endpoint_metrics.retried(endpoint, provider)
+            failures += 1
+            delay = http_settings.backoff_delay(failures)
+            print(f"{provider} request failed ({error or response.status_code}), retry {failures} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        if error is not None:
+            raise error
+        if response.status_code != 429 or throttles == MAX_THROTTLE_RETRIES:
+            if cassette_recorder.recording:
+                cassette_recorder.record(provider, method, url, kwargs.get('params'), response, latency)
+            return response
+        throttles += 1
+        endpoint_metrics.retried(endpoint, provider, throttled=True)
+        delay = rate_limiter.throttle(provider, response.headers.get('Retry-After'))
+        print(f"{provider} rate limit hit (429), backing off {delay:.1f}s")
+
+
+# --- Adaptive Concurrency ---
+# Optional AIMD control of in-flight requests per provider, on top of the token
+# buckets. A provider's limit grows by one slot per window of fast, successful
+# requests and is cut (multiplicatively) on a 429, a 5xx or connection error, or
+# when recent latency climbs well above its long-run average.
+ADAPTIVE_MAX_CONCURRENCY = 32
+# Override from an [adaptive_concurrency] table in secret.toml, globally or per provider
+DEFAULT_ADAPTIVE_SETTINGS = {'min': 1, 'max': ADAPTIVE_MAX_CONCURRENCY, 'latency_tolerance': 2.0, 'backoff': 0.5}
+
+
+def request_outcome(status_code):
+    """Classify a response for the adaptive limiter: 'ok', 'throttled' (429) or 'error' (5xx)."""
+    if status_code == 429:
+        return 'throttled'
+    if status_code >= 500:
+        return 'error'
+    return 'ok'
+
+
+class AdaptiveLimit:
+    """
+    Additive-increase/multiplicative-decrease limit on concurrent requests to one
+    provider. Latency is tracked as a fast and a slow moving average; the fast
+    one exceeding `latency_tolerance` times the slow one counts as congestion.
+    After a decrease, congestion signals from the requests that were already in
+    flight are ignored, so one overload only cuts the limit once.
+    """
+    def __init__(self, initial=10, min_limit=1, max_limit=ADAPTIVE_MAX_CONCURRENCY, latency_tolerance=2.0,
+                 backoff=0.5):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.samples = 0
+        self.decreases = 0
+        self._fast_latency = None
+        self._slow_latency = None
+        self._draining = 0  # releases left from requests sent before the last decrease
+        self._cond = threading.Condition()
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        # The limit is shared with threads, so poll instead of awaiting an asyncio primitive
+        delay = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self, latency, outcome='ok'):
+        """Return a slot and adjust the limit from the request's latency and outcome."""
+        with self._cond:
+            busy = self.in_flight >= self.limit / 2
+            self.in_flight -= 1
+            congested = outcome != 'ok'
+            if not congested and latency is not None:
+                self.samples += 1
+                if self._fast_latency is None:
+                    self._fast_latency = self._slow_latency = latency
+                self._fast_latency += 0.3 * (latency - self._fast_latency)
+                self._slow_latency += 0.02 * (latency - self._slow_latency)
+                # Below ~50ms, latency swings are noise rather than a sign of overload
+                congested = (self.samples >= 10 and
+                             self._fast_latency > self.latency_tolerance * max(self._slow_latency, 0.05))
+            if self._draining:
+                self._draining -= 1
+            elif congested:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._draining = self.in_flight
+                self.decreases += 1
+            elif busy:
+                # Only grow while the current limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight,
+                    'latency': self._fast_latency, 'decreases': self.decreases}
+
+
+class ProviderConcurrencyLimiter:
+    """
+    One AdaptiveLimit per provider. Disabled (requests are not limited) until
+    start() is called for a run in adaptive mode.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.settings = dict(DEFAULT_ADAPTIVE_SETTINGS)
+        self._provider_settings = {}
+        self._limits = {}
+        self._initial = 10
+        self._lock = threading.Lock()
+
+    def configure_from(self, settings):
+        """Apply e.g. {'max': 24, 'rapidapi': {'max': 2}} from secret.toml."""
+        for key, value in (settings or {}).items():
+            if isinstance(value, dict):
+                self._provider_settings[key] = {k: v for k, v in value.items() if k in DEFAULT_ADAPTIVE_SETTINGS}
+            elif key in DEFAULT_ADAPTIVE_SETTINGS:
+                self.settings[key] = value
+
+    def start(self, initial):
+        """Enable adaptive limits for a run, every provider starting at `initial` in-flight requests."""
+        with self._lock:
+            self._initial = initial
+            self._limits = {}
+            self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def max_concurrency(self):
+        """Highest limit any provider may reach; worker pools are sized to it."""
+        return max([self.settings['max']] + [s.get('max', 0) for s in self._provider_settings.values()])
+
+    def _limit(self, provider):
+        with self._lock:
+            if provider not in self._limits:
+                settings = dict(self.settings, **self._provider_settings.get(provider, {}))
+                self._limits[provider] = AdaptiveLimit(self._initial, settings['min'], settings['max'],
+                                                       settings['latency_tolerance'], settings['backoff'])
+            return self._limits[provider]
+
+    def acquire(self, provider):
+        """Wait for a slot. Returns a handle for release(), or None when disabled."""
+        if not self.enabled:
+            return None
+        limit = self._limit(provider)
+        limit.acquire()
+        return limit
+
+    async def acquire_async(self, provider):
+        if not self.enabled:
+            return None
+        limit = self._limit(provider)
+        await limit.acquire_async()
+        return limit
+
+    def release(self, slot, latency, outcome='ok'):
+        if slot is not None:
+            slot.release(latency, outcome)
+
+    def snapshot(self):
+        with self._lock:
+            limits = dict(self._limits)
+        return {provider: limit.snapshot() for provider, limit in sorted(limits.items())}
+
+
+def format_concurrency_limits(snapshot):
+    """One-line summary of the adaptive limits for the log."""
+    parts = []
+    for provider, s in snapshot.items():
+        latency = f", {s['latency']:.2f}s" if s['latency'] is not None else ""
+        backoffs = f", {s['decreases']} backoffs" if s['decreases'] else ""
+        parts.append(f"{provider} {s['limit']}{latency}{backoffs}")
+    return " | ".join(parts) or "no requests yet"
+
+
+concurrency_limiter = ProviderConcurrencyLimiter()
+
+
+# --- Run Statistics ---
+class StatCounter:
+    """Thread-safe named counters (e.g. how each song's Spotify track ID was found)."""
+    def __init__(self, *names):
+        self._counts = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            for name in self._counts:
+                self._counts[name] = 0
+
+
+# Where each processed song's Spotify track ID came from
+track_id_sources = StatCounter('input', 'genius_media', 'spotify_search', 'not_found')
+
+
+def format_track_id_sources(counts):
+    """One-line summary of track_id_sources for the log."""
+    return (f"{counts['input']} from input, {counts['genius_media']} from Genius media, "
+            f"{counts['spotify_search']} via Spotify search, {counts['not_found']} not found")
+
+
+# --- Endpoint Metrics ---
+# Every outbound call (each attempt, including retries) is recorded per
+# endpoint: a latency histogram, status codes, retries, 429 backoffs and bytes
+# received. Together with the response cache's hit/miss counts they are
+# written at the end of a run as JSON and in the Prometheus text format.
+# Upper bounds (seconds) of the latency histogram buckets; a final +Inf bucket is implied
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PREFIX = 'placement_tracker'
+
+
+def histogram_quantile(q, counts):
+    """Estimate quantile `q` from per-bucket counts (interpolating inside the bucket, like Prometheus)."""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+            if i == len(LATENCY_BUCKETS):
+                return lower  # beyond the last bound; report the bound
+            return lower + (LATENCY_BUCKETS[i] - lower) * (rank - seen) / count
+        seen += count
+    return LATENCY_BUCKETS[-1]
+
+
+class EndpointMetrics:
+    """Thread-safe per-endpoint request counters and latency histograms."""
+    def __init__(self):
+        self.textfile = None
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def configure(self, settings):
+        """Apply a [metrics] table from secret.toml: textfile = path also written for a Prometheus textfile collector."""
+        textfile = (settings or {}).get('textfile')
+        self.textfile = os.path.expanduser(textfile) if textfile else None
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def _entry(self, endpoint, provider):
+        entry = self._endpoints.get(endpoint)
+        if entry is None:
+            entry = self._endpoints[endpoint] = {
+                'provider': provider, 'statuses': {}, 'retries': 0, 'throttled': 0, 'bytes': 0,
+                'latency_sum': 0.0, 'latency_max': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            }
+        return entry
+
+    def observe(self, endpoint, provider, status, latency, size=0):
+        """Record one attempt; `status` is the HTTP status code or 'error' for a connection failure."""
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            entry = self._entry(endpoint, provider)
+            entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+            entry['bytes'] += size
+            entry['latency_sum'] += latency
+            entry['latency_max'] = max(entry['latency_max'], latency)
+            entry['buckets'][bucket] += 1
+
+    def retried(self, endpoint, provider, throttled=False):
+        """Count a retry after an error or 5xx, or (`throttled`) a backoff after a 429."""
+        with self._lock:
+            self._entry(endpoint, provider)['throttled' if throttled else 'retries'] += 1
+
+    def snapshot(self, cache_stats=None):
+        """
+        {endpoint: metrics} for the run so far. Pass response_cache.stats() to
+        include cache hits and misses (endpoints answered only from the cache appear too).
+        """
+        with self._lock:
+            raw = {endpoint: dict(entry, statuses=dict(entry['statuses']), buckets=list(entry['buckets']))
+                   for endpoint, entry in self._endpoints.items()}
+        cache = (cache_stats or {}).get('endpoints', {})
+        summary = {}
+        for endpoint in sorted(set(raw) | set(cache)):
+            entry = raw.get(endpoint) or {'provider': None, 'statuses': {}, 'retries': 0, 'throttled': 0,
+                                          'bytes': 0, 'latency_sum': 0.0, 'latency_max': 0.0,
+                                          'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+            requests_sent = sum(entry['buckets'])
+            cumulative, running = {}, 0
+            for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], entry['buckets']):
+                running += count
+                cumulative[bound] = running
+            summary[endpoint] = {
+                'provider': entry['provider'],
+                'requests': requests_sent,
+                'errors': sum(n for status, n in entry['statuses'].items()
+                              if status == 'error' or int(status) >= 400),
+                'statuses': entry['statuses'],
+                'retries': entry['retries'],
+                'throttled': entry['throttled'],
+                'bytes': entry['bytes'],
+                'latency': {
+                    'sum': round(entry['latency_sum'], 4),
+                    'avg': round(entry['latency_sum'] / requests_sent, 4) if requests_sent else None,
+                    'max': round(entry['latency_max'], 4),
+                    'p50': _quantile(0.5, entry),
+                    'p95': _quantile(0.95, entry),
+                    'p99': _quantile(0.99, entry),
+                    'buckets': cumulative,
+                },
+                'cache_hits': cache.get(endpoint, {}).get('hits', 0),
+                'cache_misses': cache.get(endpoint, {}).get('misses', 0),
+            }
+        return summary
+
+
+def _quantile(q, entry):
+    # Interpolation can overshoot inside the top bucket; never report more than the slowest request
+    value = histogram_quantile(q, entry['buckets'])
+    return None if value is None else round(min(value, entry['latency_max']), 4)
+
+
+def format_endpoint_metrics(snapshot):
+    """One log line per endpoint."""
+    lines = []
+    for endpoint, m in snapshot.items():
+        latency = m['latency']
+        timing = f"p50 {latency['p50'] * 1000:.0f}ms, p95 {latency['p95'] * 1000:.0f}ms" if m['requests'] else "no requests"
+        cache = m['cache_hits'] + m['cache_misses']
+        cached = f", cache {m['cache_hits']}/{cache} hits" if cache else ""
+        lines.append(f"{endpoint}: {m['requests']} requests ({timing}), {m['errors']} errors, "
+                     f"{m['retries']} retries, {m['throttled']} throttled, "
+                     f"{m['bytes'] / 1024:.0f} KB{cached}")
+    return lines
+
+
+def prometheus_metrics(snapshot):
+    """The snapshot in the Prometheus text exposition format."""
+    def labels(**values):
+        return '{' + ','.join(f'{k}="{v}"' for k, v in values.items() if v is not None) + '}'
+
+    families = [
+        ('requests_total', 'counter', "Outbound API requests (each attempt) by status."),
+        ('retries_total', 'counter', "Requests retried after a connection error, timeout or 5xx."),
+        ('throttled_total', 'counter', "Backoffs after a 429 response."),
+        ('response_bytes_total', 'counter', "Response bytes received."),
+        ('cache_requests_total', 'counter', "Response cache lookups by result."),
+        ('request_duration_seconds', 'histogram', "Outbound API request latency."),
+    ]
+    samples = {name: [] for name, _, _ in families}
+    for endpoint, m in snapshot.items():
+        base = dict(endpoint=endpoint, provider=m['provider'])
+        for status, count in sorted(m['statuses'].items()):
+            samples['requests_total'].append(('', labels(**base, status=status), count))
+        samples['retries_total'].append(('', labels(**base), m['retries']))
+        samples['throttled_total'].append(('', labels(**base), m['throttled']))
+        samples['response_bytes_total'].append(('', labels(**base), m['bytes']))
+        samples['cache_requests_total'].append(('', labels(endpoint=endpoint, result='hit'), m['cache_hits']))
+        samples['cache_requests_total'].append(('', labels(endpoint=endpoint, result='miss'), m['cache_misses']))
+        for bound, count in m['latency']['buckets'].items():
+            samples['request_duration_seconds'].append(('_bucket', labels(**base, le=bound), count))
+        samples['request_duration_seconds'].append(('_sum', labels(**base), m['latency']['sum']))
+        samples['request_duration_seconds'].append(('_count', labels(**base), m['requests']))
+
+    lines = []
+    for name, kind, help_text in families:
+        metric = f"{METRICS_PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f"{metric}{suffix}{label_text} {value}" for suffix, label_text, value in samples[name])
+    return "\n".join(lines) + "\n"
+
+
+def metrics_paths(save_dir, file_name):
+    """Paths of the JSON and Prometheus metrics files written next to a run's CSVs."""
+    return (os.path.join(save_dir, f"{file_name} - Metrics.json"),
+            os.path.join(save_dir, f"{file_name} - Metrics.prom"))
+
+
+def write_metrics(snapshot, json_path, prom_path, textfile=None):
+    """Write the end-of-run JSON summary and Prometheus file (plus `textfile`, replaced atomically)."""
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'generated': time.strftime('%Y-%m-%dT%H:%M:%S'), 'endpoints': snapshot}, f, indent=2)
+    text = prometheus_metrics(snapshot)
+    with open(prom_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    if textfile:
+        os.makedirs(os.path.dirname(os.path.abspath(textfile)), exist_ok=True)
+        with open(textfile + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(textfile + '.tmp', textfile)
+
+
+endpoint_metrics = EndpointMetrics()
+
+
+# --- HTTP Transport ---
+# One long-lived requests.Session per process keeps connections alive across
+# runs. Its per-host pools are sized to the run's concurrency, so worker threads
+# never wait for (or throw away) connections. Requests and newly opened
+# connections are counted to show how well connections are reused.
+POOL_HOSTS = 16  # distinct hosts to keep pools for (Genius, Spotify, RapidAPI, Google...)
+
+# Requests sent and TCP/TLS connections opened during the current run
+transport_stats = StatCounter('requests', 'connections', 'retries')
+
+
+class HttpSettings:
+    """Timeouts and retry/backoff policy shared by the sync and async request paths."""
+    def __init__(self):
+        self.configure(None)
+
+    def configure(self, settings):
+        """Apply an [http] table from secret.toml over the defaults."""
+        settings = settings or {}
+        self.timeouts = dict(DEFAULT_HTTP_SETTINGS['timeouts'], **settings.get('timeouts', {}))
+        self.retries = int(settings.get('retries', DEFAULT_HTTP_SETTINGS['retries']))
+        self.backoff = float(settings.get('backoff', DEFAULT_HTTP_SETTINGS['backoff']))
+        self.backoff_max = float(settings.get('backoff_max', DEFAULT_HTTP_SETTINGS['backoff_max']))
+
+    def timeout(self, provider):
+        return self.timeouts.get(provider, 10)
+
+    def should_retry(self, method, failures, status_code=None):
+        """Whether to retry after a connection error (status_code None) or an error status."""
+        if method.upper() not in IDEMPOTENT_METHODS or failures >= self.retries:
+            return False
+        return status_code is None or status_code in RETRY_STATUSES
+
+    def backoff_delay(self, attempt):
+        """'Equal jitter' exponential backoff: half fixed, half random, so retries spread out."""
+        transport_stats.increment('retries')
+        cap = min(self.backoff_max, self.backoff * 2 ** (attempt - 1))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+
+http_settings = HttpSettings()
+
+
+class _CountingConnectionMixin:
+    # A pooled connection object reconnects its socket if the server closed it,
+    # so count socket connects rather than connection objects
+    def connect(self):
+        transport_stats.increment('connections')
+        return super().connect()
+
+
+class _CountingHTTPConnection(_CountingConnectionMixin, HTTPConnection):
+    pass
+
+
+class _CountingHTTPSConnection(_CountingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools count requests and newly opened connections."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _CountingHTTPConnectionPool,
+                                                   'https': _CountingHTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        transport_stats.increment('requests')
+        return super().send(request, **kwargs)
+
+
+def make_session(pool_size=10):
+    """A requests.Session keeping up to `pool_size` connections alive per host."""
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=max(1, int(pool_size)))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_shared_session = None
+_shared_pool_size = 0
+_shared_session_lock = threading.Lock()
+
+
+def shared_session(pool_size=10):
+    """
+    The process-wide session, so keep-alive connections carry over between runs.
+    It is replaced by a larger one if a run needs more connections per host.
+    """
+    global _shared_session, _shared_pool_size
+    with _shared_session_lock:
+        if _shared_session is None or pool_size > _shared_pool_size:
+            if _shared_session is not None:
+                _shared_session.close()
+            _shared_session = make_session(pool_size)
+            _shared_pool_size = pool_size
+        return _shared_session
+
+
+def format_transport_stats(counts):
+    """One-line summary of transport_stats for the log."""
+    requests_sent, opened = counts['requests'], counts['connections']
+    reused = 1 - opened / requests_sent if requests_sent else 0.0
+    return (f"{requests_sent} requests over {opened} new connections ({max(reused, 0.0):.0%} reused), "
+            f"{counts['retries']} retries")
+
+
+# --- Endpoint Routing & Cassettes ---
+# For offline, repeatable runs every provider request can be routed to one
+# local server (see mock_providers.py) instead of the real hosts, and the
+# responses of a real run can be recorded to a cassette for that server to
+# replay. Each real host is mapped to a path prefix on the local server.
+PROVIDER_HOSTS = {
+    'https://api.genius.com': '/genius-api',
+    'https://genius.com': '/genius-web',
+    'https://accounts.spotify.com': '/spotify-accounts',
+    'https://api.spotify.com': '/spotify-api',
+    'https://spotify-stream-count.p.rapidapi.com': '/rapidapi',
+    'https://www.googleapis.com': '/googleapis',
+}
+# Query parameters and JSON body fields that carry credentials; never written to a cassette
+SECRET_QUERY_PARAMS = {'key', 'access_token', 'api_key'}
+SECRET_BODY_FIELDS = {'access_token', 'refresh_token'}
+
+
+def cassette_key(method, url, params=None):
+    """
+    Identity of a request in a cassette: the method, the real URL and the sorted
+    query (from the URL and `params`) without credentials. Shared with
+    mock_providers.py so recorded responses are found again on replay.
+    """
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    query += [(k, str(v)) for k, v in (params or {}).items() if v is not None]
+    query = sorted((k, v) for k, v in query if k not in SECRET_QUERY_PARAMS)
+    return f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{urllib.parse.urlencode(query)}"
+
+
+class EndpointRouter:
+    """Rewrites provider URLs onto a local base URL while one is configured."""
+    def __init__(self):
+        self.base_url = None
+
+    def configure(self, base_url):
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def route(self, url):
+        if not self.base_url:
+            return url
+        for host, prefix in PROVIDER_HOSTS.items():
+            if url == host or url.startswith(host + '/'):
+                return self.base_url + prefix + url[len(host):]
+        return url
+
+
+class CassetteRecorder:
+    """Appends the final response of every provider request to a JSON Lines file."""
+    def __init__(self):
+        self.path = None
+        self.count = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self):
+        return self._file is not None
+
+    def start(self, path):
+        self.stop()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def stop(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def redact(body):
+        """Blank out tokens in a JSON object body (e.g. the Spotify token response)."""
+        if not body.startswith('{'):
+            return body
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        if not SECRET_BODY_FIELDS.intersection(data):
+            return body
+        return json.dumps({k: 'redacted' if k in SECRET_BODY_FIELDS else v for k, v in data.items()})
+
+    def record(self, provider, method, url, params, response, latency):
+        """Store one response; headers other than Content-Type and Retry-After are dropped."""
+        entry = {
+            'key': cassette_key(method, url, params),
+            'provider': provider,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type'),
+            'retry_after': response.headers.get('Retry-After'),
+            'latency': round(latency or 0.0, 4),
+            'body': self.redact(response.content.decode('utf-8', 'replace')),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self._file.flush()
+                self.count += 1
+
+
+endpoint_router = EndpointRouter()
+cassette_recorder = CassetteRecorder()
+
+
+# --- Response Cache ---
+class ResponseCache:
+    """
+    Persistent SQLite cache for API responses, keyed by endpoint name plus the
+    normalized request parameters. Each endpoint has its own TTL, the file is
+    kept under `max_bytes` by evicting least-recently-used entries, and hits and
+    misses are counted per endpoint. A hit only notes its access time in memory;
+    the times are written in batches (see flush()) so reads never commit.
+    """
+    ACCESS_FLUSH_EVERY = 500  # Hits between batched writes of their access times
+
+    def __init__(self, path, ttls=None, max_bytes=DEFAULT_CACHE_MAX_BYTES, enabled=True):
+        self.path = path
+        self.ttls = dict(DEFAULT_CACHE_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = {}
+        self.misses = {}
+        self._conn = None
+        self._total_bytes = 0
+        self._accessed = {}  # key -> last hit time not yet written
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Opened lazily so importing the module never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+            self._conn.commit()
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """Stable key for an endpoint and its parameters (None values are ignored)."""
+        if isinstance(params, dict):
+            params = {k: v for k, v in params.items() if v is not None}
+        canonical = json.dumps([endpoint, params], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def configure(self, settings):
+        """Apply a [cache] table from secret.toml: enabled, path, max_mb, ttl = {endpoint = seconds}."""
+        settings = settings or {}
+        with self._lock:
+            if 'enabled' in settings:
+                self.enabled = bool(settings['enabled'])
+            path = os.path.expanduser(settings['path']) if settings.get('path') else None
+            if path and path != self.path:
+                if self._conn is not None:
+                    self._write_accessed()
+                    self._conn.commit()
+                    self._conn.close()
+                    self._conn = None
+                self.path = path
+            if settings.get('max_mb'):
+                self.max_bytes = int(float(settings['max_mb']) * 1024 * 1024)
+            self.ttls.update(settings.get('ttl') or {})
+
+    def get(self, endpoint, params):
+        """Return the cached value, or None if missing, expired or caching is off."""
+        if not self.enabled or self.ttls.get(endpoint, 0) <= 0:
+            return None
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT value, created, size FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] <= self.ttls[endpoint]:
+                    self._accessed[key] = now
+                    if len(self._accessed) >= self.ACCESS_FLUSH_EVERY:
+                        self._write_accessed()
+                        conn.commit()
+                    self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+                    return json.loads(row[0])
+                if row:
+                    self._accessed.pop(key, None)
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                    self._total_bytes -= row[2]
+            except (sqlite3.Error, ValueError) as e:
+                print(f"Response cache read failed for {endpoint}: {e}")
+            self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+            return None
+
+    def set(self, endpoint, params, value):
+        """Store a JSON-serializable value, evicting LRU entries if over max_bytes."""
+        if not self.enabled or self.ttls.get(endpoint, 0) <= 0 or value is None:
+            return
+        key = self.make_key(endpoint, params)
+        encoded = json.dumps(value, separators=(',', ':'))
+        size = len(encoded)
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connect()
+                self._accessed.pop(key, None)
+                old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, endpoint, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, endpoint, encoded, size, now, now)
+                )
+                self._total_bytes += size - (old[0] if old else 0)
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Response cache write failed for {endpoint}: {e}")
+
+    def _write_accessed(self):
+        # Caller holds self._lock and commits
+        if self._accessed:
+            self._conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed = {}
+
+    def flush(self):
+        """Write the access times of recent hits (e.g. at the end of a run)."""
+        with self._lock:
+            if not self._accessed or self._conn is None:
+                return
+            try:
+                self._write_accessed()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Response cache write failed: {e}")
+
+    def _evict(self):
+        """Drop least-recently-used entries until the cache is back under 90% of max_bytes."""
+        target = self.max_bytes * 0.9
+        conn = self._conn
+        self._write_accessed()  # So recent hits count as recently used
+        while self._total_bytes > target:
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 200").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            conn.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k, _ in rows])
+            self._total_bytes -= sum(size for _, size in rows)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+            self._total_bytes = 0
+            self._accessed = {}
+
+    def stats(self):
+        """Hit/miss counters per endpoint plus totals."""
+        with self._lock:
+            endpoints = sorted(set(self.hits) | set(self.misses))
+            per_endpoint = {e: {'hits': self.hits.get(e, 0), 'misses': self.misses.get(e, 0)} for e in endpoints}
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'bytes': self._total_bytes,
+                'endpoints': per_endpoint,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+
+
+def format_cache_stats(stats):
+    """One-line summary of cache counters for the log."""
+    return (f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+            f"{stats['bytes'] / (1024 * 1024):.1f} MB on disk")
+
+
+# Shared by every get_* function below
+response_cache = ResponseCache(os.path.join(get_data_dir(), 'response_cache.sqlite3'))
+
+
+def cached_api_json(session, endpoint, cache_params, provider, url, fresh=False, **kwargs):
+    """
+    GET a JSON endpoint through the response cache and the provider's rate limiter.
+    With `fresh`, a cached response is not used (the new one is still cached).
+    """
+    cached = None if fresh else response_cache.get(endpoint, cache_params)
+    if cached is not None:
+        return cached
+    response = rate_limited_request(session, provider, 'GET', url, endpoint=endpoint, **kwargs)
+    response.raise_for_status()
+    data = response.json()
+    response_cache.set(endpoint, cache_params, data)
+    return data
+
+
+# --- Google Sheets Integration ---
+def get_google_sheets_credentials():
+    """Get or refresh Google Sheets API credentials."""
+    creds = None
+    token_path = get_resource_path('token.pickle')
+    credentials_path = get_resource_path('credentials.json')
+
+    if os.path.exists(token_path):
+        try:
+            with open(token_path, 'rb') as token:
+                creds = pickle.load(token)
+        except (pickle.UnpicklingError, EOFError, FileNotFoundError) as e:
+            print(f"Could not load token.pickle: {e}. It will be regenerated.")
+            if os.path.exists(token_path):
+                os.remove(token_path)
+            creds = None
+
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                print(f"Error refreshing credentials: {e}")
+                creds = None
+        
+        if not creds:
+            if not os.path.exists(credentials_path):
+                print("Google Sheets Error: credentials.json not found. Please place it in the application directory.")
+                return None
+            
+            try:
+                flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
+                creds = flow.run_local_server(port=0)
+            except Exception as e:
+                print(f"Google Sheets Auth Error: Failed to authenticate: {e}")
+                return None
+        
+        try:
+            with open(token_path, 'wb') as token:
+                pickle.dump(creds, token)
+        except IOError as e:
+            print(f"Error saving new token: {e}")
+    return creds
+
+class SheetsService:
+    """Google Sheets credentials and discovery service, built once per process instead of per upload."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._creds = None
+        self._service = None
+        self.configure(None)
+
+    def configure(self, settings):
+        """Apply a [sheets] table from secret.toml: mode = "incremental" (default) or "replace"."""
+        mode = (settings or {}).get('mode', 'incremental')
+        if mode not in SHEETS_SYNC_MODES:
+            raise ValueError(f"[sheets] mode must be one of {', '.join(SHEETS_SYNC_MODES)}, not {mode!r}")
+        self.mode = mode
+
+    def get(self):
+        """Return the cached service, reloading the credentials only if they stopped being valid."""
+        with self._lock:
+            if self._service is None or not self._creds.valid:
+                creds = get_google_sheets_credentials()
+                if not creds:
+                    return None
+                self._creds = creds
+                self._service = build('sheets', 'v4', credentials=creds)
+            return self._service
+
+
+sheets_service = SheetsService()
+
+
+def sheet_column(number):
+    """1-based column number -> A1 column letters (1 -> 'A', 27 -> 'AA')."""
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def sheet_range(sheet_name, first_row=None, first_col=1, last_row=None, last_col=None):
+    """A1 notation for a whole tab, or for the block from (first_row, first_col) to (last_row, last_col)."""
+    quoted = "'" + sheet_name.replace("'", "''") + "'"
+    if first_row is None:
+        return quoted
+    return (f"{quoted}!{sheet_column(first_col)}{first_row}"
+            f":{sheet_column(last_col or first_col)}{last_row or first_row}")
+
+def _sheet_cell(value):
+    # Values are written RAW and read back unformatted, so a number may come back as 12.0 and an
+    # empty cell as a missing entry; compare their text
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def _consecutive_runs(indexes):
+    """[0, 1, 2, 5, 6] -> [[0, 2], [5, 6]]"""
+    runs = []
+    for index in indexes:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return runs
+
+def diff_sheet_rows(sheet_name, existing, table, key=SHEETS_KEY_COLUMN):
+    """
+    Compare `table` (a header row, then one list of cells per row) with a tab's current values
+    and return (value ranges to write, rows needed, columns needed, summary). Rows are matched on `key`:
+    only the cells that differ are written, and rows not on the sheet yet are appended below.
+    Rows that are only on the sheet are kept. If the header changed or lacks `key`, the whole
+    tab is rewritten and any old cells outside the new table are blanked.
+    """
+    headers, new_values = list(table[0]), table[1:]
+    old_width = max((len(existing_row) for existing_row in existing), default=0)
+
+    if not existing or [_sheet_cell(cell) for cell in existing[0]] != headers or key not in headers:
+        width = max(len(headers), old_width)
+        height = max(len(new_values) + 1, len(existing))
+        grid = [headers] + new_values
+        grid = [list(values) + [''] * (width - len(values)) for values in grid]
+        grid += [[''] * width for _ in range(height - len(grid))]
+        summary = {'rewritten': True, 'rows': len(new_values), 'cells': 0, 'appended': 0}
+        return [{'range': sheet_range(sheet_name, 1, 1, height, width), 'values': grid}], height, width, summary
+
+    key_index = headers.index(key)
+    positions = {}
+    for number, existing_row in enumerate(existing[1:], start=2):
+        if len(existing_row) > key_index:
+            positions.setdefault(_sheet_cell(existing_row[key_index]), []).append(number)
+
+    data, appended, cells = [], [], 0
+    for values in new_values:
+        # Duplicate keys pair up with the sheet's duplicates in order
+        matches = positions.get(_sheet_cell(values[key_index]))
+        if not matches:
+            appended.append(values)
+            continue
+        number = matches.pop(0)
+        current = existing[number - 1]
+        changed = [col for col, value in enumerate(values)
+                   if _sheet_cell(value) != _sheet_cell(current[col] if col < len(current) else '')]
+        for first, last in _consecutive_runs(changed):
+            data.append({'range': sheet_range(sheet_name, number, first + 1, number, last + 1),
+                         'values': [values[first:last + 1]]})
+        cells += len(changed)
+
+    height = len(existing) + len(appended)
+    if appended:
+        data.append({'range': sheet_range(sheet_name, len(existing) + 1, 1, height, len(headers)),
+                     'values': appended})
+    summary = {'rewritten': False, 'rows': len(new_values), 'cells': cells, 'appended': len(appended)}
+    return data, height, max(len(headers), old_width), summary
+
+def sync_sheets(spreadsheet_id, tabs, metrics=None):
+    """
+    Incrementally write several tabs ({sheet name: table}, a table being a header row
+    followed by rows of cells) with one metadata read, one
+    values.batchGet, at most one batchUpdate (new tabs, grid growth) and one values.batchUpdate.
+    Returns {sheet name: summary} for the tabs that had rows, or None on failure.
+    Requests are measured in `metrics` (default endpoint_metrics).
+    """
+    for sheet_name in [name for name, table in tabs.items() if len(table) < 2]:
+        print(f"No data provided for sheet: {sheet_name}. Skipping update.")
+    tabs = {name: table for name, table in tabs.items() if len(table) >= 2}
+    if not tabs:
+        return {}
+    try:
+        service = sheets_service.get()
+        if not service:
+            print("Failed to get Google Sheets credentials")
+            return None
+        spreadsheets = service.spreadsheets()
+
+        sheet_metadata = execute_sheets_request('sheets_get', spreadsheets.get(
+            spreadsheetId=spreadsheet_id,
+            fields='sheets.properties(sheetId,title,gridProperties)'
+        ), metrics)
+        properties = {s['properties']['title']: s['properties'] for s in sheet_metadata.get('sheets', [])}
+
+        present = [name for name in tabs if name in properties]
+        existing = {}
+        if present:
+            result = execute_sheets_request('sheets_batch_get', spreadsheets.values().batchGet(
+                spreadsheetId=spreadsheet_id,
+                ranges=[sheet_range(name) for name in present],
+                valueRenderOption='UNFORMATTED_VALUE'
+            ), metrics)
+            for name, value_range in zip(present, result.get('valueRanges', [])):
+                existing[name] = value_range.get('values', [])
+
+        data, layout, summaries = [], [], {}
+        for name, table in tabs.items():
+            ranges, height, width, summaries[name] = diff_sheet_rows(name, existing.get(name, []), table)
+            data.extend(ranges)
+            if name not in properties:
+                layout.append({'addSheet': {'properties': {
+                    'title': name,
+                    'gridProperties': {'rowCount': max(height, 1000), 'columnCount': max(width, 26)}
+                }}})
+                continue
+            # Values can't be written outside a tab's grid, so grow it first
+            grid = properties[name].get('gridProperties', {})
+            if height > grid.get('rowCount', 0) or width > grid.get('columnCount', 0):
+                layout.append({'updateSheetProperties': {
+                    'properties': {
+                        'sheetId': properties[name]['sheetId'],
+                        'gridProperties': {'rowCount': max(height, grid.get('rowCount', 0)),
+                                           'columnCount': max(width, grid.get('columnCount', 0))}
+                    },
+                    'fields': 'gridProperties.rowCount,gridProperties.columnCount'
+                }})
+
+        if layout:
+            execute_sheets_request('sheets_batch_update', spreadsheets.batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'requests': layout}
+            ), metrics)
+        if data:
+            execute_sheets_request('sheets_values_batch_update', spreadsheets.values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': 'RAW', 'data': data}
+            ), metrics)
+        return summaries
+
+    except Exception as e:
+        print(f"Error syncing Google Sheets: {e}")
+        return None
+
+def execute_sheets_request(endpoint, request, metrics=None):
+    """Execute a Sheets API request, recording it in `metrics` (default endpoint_metrics) like the HTTP API calls."""
+    metrics = endpoint_metrics if metrics is None else metrics
+    started = time.monotonic()
+    try:
+        result = request.execute()
+    except Exception as e:
+        # googleapiclient's HttpError carries the response status
+        status = getattr(getattr(e, 'resp', None), 'status', None) or 'error'
+        metrics.observe(endpoint, 'sheets', status, time.monotonic() - started)
+        raise
+    metrics.observe(endpoint, 'sheets', 200, time.monotonic() - started, len(json.dumps(result or {})))
+    return result
+
+def create_or_update_sheet(spreadsheet_id, sheet_name, table, metrics=None):
+    """
+    Create or update a Google Sheet with `table` (a header row, then rows of cells),
+    replacing everything on it ([sheets] mode = "replace").
+    """
+    if len(table) < 2:
+        print(f"No data provided for sheet: {sheet_name}. Skipping update.")
+        return False
+    try:
+        service = sheets_service.get()
+        if not service:
+            print("Failed to get Google Sheets credentials")
+            return False
+
+        body = {'values': [list(values) for values in table]}
+        
+        # Check if the sheet exists
+        sheet_metadata = execute_sheets_request('sheets_get', service.spreadsheets().get(spreadsheetId=spreadsheet_id), metrics)
+        sheets = sheet_metadata.get('sheets', '')
+        sheet_exists = any(s['properties']['title'] == sheet_name for s in sheets)
+
+        if not sheet_exists:
+            # Create the sheet if it doesn't exist
+            add_sheet_request = {'addSheet': {'properties': {'title': sheet_name}}}
+            execute_sheets_request('sheets_add_sheet', service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'requests': [add_sheet_request]}
+            ), metrics)
+
+        # Clear existing data before writing new data
+        execute_sheets_request('sheets_clear', service.spreadsheets().values().clear(
+            spreadsheetId=spreadsheet_id,
+            range=f"'{sheet_name}'"
+        ), metrics)
+
+        # Update the sheet with new data
+        execute_sheets_request('sheets_update', service.spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id,
+            range=f"'{sheet_name}'!A1",
+            valueInputOption='RAW',
+            body=body
+        ), metrics)
+        
+        print(f"Successfully updated Google Sheet: {sheet_name}")
+        return True
+        
+    except Exception as e:
+        print(f"Error updating Google Sheet: {e}")
+        return False
+
+
+# --- Core Application Logic (API Calls & Scraping) ---
+def get_spotify_access_token(session, client_id, client_secret):
+    """Get the access token for the Spotify API using a session object."""
+    try:
+        url = "https://accounts.spotify.com/api/token"
+        auth_str = f"{client_id}:{client_secret}"
+        b64_auth = base64.b64encode(auth_str.encode()).decode()
+        
+        headers = {"Authorization": f"Basic {b64_auth}"}
+        data = {"grant_type": "client_credentials"}
+        
+        response = rate_limited_request(session, 'spotify', 'POST', url, endpoint='spotify_token', headers=headers, data=data)
+        response.raise_for_status()
+        return response.json().get("access_token")
+    except requests.RequestException as e:
+        print(f"Failed to get Spotify access token: {e}")
+        raise Exception("Could not get Spotify access token.") from e
+
+def parse_genius_song(song_data):
+    """Turn a Genius song payload into the credits dict used throughout the app."""
+    custom_performances = song_data.get('custom_performances', [])
+    label_data = next((item for item in custom_performances if item.get('label') == 'Label'), None)
+    copyright_data = next((item for item in custom_performances if item.get('label') == 'Copyright ©'), None)
+    phono_copyright_data = next((item for item in custom_performances if item.get('label') == 'Phonographic Copyright ℗'), None)
+
+    youtube_url = next((media.get('url') for media in song_data.get('media', []) if media.get('provider') == 'youtube'), None)
+    spotify_track_id = next(filter(None, (spotify_track_id_from_media(media) for media in song_data.get('media', [])
+                                          if media.get('provider') == 'spotify')), None)
+    producer_artists = song_data.get('producer_artists', [])
+    
+    return {
+        "song_name": song_data.get('title'),
+        "artist_name": song_data.get('primary_artist', {}).get('name'),
+        "co-producers": ", ".join(p.get('name') for p in producer_artists) if producer_artists else None,
+        "label": " & ".join(a.get('name') for a in label_data['artists']) if label_data else None,
+        "copyright": " & ".join(a.get('name') for a in copyright_data['artists']) if copyright_data else None,
+        "phonographic_copyright": " & ".join(a.get('name') for a in phono_copyright_data['artists']) if phono_copyright_data else None,
+        "youtube_url": youtube_url,
+        "spotify_track_id": spotify_track_id,
+        "genius_song_id": song_data.get('id'),
+    }
+
+def spotify_track_id_from_media(media):
+    """Track ID from a Genius media entry ('spotify:track:<id>' URI or open.spotify.com URL), or None."""
+    native_uri = media.get('native_uri') or ''
+    if native_uri.startswith('spotify:track:'):
+        candidate = native_uri.split(':')[2]
+    else:
+        path = urllib.parse.urlparse(media.get('url') or '').path
+        candidate = path.split('/track/')[1].split('/')[0] if '/track/' in path else None
+    if candidate and SPOTIFY_TRACK_ID_RE.match(candidate):
+        return candidate
+    return None
+
+def genius_song_request(song_id, access_token):
+    """URL and headers for Genius's internal song endpoint."""
+    url = f"https://genius.com/api/songs/{song_id}"
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Accept": "application/json",
+        "Authorization": f"Bearer {access_token}"
+    }
+    return url, headers
+
+def get_genius_song_credits_from_api(session, song_id, access_token):
+    """Get song credits using Genius's internal API from a song ID."""
+    if not song_id:
+        return {}
+        
+    url, headers = genius_song_request(song_id, access_token)
+    try:
+        data = cached_api_json(session, 'genius_song', {'song_id': str(song_id)}, 'genius', url, headers=headers)
+        return parse_genius_song(data.get('response', {}).get('song', {}))
+    except requests.RequestException as e:
+        print(f"Genius API request failed for song ID {song_id}: {e}")
+        return {} # Return empty dict on failure
+
+def extract_youtube_video_id(video_url):
+    """
+    Pull the 11-character video ID out of a YouTube URL. Handles youtu.be links,
+    watch?v=, /shorts/, /embed/, /v/ and /live/ paths on any youtube.com host.
+    Returns None if no ID can be found.
+    """
+    if not video_url:
+        return None
+    parsed = urllib.parse.urlparse(video_url.strip())
+    if not parsed.netloc:
+        # Tolerate scheme-less URLs like "youtu.be/abc"
+        parsed = urllib.parse.urlparse("https://" + video_url.strip())
+    host = parsed.netloc.lower().split(':')[0]
+    path_parts = [part for part in parsed.path.split('/') if part]
+    candidate = None
+    if host.endswith('youtu.be'):
+        candidate = path_parts[0] if path_parts else None
+    elif 'youtube' in host:
+        query = urllib.parse.parse_qs(parsed.query)
+        if query.get('v'):
+            candidate = query['v'][0]
+        elif len(path_parts) >= 2 and path_parts[0] in ('shorts', 'embed', 'v', 'live', 'e'):
+            candidate = path_parts[1]
+    if candidate and YOUTUBE_VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+def youtube_statistics_url(video_ids, api_key):
+    """Videos endpoint URL for up to YOUTUBE_BATCH_SIZE comma-separated IDs."""
+    return f"https://www.googleapis.com/youtube/v3/videos?part=statistics&id={','.join(video_ids)}&key={api_key}"
+
+def parse_youtube_views(data):
+    """View count from a videos?part=statistics payload for a single video, or None."""
+    items = data.get('items', [])
+    if items:
+        try:
+            return int(items[0]['statistics']['viewCount'])
+        except (KeyError, ValueError, TypeError):
+            return None
+    return None
+
+def _youtube_cached_views(video_ids, fresh=False):
+    """Split IDs into ({id: views} already cached, [ids still to fetch]). With `fresh`, every ID is fetched."""
+    if fresh:
+        return {}, list(dict.fromkeys(video_ids))
+    views, to_fetch = {}, []
+    for video_id in dict.fromkeys(video_ids):
+        cached = response_cache.get('youtube_stats', {'video_id': video_id})
+        if cached is not None:
+            views[video_id] = parse_youtube_views(cached)
+        else:
+            to_fetch.append(video_id)
+    return views, to_fetch
+
+def _youtube_store_batch(chunk, items, views):
+    """Fan a batched response back out per video, caching each one on its own."""
+    by_id = {item.get('id'): item for item in items}
+    for video_id in chunk:
+        payload = {'items': [by_id[video_id]] if video_id in by_id else []}
+        response_cache.set('youtube_stats', {'video_id': video_id}, payload)
+        views[video_id] = parse_youtube_views(payload)
+
+def get_youtube_view_counts(session, video_urls, api_key, fresh=False):
+    """
+    Get view counts for many YouTube URLs at once. IDs are requested 50 per call
+    (the same quota cost as one). Returns {video_url: views or None}.
+    With `fresh`, cached counts are not used (the new ones are still cached).
+    """
+    url_to_id = {url: extract_youtube_video_id(url) for url in video_urls if url}
+    if not api_key:
+        return {url: None for url in url_to_id}
+    views, to_fetch = _youtube_cached_views((video_id for video_id in url_to_id.values() if video_id), fresh)
+    for start in range(0, len(to_fetch), YOUTUBE_BATCH_SIZE):
+        chunk = to_fetch[start:start + YOUTUBE_BATCH_SIZE]
+        try:
+            response = rate_limited_request(session, 'youtube', 'GET', youtube_statistics_url(chunk, api_key),
+                                            endpoint='youtube_stats')
+            response.raise_for_status()
+            _youtube_store_batch(chunk, response.json().get('items', []), views)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Failed to get YouTube views for {len(chunk)} videos: {e}")
+    return {url: views.get(video_id) if video_id else None for url, video_id in url_to_id.items()}
+
+def get_youtube_view_count(session, video_url, api_key, fresh=False):
+    """Get view count for a YouTube video using the YouTube Data API."""
+    if not video_url or not api_key:
+        return None
+    video_id = extract_youtube_video_id(video_url)
+    if not video_id:
+        print(f"Failed to get YouTube views for {video_url}: no video ID in URL")
+        return None
+    try:
+        data = cached_api_json(session, 'youtube_stats', {'video_id': video_id}, 'youtube', youtube_statistics_url([video_id], api_key),
+                               fresh=fresh)
+        return parse_youtube_views(data)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Failed to get YouTube views for {video_url}: {e}")
+    return None
+
+
+class YouTubeViewBatcher:
+    """
+    Coalesces view-count lookups coming from many worker threads into batched
+    requests. A batch is sent once it holds YOUTUBE_BATCH_SIZE IDs or `max_wait`
+    seconds after its first ID arrived, whichever comes first.
+    """
+    def __init__(self, session, api_key, max_batch=YOUTUBE_BATCH_SIZE, max_wait=0.1, fresh=False):
+        self.session = session
+        self.api_key = api_key
+        self.fresh = fresh
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def get(self, video_url):
+        """Blocking: returns the view count for `video_url` once its batch is fetched."""
+        if not video_url or not self.api_key:
+            return None
+        video_id = extract_youtube_video_id(video_url)
+        if not video_id:
+            return get_youtube_view_count(self.session, video_url, self.api_key, self.fresh)
+
+        batch = None
+        with self._lock:
+            entry = self._pending.get(video_id)
+            if entry is None:
+                entry = self._pending[video_id] = {'event': threading.Event(), 'views': None}
+            if len(self._pending) >= self.max_batch:
+                batch = self._take_batch()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_wait, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._fetch(batch)
+        entry['event'].wait()
+        return entry['views']
+
+    def _take_batch(self):
+        # Caller holds self._lock
+        batch, self._pending = self._pending, {}
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush(self):
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._fetch(batch)
+
+    def _fetch(self, batch):
+        try:
+            urls = {video_id: f"https://youtu.be/{video_id}" for video_id in batch}
+            views = get_youtube_view_counts(self.session, urls.values(), self.api_key, self.fresh)
+            for video_id, entry in batch.items():
+                entry['views'] = views.get(urls[video_id])
+        finally:
+            for entry in batch.values():
+                entry['event'].set()
+
+def genius_artist_slug(genius_url):
+    """Lower-cased slug from a genius.com/artists/<slug> URL, or None for other URLs."""
+    path = urllib.parse.urlparse((genius_url or '').strip()).path
+    parts = [part for part in path.split('/') if part]
+    if len(parts) >= 2 and parts[0].lower() == 'artists':
+        return urllib.parse.unquote(parts[1]).lower()
+    return None
+
+
+class ArtistIdMap:
+    """
+    Persistent slug -> Genius artist ID map stored as JSON in the data directory.
+    Artist IDs never change, so entries never expire and repeat producers
+    resolve without any network call.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._ids = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Caller holds self._lock
+        if self._ids is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._ids = json.load(f)
+            except (OSError, ValueError):
+                self._ids = {}
+        return self._ids
+
+    def get(self, key):
+        if not key:
+            return None
+        with self._lock:
+            return self._load().get(key)
+
+    def set(self, key, artist_id):
+        if not key or not artist_id:
+            return
+        with self._lock:
+            ids = self._load()
+            if ids.get(key) == artist_id:
+                return
+            ids[key] = artist_id
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(ids, f, indent=1, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Could not save artist ID map: {e}")
+
+
+artist_id_map = ArtistIdMap(os.path.join(get_data_dir(), 'artist_ids.json'))
+
+
+def artist_id_from_page_data(content):
+    """Artist ID from the (HTML-unescaped) page_data JSON, trying a cheap regex before a full parse."""
+    match = ARTIST_ID_TRACKING_RE.search(content)
+    if match:
+        return match.group(1)
+    try:
+        artist = json.loads(content).get('artist') or {}
+    except ValueError:
+        return None
+    return str(artist['id']) if 'id' in artist else None
+
+def scan_artist_page_for_id(chunks):
+    """
+    Read an artist page's HTML chunk by chunk, looking only at <meta> tags, and
+    return the artist ID as soon as it is found (or None). Callers can stop
+    downloading the rest of the page once this returns.
+    """
+    buffer = ''
+    pos = 0
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            start = buffer.find('<meta', pos)
+            if start == -1:
+                # Keep enough of the tail to catch a '<meta' split across chunks
+                pos = max(pos, len(buffer) - 5)
+                break
+            end = buffer.find('>', start)
+            if end == -1:
+                pos = start  # Tag not complete yet; wait for the next chunk
+                break
+            tag = buffer[start:end + 1]
+            pos = end + 1
+            if 'page_data' in tag and PAGE_DATA_ITEMPROP_RE.search(tag):
+                content = META_CONTENT_RE.search(tag)
+                if content:
+                    artist_id = artist_id_from_page_data(html.unescape(content.group(2)))
+                    if artist_id:
+                        return artist_id
+            app_url = GENIUS_APP_ARTIST_RE.search(tag)
+            if app_url:
+                return app_url.group(1)
+    return None
+
+def search_genius_artist_id(session, genius_url, access_token=None):
+    """Fallback when the page layout changes: find the artist via Genius's artist search."""
+    slug = genius_artist_slug(genius_url)
+    if not slug:
+        return None
+    name = slug.replace('-', ' ')
+    url = f"https://genius.com/api/search/artist?q={requests.utils.quote(name)}"
+    headers = {"Accept": "application/json"}
+    if access_token:
+        headers["Authorization"] = f"Bearer {access_token}"
+    data = cached_api_json(session, 'genius_artist_search', {'q': name.casefold()}, 'genius', url, headers=headers)
+    hits = [hit.get('result', {}) for section in data.get('response', {}).get('sections', []) for hit in section.get('hits', [])]
+    for artist in hits:
+        if genius_artist_slug(artist.get('url')) == slug and artist.get('id'):
+            return str(artist['id'])
+    for artist in hits:
+        if (artist.get('name') or '').casefold() == name.casefold() and artist.get('id'):
+            return str(artist['id'])
+    return None
+
+def get_artist_id_from_url(session, genius_url, access_token=None):
+    """
+    Extract Artist ID from a Genius artist page URL. Checks the persistent
+    artist ID map first, then scans the page's <meta> tags (stopping as soon as
+    the ID is found), then falls back to Genius's artist search.
+    """
+    key = genius_artist_slug(genius_url) or genius_url.strip().rstrip('/').lower()
+    artist_id = artist_id_map.get(key)
+    if artist_id:
+        return artist_id
+
+    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"}
+    try:
+        response = rate_limited_request(session, 'genius', 'GET', genius_url, endpoint='genius_artist_page',
+                                        headers=headers, stream=True)
+        try:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+            artist_id = scan_artist_page_for_id(response.iter_content(chunk_size=16 * 1024, decode_unicode=True))
+        finally:
+            # Closing early skips downloading the rest of the page
+            response.close()
+    except requests.RequestException as e:
+        print(f"Error getting artist ID from {genius_url}: {e}")
+
+    if not artist_id:
+        try:
+            artist_id = search_genius_artist_id(session, genius_url, access_token)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Genius artist search failed for {genius_url}: {e}")
+
+    if artist_id:
+        artist_id_map.set(key, artist_id)
+    return artist_id
+
+def iter_songs_from_genius_producer_api(session, producer_url, limit, access_token, prefetch=GENIUS_PREFETCH_PAGES):
+    """
+    Yield song IDs from a producer's Genius page, in listing order, as each page arrives.
+    Up to `prefetch` pages are in flight at once (still paced by the 'genius'
+    token bucket), and no page beyond what `limit` needs is requested, so
+    processing can start on the first page while later ones are downloading.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    try:
+        artist_id = get_artist_id_from_url(session, producer_url, access_token)
+        if not artist_id:
+            raise ValueError("Could not extract Genius Artist ID from URL.")
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error getting songs from Genius API: {e}")
+        return
+
+    url = f"https://api.genius.com/artists/{artist_id}/songs"
+
+    def fetch_page(page):
+        params = {"sort": "popularity", "per_page": GENIUS_PAGE_SIZE, "page": page}
+        data = cached_api_json(session, 'genius_artist_songs', dict(params, artist_id=artist_id), 'genius',
+                               url, headers=headers, params=params)
+        return data.get('response', {})
+
+    # Pages are yielded strictly in order (the listing is sorted by popularity);
+    # later ones wait in `ready` while the current one downloads. The listing ends
+    # at `limit`'s last page, an empty page, one without a next_page, or an error.
+    end_page = -(-limit // GENIUS_PAGE_SIZE) if limit else None
+    next_page = 1
+    pending = {}
+    ready = {}
+    with ThreadPoolExecutor(max_workers=max(1, prefetch)) as executor:
+        try:
+            page = 1
+            while end_page is None or page <= end_page:
+                while page not in ready:
+                    while len(pending) + len(ready) < max(1, prefetch) and (end_page is None or next_page <= end_page):
+                        pending[executor.submit(fetch_page, next_page)] = next_page
+                        next_page += 1
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        ready[pending.pop(future)] = future
+
+                try:
+                    response = ready.pop(page).result()
+                except (requests.RequestException, ValueError) as e:
+                    print(f"Error getting songs from Genius API (page {page}): {e}")
+                    return
+                songs = response.get('songs', [])
+                if not songs:
+                    return
+                if limit:
+                    songs = songs[:max(0, limit - (page - 1) * GENIUS_PAGE_SIZE)]
+                for song in songs:
+                    yield song['id']
+                if not response.get('next_page'):
+                    return
+                page += 1
+        finally:
+            for future in pending:
+                future.cancel()
+
+def get_songs_from_spotify_playlist(session, playlist_url, limit, access_token):
+    """Gets a list of songs (name, artist, track_id) from a Spotify playlist."""
+    try:
+        playlist_id = playlist_url.split('/playlist/')[1].split('?')[0]
+        url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+        headers = {"Authorization": f"Bearer {access_token}"}
+        
+        songs = []
+        while url:
+            if limit and len(songs) >= limit:
+                break
+            data = cached_api_json(session, 'spotify_playlist_page', {'url': url}, 'spotify', url, headers=headers)
+            
+            for item in data.get('items', []):
+                track = item.get('track')
+                if track and track.get('name') and track.get('artists'):
+                    songs.append({
+                        'song_name': track['name'],
+                        'artist_name': track['artists'][0]['name'],
+                        'track_id': track.get('id')
+                    })
+            
+            url = data.get('next')  # For pagination
+        return songs[:limit] if limit else songs
+    except (requests.RequestException, IndexError, KeyError) as e:
+        print(f"Failed to get Spotify playlist songs: {e}")
+        return []
+
+def get_songs_from_spotify_album(session, album_url, limit, access_token):
+    """Gets a list of songs (name, artist, track_id) from a Spotify album."""
+    try:
+        album_id = album_url.split('/album/')[1].split('?')[0]
+        url = f"https://api.spotify.com/v1/albums/{album_id}/tracks"
+        headers = {"Authorization": f"Bearer {access_token}"}
+        
+        songs = []
+        while url:
+            if limit and len(songs) >= limit:
+                break
+            data = cached_api_json(session, 'spotify_album_page', {'url': url}, 'spotify', url, headers=headers)
+            
+            for track in data.get('items', []):
+                if track and track.get('name') and track.get('artists'):
+                    songs.append({
+                        'song_name': track['name'],
+                        'artist_name': track['artists'][0]['name'],
+                        'track_id': track.get('id')
+                    })
+            
+            url = data.get('next')  # For pagination
+        return songs[:limit] if limit else songs
+    except (requests.RequestException, IndexError, KeyError) as e:
+        print(f"Failed to get Spotify album songs: {e}")
+        return []
+
+def parse_manual_input(manual_list_text):
+    """Parses manual 'Song - Artist' input into a list of dicts."""
+    songs = []
+    for line in manual_list_text.strip().splitlines():
+        if "-" in line:
+            parts = line.split("-", 1)
+            songs.append({"song_name": parts[0].strip(), "artist_name": parts[1].strip()})
+    return songs
+
+def spotify_search_url(song_name, artist_name):
+    """Build the Spotify track search URL for a song/artist pair."""
+    query = f"track:{song_name} artist:{artist_name}"
+    return f"https://api.spotify.com/v1/search?q={requests.utils.quote(query)}&type=track&limit=5"
+
+def spotify_search_cache_params(song_name, artist_name):
+    """Cache key parameters for a Spotify search (case and spacing don't change results)."""
+    return {'song': " ".join(song_name.split()).casefold(), 'artist': " ".join(artist_name.split()).casefold()}
+
+def pick_spotify_track(items, song_name):
+    """Choose the best (track_id, track_name) from Spotify search results."""
+    if not items:
+        return None, None
+
+    # Prefer exact matches, case-insensitive
+    for item in items:
+        if item['name'].lower() == song_name.lower():
+            return item['id'], item['name']
+
+    # Fallback to the first result
+    return items[0]['id'], items[0]['name']
+
+def get_spotify_track_id(session, song_name, artist_name, access_token):
+    """Search Spotify for a track and return the best match's ID and name."""
+    try:
+        url = spotify_search_url(song_name, artist_name)
+        headers = {"Authorization": f"Bearer {access_token}"}
+        data = cached_api_json(session, 'spotify_search', spotify_search_cache_params(song_name, artist_name), 'spotify', url, headers=headers)
+        return pick_spotify_track(data.get("tracks", {}).get("items", []), song_name)
+    except requests.RequestException as e:
+        print(f"Spotify search failed for '{song_name}': {e}")
+        return None, None
+
+def rapidapi_stream_request(track_id, api_key):
+    """URL, headers and query params for the RapidAPI stream-count endpoint."""
+    url = f"https://spotify-stream-count.p.rapidapi.com/v1/spotify/tracks/{track_id}/streams"
+    headers = {
+        "x-rapidapi-host": "spotify-stream-count.p.rapidapi.com",
+        "x-rapidapi-key": api_key
+    }
+    return url, headers, {"trackId": track_id}
+
+def get_rapidapi_stream_data(session, track_id, api_key, fresh=False):
+    """
+    Call the RapidAPI endpoint, paced by the 'rapidapi' token bucket. The history is kept in stream_histories.
+    With `fresh`, a cached response is not used (the new one is still cached).
+    """
+    cached = None if fresh else response_cache.get('rapidapi_streams', {'track_id': track_id})
+    if cached is not None:
+        stream_histories.add(track_id, cached)
+        return cached
+    url, headers, params = rapidapi_stream_request(track_id, api_key)
+    try:
+        response = rate_limited_request(session, 'rapidapi', 'GET', url, endpoint='rapidapi_streams',
+                                        headers=headers, params=params)
+        if response.status_code == 200:
+            data = response.json()
+            response_cache.set('rapidapi_streams', {'track_id': track_id}, data)
+            stream_histories.add(track_id, data)
+            return data
+        print(f"RapidAPI returned status {response.status_code} for track {track_id}")
+        return None
+    except requests.RequestException as e:
+        print(f"RapidAPI request failed for track {track_id}: {e}")
+        return None
+
+
+def calculate_stream_stats(history_json):
+    """Process historical stream data to calculate stats."""
+    if not history_json or not isinstance(history_json, list) or len(history_json) == 0:
+        return {"stream_count": None, "change_in_streams": None}
+        
+    stream_count = int(history_json[-1].get("streams", 0))
+    change_in_streams = None
+    if len(history_json) >= 2:
+        try:
+            # Look at the last two available data points for daily change
+            latest_streams = int(history_json[-1].get("streams"))
+            previous_streams = int(history_json[-2].get("streams"))
+            change_in_streams = latest_streams - previous_streams
+        except (ValueError, TypeError):
+            change_in_streams = None # Handle case where stream data is not a number
+
+    return {"stream_count": stream_count, "change_in_streams": change_in_streams}
+
+
+def genius_search_url(song_name, artist_name):
+    """Build the Genius search URL for a song/artist pair."""
+    return f"https://api.genius.com/search?q={requests.utils.quote(f'{song_name} {artist_name}')}"
+
+def match_genius_search_hits(songs, song_name, artist_name):
+    """Return the ID of the search hit whose title and artist match exactly."""
+    for song in songs:
+        if song.get('result', {}).get('primary_artist', {}).get('name').lower() == artist_name.lower() \
+            and song.get('result', {}).get('title').lower() == song_name.lower():
+            return song.get('result', {}).get('id')
+    return None
+
+def genius_search_cache_params(song_name, artist_name):
+    """Cache key parameters for a Genius search query."""
+    return {'q': " ".join(f"{song_name} {artist_name}".split()).casefold()}
+
+def search_genius_song_id(session, song_name, artist_name, access_token):
+    """Search Genius for an exact title/artist match and return its song ID (or None)."""
+    headers = {"Authorization": f"Bearer {access_token}"}
+    data = cached_api_json(session, 'genius_search', genius_search_cache_params(song_name, artist_name), 'genius',
+                           genius_search_url(song_name, artist_name), headers=headers)
+    return match_genius_search_hits(data.get('response', {}).get('hits', []), song_name, artist_name)
+
+def resolve_song_credits(session, song_data, genius_token):
+    """
+    Get the credits dict for a work item. `song_data` must contain either
+    'song_id' (from Genius) or both 'song_name' and 'artist_name'.
+    """
+    if 'song_id' in song_data:
+        return get_genius_song_credits_from_api(session, song_data['song_id'], genius_token)
+    if 'song_name' in song_data and 'artist_name' in song_data:
+        # For manual input, we need to search for the song ID first
+        song_name = song_data['song_name']
+        artist_name = song_data['artist_name']
+        try:
+            song_id = search_genius_song_id(session, song_name, artist_name, genius_token)
+            if song_id:
+                return get_genius_song_credits_from_api(session, song_id, genius_token)
+        except:
+            pass
+        # Fallback: use the provided names
+        return {'song_name': song_name, 'artist_name': artist_name}
+    return {}
+
+def known_track_id(song_data, credits):
+    """
+    Spotify track ID available without a search, with where it came from:
+    'input' (playlist/album listing) or 'genius_media'. Returns (None, None) otherwise.
+    """
+    if song_data.get('track_id'):
+        return song_data['track_id'], 'input'
+    if credits.get('spotify_track_id'):
+        return credits['spotify_track_id'], 'genius_media'
+    return None, None
+
+def build_song_result(credits, actual_track_name, stream_stats, youtube_views, track_id=None):
+    """Assemble the output row (a SongRecord) for one song."""
+    return SongRecord(
+        f"{credits['artist_name']} - {credits['song_name']}",
+        credits.get("co-producers"),
+        actual_track_name,
+        credits.get("label"),
+        credits.get("phonographic_copyright"),
+        credits.get("copyright"),
+        stream_stats["stream_count"],
+        stream_stats["change_in_streams"],
+        credits.get("youtube_url"),
+        youtube_views,
+        credits['artist_name'],
+        credits['song_name'],
+        credits.get("genius_song_id"),
+        track_id,
+    )
+
+
+# --- Song Records ---
+# Column names of the SongRecord fields, in field order: the Raw CSV columns,
+# then the song's identity (STORE_ID_FIELDS) for the placements store.
+RECORD_COLUMNS = (
+    "Artist & Title", "Co-Producers", "Actual Track Name", "Label", "Phonographic_copyright", "Copyright",
+    "Total Spotify Streams", "Daily Spotify Streams", "YouTube URL", "YouTube Views",
+    "Artist", "Title", "Genius Song ID", "Spotify Track ID",
+)
+_RECORD_INDEX = {column: index for index, column in enumerate(RECORD_COLUMNS)}
+
+
+class SongRecord(NamedTuple):
+    """
+    The output row for one song: a plain tuple, so a large run costs a fraction of
+    the memory of one dict per row. Rows can still be read by column name, like
+    the dicts they replaced: record["Total Spotify Streams"], record.get("Label").
+    """
+    artist_title: str
+    co_producers: Optional[str]
+    actual_track_name: Optional[str]
+    label: Optional[str]
+    phonographic_copyright: Optional[str]
+    copyright: Optional[str]
+    total_streams: Optional[int]
+    daily_streams: Optional[int]
+    youtube_url: Optional[str]
+    youtube_views: Optional[int]
+    artist: Optional[str] = None
+    title: Optional[str] = None
+    genius_song_id: Optional[int] = None
+    spotify_track_id: Optional[str] = None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, _RECORD_INDEX[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, column, default=None):
+        index = _RECORD_INDEX.get(column)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def as_dict(self):
+        """{column name: value}, the shape rows are journaled in."""
+        return dict(zip(RECORD_COLUMNS, self))
+
+    @classmethod
+    def from_dict(cls, row):
+        """A record from a column-keyed dict, e.g. a journaled row (older ones lack the identity columns)."""
+        return cls(*(row.get(column) for column in RECORD_COLUMNS))
+
+
+# --- Song Sources ---
+class SongSource:
+    """
+    Wraps the list or generator of work items for a run and counts them as they
+    are consumed, so progress can be reported while a lazy listing is still
+    arriving. `expected` is a best guess at the total (e.g. the song limit).
+    `on_exhausted(count)` is called once, as soon as the last item has been taken.
+    """
+    def __init__(self, songs, expected=None, on_item=None, on_exhausted=None):
+        self._songs = songs
+        self._iter = iter(songs)
+        self.expected = expected
+        self.on_item = on_item
+        self.on_exhausted = on_exhausted
+        self.count = 0
+        self.exhausted = isinstance(songs, (list, tuple))
+        if self.exhausted:
+            self.count = len(songs)
+            for item in songs if on_item else ():
+                on_item(item)
+            if on_exhausted:
+                on_exhausted(self.count)
+
+    def __iter__(self):
+        if isinstance(self._songs, (list, tuple)):
+            return iter(self._songs)
+        return self
+
+    def __next__(self):
+        try:
+            item = next(self._iter)
+        except StopIteration:
+            if not self.exhausted:
+                self.exhausted = True
+                if self.on_exhausted:
+                    self.on_exhausted(self.count)
+            raise
+        self.count += 1
+        if self.on_item:
+            self.on_item(item)
+        return item
+
+    def total_estimate(self, at_least=0):
+        """Best current guess of the number of songs, never below `at_least`."""
+        if self.exhausted:
+            return max(self.count, at_least)
+        return max(self.count, self.expected or 0, at_least)
+
+    def close(self):
+        """Close the underlying listing, e.g. a generator with Genius pages still prefetching."""
+        close_songs(self._iter)
+
+
+def close_songs(songs):
+    """
+    Close a lazy song source once an engine stops taking songs from it early.
+    Must run on the thread that iterates it, after its last next() returned.
+    """
+    close = getattr(songs, 'close', None)
+    if close:
+        close()
+
+
+# --- Run Journal (checkpoint / resume) ---
+# Every run appends to a JSON Lines journal: the job parameters, each song as it
+# is listed, the fields each stage fetched for it and its final row. After a
+# crash or a closed window, "Resume" replays the journal and only fetches what
+# is still missing.
+JOURNAL_STAGES = ('credits', 'track', 'streams', 'youtube')
+# Stages a metrics refresh reuses from an earlier run; stream counts and YouTube views are fetched again
+REFRESH_STAGES = ('credits', 'track')
+
+
+def get_journal_path():
+    """Journal of the most recent run, in the app data directory."""
+    return os.path.join(get_data_dir(), 'journal', 'last_run.jsonl')
+
+def song_key(song_data):
+    """Stable identity of a work item across runs: Genius ID, Spotify track ID or 'artist|song'."""
+    if song_data.get('song_id'):
+        return f"genius:{song_data['song_id']}"
+    if song_data.get('track_id'):
+        return f"spotify:{song_data['track_id']}"
+    return "manual:" + f"{song_data.get('artist_name', '')}|{song_data.get('song_name', '')}".casefold()
+
+def stage_checkpoint(song_data, stage):
+    """Fields a resumed song already has for `stage` (one of JOURNAL_STAGES), or None."""
+    return (song_data.get('checkpoint') or {}).get(stage)
+
+def record_stage(journal, song_data, stage, fields):
+    """Journal the fields a stage fetched, if this run has a journal."""
+    if journal is not None:
+        journal.stage(song_data, stage, fields)
+
+
+class RunJournal:
+    """
+    Append-only JSON Lines checkpoint journal for one run. Every record is
+    flushed as it is written and fsynced at most every `fsync_interval` seconds.
+    Safe to call from several worker threads.
+    """
+    def __init__(self, path=None, fsync_interval=5.0):
+        self.path = path or get_journal_path()
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+
+    def start(self, params, resume=False):
+        """Open the journal: a new run truncates it, a resumed run appends to it."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        self._write({'type': 'resume' if resume else 'job', 'params': params}, sync=True)
+        return self
+
+    def _write(self, record, sync=False):
+        record['time'] = time.time()
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._file.flush()
+            now = time.monotonic()
+            if sync or now - self._last_sync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_sync = now
+
+    def listed(self, song_data, with_checkpoint=False):
+        """Journal a listed song; `with_checkpoint` also journals the stages it carries from an earlier run."""
+        checkpoint = song_data.get('checkpoint') or {}
+        song_data = {k: v for k, v in song_data.items() if k != 'checkpoint'}
+        self._write({'type': 'listed', 'key': song_key(song_data), 'song': song_data})
+        for stage, fields in checkpoint.items() if with_checkpoint else ():
+            self.stage(song_data, stage, fields)
+
+    def listing_done(self, count):
+        self._write({'type': 'listing_done', 'count': count}, sync=True)
+
+    def stage(self, song_data, stage, fields):
+        self._write({'type': 'stage', 'key': song_key(song_data), 'stage': stage, 'fields': fields})
+
+    def done(self, song_data, result):
+        self._write({'type': 'done', 'key': song_key(song_data), 'result': result.as_dict()})
+
+    def failed(self, song_data, error):
+        self._write({'type': 'failed', 'key': song_key(song_data), 'error': str(error)})
+
+    def finish(self):
+        """Mark the run complete and close the journal."""
+        self._write({'type': 'finished'}, sync=True)
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def load(path=None):
+        """
+        Replay a journal into {'params', 'songs', 'listing_complete', 'finished'},
+        where 'songs' maps song_key -> {'song', 'stages', 'result', 'error'} in
+        listing order. Returns None if there is no journal. A torn last line
+        (the process died mid-write) is ignored.
+        """
+        path = path or get_journal_path()
+        if not os.path.exists(path):
+            return None
+        state = {'params': None, 'songs': {}, 'listing_complete': False, 'finished': False}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                kind = record.get('type')
+                entry = state['songs'].get(record.get('key'))
+                if kind == 'job':
+                    state.update(params=record['params'], songs={}, listing_complete=False, finished=False)
+                elif kind == 'resume':
+                    state['finished'] = False
+                elif kind == 'listed':
+                    state['songs'].setdefault(record['key'], {'song': record['song'], 'stages': {}, 'result': None, 'error': None})
+                elif kind == 'listing_done':
+                    state['listing_complete'] = True
+                elif kind == 'finished':
+                    state['finished'] = True
+                elif entry is None:
+                    continue
+                elif kind == 'stage':
+                    entry['stages'][record['stage']] = record['fields']
+                elif kind == 'done':
+                    entry['result'], entry['error'] = record['result'], None
+                elif kind == 'failed':
+                    entry['error'] = record['error']
+        return state if state['params'] is not None else None
+
+
+def journal_params(params):
+    """The part of a job's params worth journaling: no credentials, GUI handles or loaded journals."""
+    return {k: v for k, v in params.items() if k not in ('credentials', 'gui_queue', 'resume_state', 'refresh_state')}
+
+def resumed_results(state):
+    """Rows (SongRecords) a journaled run already finished, in listing order."""
+    return [SongRecord.from_dict(entry['result']) for entry in state['songs'].values() if entry['result']]
+
+def resumable_songs(state, listing=None):
+    """
+    Songs a resumed run still has to process, each carrying the stages it
+    already finished as song_data['checkpoint']: every journaled song without a
+    row, then, if the journaled listing never completed, the songs of `listing`
+    (a fresh listing of the same source) that the journal doesn't have yet.
+    A short or failed fresh listing therefore never drops journaled songs.
+    """
+    for entry in state['songs'].values():
+        if entry['result']:
+            continue
+        item = dict(entry['song'])
+        if entry['stages']:
+            item['checkpoint'] = entry['stages']
+        yield item
+    if state['listing_complete'] or listing is None:
+        return
+    for song_data in listing:
+        if song_key(song_data) not in state['songs']:
+            yield song_data
+
+
+def refresh_songs(state):
+    """
+    Work items for a metrics refresh of a journaled run: every song that got a row or at least
+    its credits (e.g. the run was itself an interrupted refresh), carrying its REFRESH_STAGES as
+    song_data['checkpoint'] so only its stream counts and YouTube views are fetched again.
+    """
+    songs = []
+    for entry in state['songs'].values():
+        if not (entry['result'] or 'credits' in entry['stages']):
+            continue
+        item = dict(entry['song'])
+        checkpoint = {stage: entry['stages'][stage] for stage in REFRESH_STAGES if stage in entry['stages']}
+        if checkpoint:
+            item['checkpoint'] = checkpoint
+        songs.append(item)
+    return songs
+
+
+# --- Staged Pipeline Engine ---
+# Each stage talks to one provider and has its own bounded queue and worker pool,
+# so a slow stage (RapidAPI streams) no longer holds up work in the others.
+# Flow per song: credits -> spotify -> streams, and credits -> youtube in parallel.
+PIPELINE_STAGES = ('credits', 'spotify', 'streams', 'youtube')
+STAGE_PROVIDERS = {'credits': 'genius', 'spotify': 'spotify', 'streams': 'rapidapi', 'youtube': 'youtube'}
+DEFAULT_STAGE_QUEUE_SIZE = 50
+# Stages that hand their handler a list of jobs: (batch size, max wait in seconds)
+STAGE_BATCHING = {'youtube': (YOUTUBE_BATCH_SIZE, 0.25)}
+
+
+def default_stage_workers(max_workers):
+    """Split the 'Concurrent Tasks' setting into per-stage worker counts."""
+    max_workers = max(1, int(max_workers))
+    return {
+        'credits': max_workers,
+        'spotify': max_workers,
+        # RapidAPI is paced by its token bucket; extra threads would only wait
+        'streams': max(1, min(max_workers, 4)),
+        # YouTube lookups are batched 50 at a time, so a couple of workers is plenty
+        'youtube': min(max_workers, 2),
+    }
+
+
+class PipelineStage:
+    """
+    A pool of worker threads fed from one bounded queue. With batch_size > 1 the
+    handler receives a list of up to batch_size jobs, collected for at most
+    batch_wait seconds after the first one arrives.
+    """
+    def __init__(self, name, handler, workers, queue_size=DEFAULT_STAGE_QUEUE_SIZE, batch_size=1, batch_wait=0.0):
+        self.name = name
+        self.provider = STAGE_PROVIDERS.get(name)
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self._threads = []
+        self._discarding = threading.Event()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def discard(self):
+        """Drop the queued jobs, and any queued from now on, instead of running them."""
+        self._discarding.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            stopping = False
+            if self.batch_size > 1:
+                job, stopping = self._collect_batch(job)
+            if not self._discarding.is_set():
+                started = time.monotonic()
+                try:
+                    self.handler(job)
+                finally:
+                    with self._stats_lock:
+                        self.processed += len(job) if isinstance(job, list) else 1
+                        self.busy_seconds += time.monotonic() - started
+            if stopping:
+                break
+
+    def _collect_batch(self, first):
+        """Gather up to batch_size jobs. Returns (jobs, stop_sentinel_seen)."""
+        jobs = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(jobs) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    def stats(self, elapsed):
+        """Throughput, queue depth and worker utilization for this stage."""
+        with self._stats_lock:
+            processed, busy = self.processed, self.busy_seconds
+        elapsed = max(elapsed, 1e-6)
+        return {
+            'stage': self.name,
+            'provider': self.provider,
+            'workers': self.workers,
+            'processed': processed,
+            'per_second': processed / elapsed,
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'utilization': busy / (elapsed * self.workers),
+        }
+
+
+class _SongJob:
+    """Per-song state carried between pipeline stages until both branches finish."""
+    def __init__(self, song_data):
+        self.song_data = song_data
+        self.credits = {}
+        self.track_id = None
+        self.actual_track_name = None
+        self.stream_stats = {"stream_count": None, "change_in_streams": None}
+        self.youtube_views = None
+        self.error = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+
+class SongPipeline:
+    """
+    Runs songs through the credits/spotify/streams/youtube stages and joins the
+    results per song. `run()` yields (song_data, result, error) as songs finish.
+    If the caller stops early, the feeder stops taking songs and queued jobs are
+    dropped rather than run.
+    """
+    _FEED_DONE = object()
+
+    def __init__(self, session, spotify_token, genius_token, youtube_key, rapidapi_key,
+                 stage_workers=None, queue_size=DEFAULT_STAGE_QUEUE_SIZE, journal=None, fresh=False):
+        self.session = session
+        self.journal = journal
+        self.fresh = fresh  # Skip cached stream and view counts (metrics refresh)
+        self.spotify_token = spotify_token
+        self.genius_token = genius_token
+        self.youtube_key = youtube_key
+        self.rapidapi_key = rapidapi_key
+        self._results = queue.Queue()
+        self._started = None
+        self._feed_error = None
+        self._stop = threading.Event()
+
+        workers = default_stage_workers(10)
+        workers.update(stage_workers or {})
+        handlers = {
+            'credits': self._credits_stage,
+            'spotify': self._spotify_stage,
+            'streams': self._streams_stage,
+            'youtube': self._youtube_stage,
+        }
+        self.stages = {}
+        for name in PIPELINE_STAGES:
+            batch_size, batch_wait = STAGE_BATCHING.get(name, (1, 0.0))
+            self.stages[name] = PipelineStage(name, self._guarded(handlers[name]), workers[name],
+                                              max(queue_size, batch_size), batch_size, batch_wait)
+
+    def run(self, songs, report=None, report_interval=5.0):
+        """
+        Feed `songs` (any iterable of song_data dicts) through the stages.
+        `report`, if given, is called with stats() every `report_interval` seconds.
+        """
+        self._started = time.monotonic()
+        for stage in self.stages.values():
+            stage.start()
+
+        stop_reporting = threading.Event()
+        if report:
+            def reporter():
+                while not stop_reporting.wait(report_interval):
+                    report(self.stats())
+            threading.Thread(target=reporter, name="pipeline-report", daemon=True).start()
+
+        feeder = threading.Thread(target=self._feed, args=(songs,), name="pipeline-feed", daemon=True)
+        feeder.start()
+        complete = False
+        try:
+            finished, total = 0, None
+            while total is None or finished < total:
+                item = self._results.get()
+                if isinstance(item, tuple) and item[0] is self._FEED_DONE:
+                    total = item[1]
+                    continue
+                finished += 1
+                yield item
+            complete = True
+            if self._feed_error is not None:
+                raise self._feed_error
+        finally:
+            stop_reporting.set()
+            if not complete:
+                # Stopped early: let the feeder go and skip the songs still queued.
+                # Every stage discards before any is stopped, so none blocks on a full downstream queue.
+                self._stop.set()
+                for stage in self.stages.values():
+                    stage.discard()
+            for name in PIPELINE_STAGES:
+                self.stages[name].stop()
+
+    def stats(self):
+        """Snapshot of every stage's throughput and queue depth."""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return [self.stages[name].stats(elapsed) for name in PIPELINE_STAGES]
+
+    def _feed(self, songs):
+        count = 0
+        try:
+            for song_data in songs:
+                if not self._offer(_SongJob(song_data)):
+                    break
+                count += 1
+        except Exception as exc:
+            # Surfaced by run() once the songs already fed have finished
+            self._feed_error = exc
+        finally:
+            if self._stop.is_set():
+                close_songs(songs)
+            self._results.put((self._FEED_DONE, count))
+
+    def _offer(self, job):
+        """Queue a song for the credits stage; False once run() has stopped early."""
+        while not self._stop.is_set():
+            try:
+                self.stages['credits'].queue.put(job, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _guarded(self, handler):
+        def run(job):
+            try:
+                handler(job)
+            except Exception as exc:
+                for failed in (job if isinstance(job, list) else [job]):
+                    failed.error = failed.error or exc
+                    self._branch_done(failed)
+        return run
+
+    def _finish(self, job, result):
+        self._results.put((job.song_data, result, job.error))
+
+    def _branch_done(self, job):
+        with job.lock:
+            job.pending -= 1
+            done = job.pending <= 0
+        if done:
+            result = None
+            if not job.error and job.credits.get('song_name'):
+                result = build_song_result(job.credits, job.actual_track_name, job.stream_stats, job.youtube_views,
+                                           job.track_id)
+            self._finish(job, result)
+
+    def _credits_stage(self, job):
+        job.credits = stage_checkpoint(job.song_data, 'credits')
+        if job.credits is None:
+            job.credits = resolve_song_credits(self.session, job.song_data, self.genius_token)
+            if job.credits.get('song_name'):
+                record_stage(self.journal, job.song_data, 'credits', job.credits)
+        if not job.credits.get('song_name'):
+            # If we couldn't get credits, we can't proceed with this song
+            self._finish(job, None)
+            return
+        job.actual_track_name = job.credits['song_name']
+        # Two branches join back at _branch_done: Spotify/streams and YouTube
+        job.pending = 2
+        track = stage_checkpoint(job.song_data, 'track')
+        if track:
+            job.track_id, job.actual_track_name = track['track_id'], track['actual_track_name']
+            self._track_ready(job)
+        else:
+            job.track_id, source = known_track_id(job.song_data, job.credits)
+            if job.track_id:
+                track_id_sources.increment(source)
+                self._track_ready(job)
+            else:
+                self.stages['spotify'].queue.put(job)
+        youtube = stage_checkpoint(job.song_data, 'youtube')
+        if youtube:
+            job.youtube_views = youtube['youtube_views']
+            self._branch_done(job)
+        elif job.credits.get('youtube_url'):
+            self.stages['youtube'].queue.put(job)
+        else:
+            self._branch_done(job)
+
+    def _track_ready(self, job):
+        # Resumed songs may already have their stream counts
+        streams = stage_checkpoint(job.song_data, 'streams')
+        if streams:
+            job.stream_stats = streams
+            self._branch_done(job)
+        else:
+            self.stages['streams'].queue.put(job)
+
+    def _spotify_stage(self, job):
+        job.track_id, job.actual_track_name = get_spotify_track_id(
+            self.session, job.credits['song_name'], job.credits['artist_name'], self.spotify_token)
+        track_id_sources.increment('spotify_search' if job.track_id else 'not_found')
+        if job.track_id:
+            record_stage(self.journal, job.song_data, 'track',
+                         {'track_id': job.track_id, 'actual_track_name': job.actual_track_name})
+            self._track_ready(job)
+        else:
+            self._branch_done(job)
+
+    def _streams_stage(self, job):
+        stream_data = get_rapidapi_stream_data(self.session, job.track_id, self.rapidapi_key, self.fresh)
+        if stream_data:
+            job.stream_stats = calculate_stream_stats(stream_data)
+            record_stage(self.journal, job.song_data, 'streams', job.stream_stats)
+        self._branch_done(job)
+
+    def _youtube_stage(self, jobs):
+        # Batched stage: one videos?part=statistics call covers up to 50 songs
+        views = get_youtube_view_counts(self.session, [job.credits['youtube_url'] for job in jobs], self.youtube_key,
+                                        self.fresh)
+        for job in jobs:
+            job.youtube_views = views.get(job.credits['youtube_url'])
+            if job.youtube_views is not None:
+                record_stage(self.journal, job.song_data, 'youtube', {'youtube_views': job.youtube_views})
+            self._branch_done(job)
+
+
+def format_stage_stats(stats):
+    """One-line summary of pipeline stats for the log."""
+    return " | ".join(
+        f"{s['stage']}: {s['processed']} done, {s['per_second']:.2f}/s, "
+        f"queue {s['queue_depth']}/{s['queue_size']}, busy {s['utilization']:.0%}"
+        for s in stats
+    )
+
+
+# --- Asyncio Engine ---
+# Alternative to the thread pool: one event loop drives hundreds of in-flight
+# requests over a pooled aiohttp client. Request building and response parsing
+# are shared with the sync get_* functions, so both engines produce the same rows.
+ASYNC_REQUEST_ERRORS = (requests.RequestException, asyncio.TimeoutError) + ((aiohttp.ClientError,) if aiohttp else ())
+
+
+class AsyncResponse:
+    """The parts of an aiohttp response the async get_* functions need, read eagerly."""
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    def json(self):
+        try:
+            return json.loads(self.content)
+        except ValueError as e:
+            raise requests.exceptions.InvalidJSONError(str(e))
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+async def async_rate_limited_request(client, provider, method, url, timeout=None, endpoint=None, **kwargs):
+    """Async counterpart of rate_limited_request() for an aiohttp.ClientSession."""
+    timeout = aiohttp.ClientTimeout(total=timeout or http_settings.timeout(provider))
+    endpoint = endpoint or provider
+    routed_url = endpoint_router.route(url)
+    throttles = failures = 0
+    while True:
+        await rate_limiter.acquire_async(provider)
+        slot = await concurrency_limiter.acquire_async(provider)
+        started, latency, outcome, error = time.monotonic(), None, 'error', None
+        try:
+            async with client.request(method, routed_url, timeout=timeout, **kwargs) as resp:
+                response = AsyncResponse(resp.status, resp.headers, await resp.read(), str(resp.url))
+            latency, outcome = time.monotonic() - started, request_outcome(response.status_code)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            error = e
+        finally:
+            concurrency_limiter.release(slot, latency, outcome)
+        if error is not None:
+            endpoint_metrics.observe(endpoint, provider, 'error', time.monotonic() - started)
+        else:
+            endpoint_metrics.observe(endpoint, provider, response.status_code, latency, len(response.content))
+
+        if http_settings.should_retry(method, failures, None if error else response.status_code):
+            endpoint_metrics.retried(endpoint, provider)
+            failures += 1
+            delay = http_settings.backoff_delay(failures)
+            print(f"{provider} request failed ({error or response.status_code}), retry {failures} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        if error is not None:
+            raise error
+        if response.status_code != 429 or throttles == MAX_THROTTLE_RETRIES:
+            if cassette_recorder.recording:
+                cassette_recorder.record(provider, method, url, kwargs.get('params'), response, latency)
+            return response
+        throttles += 1
+        endpoint_metrics.retried(endpoint, provider, throttled=True)
+        delay = rate_limiter.throttle(provider, response.headers.get('Retry-After'))
+        print(f"{provider} rate limit hit (429), backing off {delay:.1f}s")
+
+
+def transport_trace_config():
+    """aiohttp tracing hooks that feed transport_stats like PooledHTTPAdapter does."""
+    async def on_request_start(session, context, params):
+        transport_stats.increment('requests')
+
+    async def on_connection_create_end(session, context, params):
+        transport_stats.increment('connections')
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+async def cached_api_json_async(client, endpoint, cache_params, provider, url, fresh=False, **kwargs):
+    """Async counterpart of cached_api_json()."""
+    cached = None if fresh else response_cache.get(endpoint, cache_params)
+    if cached is not None:
+        return cached
+    response = await async_rate_limited_request(client, provider, 'GET', url, endpoint=endpoint, **kwargs)
+    response.raise_for_status()
+    data = response.json()
+    response_cache.set(endpoint, cache_params, data)
+    return data
+
+
+async def get_genius_song_credits_from_api_async(client, song_id, access_token):
+    """Async version of get_genius_song_credits_from_api()."""
+    if not song_id:
+        return {}
+    url, headers = genius_song_request(song_id, access_token)
+    try:
+        data = await cached_api_json_async(client, 'genius_song', {'song_id': str(song_id)}, 'genius', url, headers=headers)
+        return parse_genius_song(data.get('response', {}).get('song', {}))
+    except ASYNC_REQUEST_ERRORS as e:
+        print(f"Genius API request failed for song ID {song_id}: {e}")
+        return {}
+
+async def search_genius_song_id_async(client, song_name, artist_name, access_token):
+    """Async version of search_genius_song_id()."""
+    headers = {"Authorization": f"Bearer {access_token}"}
+    data = await cached_api_json_async(client, 'genius_search', genius_search_cache_params(song_name, artist_name), 'genius',
+                                       genius_search_url(song_name, artist_name), headers=headers)
+    return match_genius_search_hits(data.get('response', {}).get('hits', []), song_name, artist_name)
+
+async def resolve_song_credits_async(client, song_data, genius_token):
+    """Async version of resolve_song_credits()."""
+    if 'song_id' in song_data:
+        return await get_genius_song_credits_from_api_async(client, song_data['song_id'], genius_token)
+    if 'song_name' in song_data and 'artist_name' in song_data:
+        song_name = song_data['song_name']
+        artist_name = song_data['artist_name']
+        try:
+            song_id = await search_genius_song_id_async(client, song_name, artist_name, genius_token)
+            if song_id:
+                return await get_genius_song_credits_from_api_async(client, song_id, genius_token)
+        except Exception:
+            pass
+        # Fallback: use the provided names
+        return {'song_name': song_name, 'artist_name': artist_name}
+    return {}
+
+async def get_spotify_track_id_async(client, song_name, artist_name, access_token):
+    """Async version of get_spotify_track_id()."""
+    try:
+        headers = {"Authorization": f"Bearer {access_token}"}
+        data = await cached_api_json_async(client, 'spotify_search', spotify_search_cache_params(song_name, artist_name), 'spotify',
+                                           spotify_search_url(song_name, artist_name), headers=headers)
+        return pick_spotify_track(data.get("tracks", {}).get("items", []), song_name)
+    except ASYNC_REQUEST_ERRORS as e:
+        print(f"Spotify search failed for '{song_name}': {e}")
+        return None, None
+
+async def get_rapidapi_stream_data_async(client, track_id, api_key, fresh=False):
+    """Async version of get_rapidapi_stream_data()."""
+    cached = None if fresh else response_cache.get('rapidapi_streams', {'track_id': track_id})
+    if cached is not None:
+        stream_histories.add(track_id, cached)
+        return cached
+    url, headers, params = rapidapi_stream_request(track_id, api_key)
+    try:
+        response = await async_rate_limited_request(client, 'rapidapi', 'GET', url, endpoint='rapidapi_streams',
+                                                    headers=headers, params=params)
+        if response.status_code == 200:
+            data = response.json()
+            response_cache.set('rapidapi_streams', {'track_id': track_id}, data)
+            stream_histories.add(track_id, data)
+            return data
+        print(f"RapidAPI returned status {response.status_code} for track {track_id}")
+        return None
+    except ASYNC_REQUEST_ERRORS as e:
+        print(f"RapidAPI request failed for track {track_id}: {e}")
+        return None
+
+async def get_youtube_view_counts_async(client, video_urls, api_key, fresh=False):
+    """Async version of get_youtube_view_counts()."""
+    url_to_id = {url: extract_youtube_video_id(url) for url in video_urls if url}
+    if not api_key:
+        return {url: None for url in url_to_id}
+    views, to_fetch = _youtube_cached_views((video_id for video_id in url_to_id.values() if video_id), fresh)
+    for start in range(0, len(to_fetch), YOUTUBE_BATCH_SIZE):
+        chunk = to_fetch[start:start + YOUTUBE_BATCH_SIZE]
+        try:
+            response = await async_rate_limited_request(client, 'youtube', 'GET', youtube_statistics_url(chunk, api_key),
+                                                        endpoint='youtube_stats')
+            response.raise_for_status()
+            _youtube_store_batch(chunk, response.json().get('items', []), views)
+        except ASYNC_REQUEST_ERRORS + (ValueError,) as e:
+            print(f"Failed to get YouTube views for {len(chunk)} videos: {e}")
+    return {url: views.get(video_id) if video_id else None for url, video_id in url_to_id.items()}
+
+async def get_youtube_view_count_async(client, video_url, api_key, fresh=False):
+    """Async version of get_youtube_view_count()."""
+    if not video_url or not api_key:
+        return None
+    video_id = extract_youtube_video_id(video_url)
+    if not video_id:
+        print(f"Failed to get YouTube views for {video_url}: no video ID in URL")
+        return None
+    try:
+        data = await cached_api_json_async(client, 'youtube_stats', {'video_id': video_id}, 'youtube',
+                                           youtube_statistics_url([video_id], api_key), fresh=fresh)
+        return parse_youtube_views(data)
+    except ASYNC_REQUEST_ERRORS + (ValueError,) as e:
+        print(f"Failed to get YouTube views for {video_url}: {e}")
+    return None
+
+
+class AsyncYouTubeViewBatcher:
+    """Event-loop counterpart of YouTubeViewBatcher for the asyncio engine."""
+    def __init__(self, client, api_key, max_batch=YOUTUBE_BATCH_SIZE, max_wait=0.25, fresh=False):
+        self.client = client
+        self.api_key = api_key
+        self.fresh = fresh
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = {}
+        self._timer = None
+        self._tasks = set()
+
+    async def get(self, video_url):
+        if not video_url or not self.api_key:
+            return None
+        video_id = extract_youtube_video_id(video_url)
+        if not video_id:
+            return await get_youtube_view_count_async(self.client, video_url, self.api_key, self.fresh)
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(video_id)
+        if future is None:
+            future = self._pending[video_id] = loop.create_future()
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._fetch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch):
+        try:
+            urls = {video_id: f"https://youtu.be/{video_id}" for video_id in batch}
+            views = await get_youtube_view_counts_async(self.client, urls.values(), self.api_key, self.fresh)
+        except Exception as e:
+            print(f"Failed to get YouTube views for {len(batch)} videos: {e}")
+            views = {}
+        for video_id, future in batch.items():
+            if not future.done():
+                future.set_result(views.get(urls[video_id]))
+
+
+async def process_single_song_async(client, song_data, spotify_token, genius_token, youtube_key, rapidapi_key,
+                                    youtube_batcher=None, journal=None, fresh=False):
+    """Async version of process_single_song()."""
+    credits = stage_checkpoint(song_data, 'credits')
+    if credits is None:
+        credits = await resolve_song_credits_async(client, song_data, genius_token)
+        if credits.get('song_name'):
+            record_stage(journal, song_data, 'credits', credits)
+    if not credits.get('song_name'):
+        return None
+
+    song_name = credits['song_name']
+    artist_name = credits['artist_name']
+
+    actual_track_name = song_name
+    track = stage_checkpoint(song_data, 'track')
+    if track:
+        track_id, actual_track_name = track['track_id'], track['actual_track_name']
+    else:
+        track_id, source = known_track_id(song_data, credits)
+        if not track_id:
+            track_id, actual_track_name = await get_spotify_track_id_async(client, song_name, artist_name, spotify_token)
+            source = 'spotify_search' if track_id else 'not_found'
+            if track_id:
+                record_stage(journal, song_data, 'track', {'track_id': track_id, 'actual_track_name': actual_track_name})
+        track_id_sources.increment(source)
+
+    stream_stats = stage_checkpoint(song_data, 'streams') or {"stream_count": None, "change_in_streams": None}
+    if track_id and not stage_checkpoint(song_data, 'streams'):
+        stream_data = await get_rapidapi_stream_data_async(client, track_id, rapidapi_key, fresh)
+        if stream_data:
+            stream_stats = calculate_stream_stats(stream_data)
+            record_stage(journal, song_data, 'streams', stream_stats)
+
+    youtube_views = None
+    youtube = stage_checkpoint(song_data, 'youtube')
+    if youtube:
+        youtube_views = youtube['youtube_views']
+    elif credits.get('youtube_url'):
+        if youtube_batcher:
+            youtube_views = await youtube_batcher.get(credits['youtube_url'])
+        else:
+            youtube_views = await get_youtube_view_count_async(client, credits['youtube_url'], youtube_key, fresh)
+        if youtube_views is not None:
+            record_stage(journal, song_data, 'youtube', {'youtube_views': youtube_views})
+
+    return build_song_result(credits, actual_track_name, stream_stats, youtube_views, track_id)
+
+
+def run_async_engine(songs, tokens, concurrency=DEFAULT_ASYNC_CONCURRENCY, journal=None, fresh=False):
+    """
+    Process `songs` on an asyncio event loop in a background thread, with at most
+    `concurrency` songs in flight. Yields (song_data, result, error) as songs finish.
+    If the caller stops early (closes the generator or raises), no more songs are
+    taken, the songs in flight are cancelled and the loop thread is joined.
+    """
+    if aiohttp is None:
+        raise RuntimeError("The asyncio engine needs the 'aiohttp' package (pip install aiohttp).")
+
+    results = queue.Queue()
+    done = object()
+    failure = []
+    stop = threading.Event()
+    running = {}  # 'loop' and 'task' once main() has started the workers
+
+    async def main():
+        connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector, trace_configs=[transport_trace_config()]) as client:
+            song_iter = iter(songs)
+            iter_lock = asyncio.Lock()
+            loop = asyncio.get_running_loop()
+
+            async def next_song():
+                # Lazy sources (e.g. Genius listing pages) block on the network,
+                # so pull from them in a thread, one coroutine at a time.
+                if stop.is_set():
+                    return None
+                if isinstance(songs, (list, tuple)):
+                    return next(song_iter, None)
+                async with iter_lock:
+                    song_data = await loop.run_in_executor(None, next, song_iter, None)
+                return None if stop.is_set() else song_data
+            youtube_batcher = AsyncYouTubeViewBatcher(client, tokens[2], fresh=fresh)
+
+            async def worker():
+                # Workers share one iterator, so only `concurrency` songs are ever in flight
+                while (song_data := await next_song()) is not None:
+                    try:
+                        result = await process_single_song_async(client, song_data, *tokens, youtube_batcher=youtube_batcher,
+                                                                 journal=journal, fresh=fresh)
+                        results.put((song_data, result, None))
+                    except Exception as exc:
+                        results.put((song_data, None, exc))
+
+            task = asyncio.ensure_future(asyncio.gather(*(worker() for _ in range(max(1, concurrency)))))
+            running.update(loop=loop, task=task)
+            if stop.is_set():
+                task.cancel()  # The caller stopped before the workers started
+            try:
+                await task
+            except asyncio.CancelledError:
+                if not stop.is_set():
+                    raise
+
+    def runner():
+        try:
+            asyncio.run(main())
+        except Exception as exc:
+            failure.append(exc)
+        finally:
+            results.put(done)
+
+    thread = threading.Thread(target=runner, name="asyncio-engine", daemon=True)
+    thread.start()
+    finished = False
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                finished = True
+                break
+            yield item
+    finally:
+        if not finished:
+            stop.set()
+            if running:
+                try:
+                    running['loop'].call_soon_threadsafe(running['task'].cancel)
+                except RuntimeError:
+                    pass  # The loop already finished
+            thread.join()
+            # asyncio.run() waited for the executor, so no next() is still running on the source
+            close_songs(songs)
+    if failure:
+        raise failure[0]
+
+
+# --- CSV Export ---
+CSV_FIELDNAMES_RAW = ["Artist & Title", "Co-Producers", "Actual Track Name", "Label", "Phonographic_copyright", "Copyright", "Total Spotify Streams", "Daily Spotify Streams", "YouTube URL", "YouTube Views"]
+CSV_FIELDNAMES_SIMPLE = ["Artist & Title", "Co-Producers", "Label", "Total Spotify Streams", "Daily Spotify Streams", "YouTube Views"]
+FORMATTED_NUMBER_FIELDS = ['Total Spotify Streams', 'Daily Spotify Streams', 'YouTube Views']
+# Where each CSV column sits in a SongRecord, and each Simplified column in a Raw CSV row
+_RAW_INDEXES = [_RECORD_INDEX[column] for column in CSV_FIELDNAMES_RAW]
+_SIMPLE_INDEXES = [CSV_FIELDNAMES_RAW.index(column) for column in CSV_FIELDNAMES_SIMPLE]
+_NUMBER_INDEXES = [CSV_FIELDNAMES_RAW.index(column) for column in FORMATTED_NUMBER_FIELDS]
+
+
+def format_result_row(record):
+    """Raw CSV cells (a list in CSV_FIELDNAMES_RAW order) for one SongRecord: numbers get thousands separators, None becomes ''."""
+    values = tuple(record)
+    cells = ['' if values[index] is None else values[index] for index in _RAW_INDEXES]
+    for index in _NUMBER_INDEXES:
+        if isinstance(cells[index], int):
+            cells[index] = f"{cells[index]:,}" # Add commas
+    return cells
+
+def simplified_row(cells):
+    """The Simplified CSV cells taken from a row of Raw CSV cells."""
+    return [cells[index] for index in _SIMPLE_INDEXES]
+
+def export_csv_paths(save_dir, file_name):
+    """(simplified_path, raw_path) for a run's output files."""
+    filepath = os.path.join(save_dir, f"{file_name}.csv")
+    return filepath.replace(".csv", " - Simplified.csv"), filepath.replace(".csv", " - Raw.csv")
+
+
+class StreamingCsvExporter:
+    """
+    Appends each result to the Raw and Simplified CSVs as soon as it arrives.
+    Rows go to '.partial' files that are flushed every `flush_every` rows and
+    fsynced at most every `fsync_interval` seconds, so a crash keeps the
+    progress made so far. close() renames both files into place atomically.
+    """
+    PARTIAL_SUFFIX = ".partial"
+
+    def __init__(self, simplified_path, raw_path, flush_every=25, fsync_interval=5.0):
+        self.simplified_path = simplified_path
+        self.raw_path = raw_path
+        self.flush_every = flush_every
+        self.fsync_interval = fsync_interval
+        self.rows = 0
+        self._files = []
+        self._writers = []
+        self._last_sync = time.monotonic()
+
+    def open(self):
+        for path, fieldnames in ((self.simplified_path, CSV_FIELDNAMES_SIMPLE), (self.raw_path, CSV_FIELDNAMES_RAW)):
+            f = open(path + self.PARTIAL_SUFFIX, "w", newline="", encoding="utf-8")
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            self._files.append(f)
+            self._writers.append(writer)
+        self._flush(sync=True)
+        return self
+
+    def write(self, record):
+        """Format and append one result to both files."""
+        cells = format_result_row(record)
+        simplified_writer, raw_writer = self._writers
+        simplified_writer.writerow(simplified_row(cells))
+        raw_writer.writerow(cells)
+        self.rows += 1
+        if self.rows % self.flush_every == 0:
+            self._flush()
+
+    def _flush(self, sync=False):
+        for f in self._files:
+            f.flush()
+        now = time.monotonic()
+        if sync or now - self._last_sync >= self.fsync_interval:
+            for f in self._files:
+                os.fsync(f.fileno())
+            self._last_sync = now
+
+    def _close_files(self):
+        if self._files:
+            self._flush(sync=True)
+            for f in self._files:
+                f.close()
+        self._files, self._writers = [], []
+
+    def close(self):
+        """Finish the export: move the .partial files over the final paths."""
+        self._close_files()
+        for path in (self.simplified_path, self.raw_path):
+            os.replace(path + self.PARTIAL_SUFFIX, path)
+
+    def abort(self):
+        """Stop writing but keep the .partial files (and everything in them) on disk."""
+        try:
+            self._close_files()
+        except OSError as e:
+            print(f"Error closing partial CSV files: {e}")
+
+    def discard(self):
+        """Stop writing and remove the .partial files."""
+        self.abort()
+        for path in (self.simplified_path, self.raw_path):
+            if os.path.exists(path + self.PARTIAL_SUFFIX):
+                os.remove(path + self.PARTIAL_SUFFIX)
+
+
+# --- Typed Export ---
+# Machine-readable copies of the Raw CSV: numbers stay integers and missing
+# values stay null, so notebooks can load them without parsing "1,234".
+EXPORT_FORMATS = {'jsonl': ".jsonl", 'parquet': ".parquet", 'arrow': ".arrow"}
+COLUMNAR_FORMATS = ('parquet', 'arrow')  # These need pyarrow
+TYPED_COLUMNS = [
+    ("Artist & Title", 'string'), ("Artist", 'string'), ("Title", 'string'), ("Co-Producers", 'string'),
+    ("Actual Track Name", 'string'), ("Label", 'string'), ("Phonographic_copyright", 'string'), ("Copyright", 'string'),
+    ("Total Spotify Streams", 'int64'), ("Daily Spotify Streams", 'int64'), ("YouTube URL", 'string'),
+    ("YouTube Views", 'int64'), ("Genius Song ID", 'int64'), ("Spotify Track ID", 'string'),
+]
+
+
+_TYPED_NAMES = [name for name, _ in TYPED_COLUMNS]
+_TYPED_INDEXES = [(_RECORD_INDEX[name], kind == 'int64') for name, kind in TYPED_COLUMNS]
+
+
+def typed_values(record):
+    """A SongRecord's values in TYPED_COLUMNS order: integers (or None) for counts and IDs, strings (or None) for the rest."""
+    values = tuple(record)
+    row = []
+    for index, is_int in _TYPED_INDEXES:
+        value = values[index]
+        if value is None or value == '':
+            value = None
+        elif is_int:
+            value = value if isinstance(value, int) else _store_int(value)
+        elif not isinstance(value, str):
+            value = str(value)
+        row.append(value)
+    return row
+
+def typed_export_paths(save_dir, file_name, formats):
+    """{format: path} for a run's typed exports, e.g. '<name>.parquet'."""
+    return {fmt: os.path.join(save_dir, file_name + EXPORT_FORMATS[fmt]) for fmt in formats}
+
+
+class TypedExporter:
+    """
+    Writes results with their types intact as JSON Lines, Parquet and/or Arrow IPC.
+    JSON Lines rows are appended as they arrive; Parquet and Arrow get one record
+    batch every `batch_size` rows, so memory stays flat. Like StreamingCsvExporter,
+    files are written as '.partial' and renamed into place by close().
+    Formats that need pyarrow are left out (see `skipped`) when it isn't installed.
+    """
+    PARTIAL_SUFFIX = ".partial"
+
+    def __init__(self, paths, batch_size=1000):
+        self.skipped = [fmt for fmt in paths if fmt in COLUMNAR_FORMATS and pyarrow is None]
+        self.paths = {fmt: path for fmt, path in paths.items() if fmt not in self.skipped}
+        self.batch_size = batch_size
+        self.rows = 0
+        self._jsonl = None
+        self._writers = {}
+        self._sinks = []
+        self._batch = []
+        self._schema = None
+
+    def open(self):
+        if 'jsonl' in self.paths:
+            self._jsonl = open(self.paths['jsonl'] + self.PARTIAL_SUFFIX, "w", encoding="utf-8")
+        columnar = [fmt for fmt in COLUMNAR_FORMATS if fmt in self.paths]
+        if columnar:
+            self._schema = pyarrow.schema([(name, pyarrow.int64() if kind == 'int64' else pyarrow.string())
+                                           for name, kind in TYPED_COLUMNS])
+        for fmt in columnar:
+            path = self.paths[fmt] + self.PARTIAL_SUFFIX
+            if fmt == 'parquet':
+                self._writers[fmt] = pyarrow.parquet.ParquetWriter(path, self._schema)
+            else:
+                sink = pyarrow.OSFile(path, "wb")
+                self._sinks.append(sink)
+                self._writers[fmt] = pyarrow.ipc.new_file(sink, self._schema)
+        return self
+
+    def write(self, record):
+        """Append one result to every format."""
+        values = typed_values(record)
+        if self._jsonl:
+            self._jsonl.write(json.dumps(dict(zip(_TYPED_NAMES, values)), ensure_ascii=False) + "\n")
+        if self._writers:
+            self._batch.append(values)
+            if len(self._batch) >= self.batch_size:
+                self._write_batch()
+        self.rows += 1
+
+    def _write_batch(self):
+        if self._batch:
+            columns = [list(column) for column in zip(*self._batch)]
+            batch = pyarrow.RecordBatch.from_arrays(columns, schema=self._schema)
+            for fmt, writer in self._writers.items():
+                if fmt == 'parquet':
+                    writer.write_table(pyarrow.Table.from_batches([batch]))
+                else:
+                    writer.write_batch(batch)
+            self._batch = []
+        if self._jsonl:
+            self._jsonl.flush()
+
+    def _close_files(self):
+        try:
+            self._write_batch()
+        finally:
+            for writer in self._writers.values():
+                writer.close()
+            for sink in self._sinks:
+                sink.close()
+            if self._jsonl:
+                self._jsonl.close()
+            self._jsonl, self._writers, self._sinks = None, {}, []
+
+    def close(self):
+        """Finish the export: move the .partial files over the final paths."""
+        self._close_files()
+        for path in self.paths.values():
+            os.replace(path + self.PARTIAL_SUFFIX, path)
+
+    def abort(self):
+        """Stop writing but keep the .partial files on disk."""
+        try:
+            self._close_files()
+        except (OSError, ValueError) as e:  # pyarrow's errors derive from these
+            print(f"Error closing partial typed export files: {e}")
+
+    def discard(self):
+        """Stop writing and remove the .partial files."""
+        self.abort()
+        for path in self.paths.values():
+            if os.path.exists(path + self.PARTIAL_SUFFIX):
+                os.remove(path + self.PARTIAL_SUFFIX)
+
+
+# --- Placements Store ---
+# Every run's rows also go into one SQLite database, so results can be queried
+# across runs and producers without rerunning anything: one row per song
+# (credits and IDs), its producers and labels, and a stream/view snapshot per run.
+STORE_ID_FIELDS = ["Artist", "Title", "Genius Song ID", "Spotify Track ID"]
+# Sort keys accepted by PlacementStore.placements()
+STORE_SORT_COLUMNS = {
+    'daily_streams': 'snap.daily_streams', 'total_streams': 'snap.total_streams',
+    'youtube_views': 'snap.youtube_views', 'artist': 's.artist', 'title': 's.title',
+    'label': 's.label', 'last_seen': 's.last_seen',
+}
+
+
+def placement_key(record):
+    """Identity of a song across runs and sources: Genius ID, else Spotify track ID, else 'artist|title'."""
+    if record.genius_song_id:
+        return f"genius:{record.genius_song_id}"
+    if record.spotify_track_id:
+        return f"spotify:{record.spotify_track_id}"
+    return "manual:" + f"{record.artist or ''}|{record.title or ''}".casefold()
+
+def _store_int(value):
+    # Rows from a resumed journal or read back from a CSV may hold "1,234"
+    if value is None or value == '':
+        return None
+    try:
+        return int(str(value).replace(',', ''))
+    except ValueError:
+        return None
+
+
+class PlacementStore:
+    """
+    Persistent SQLite history of every run's output, indexed on producer, label,
+    artist and Spotify track ID, plus each track's full stream-count history. Writes are best-effort: a failure is printed and
+    never stops a run.
+    """
+    def __init__(self, path, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._conn = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Opened lazily so importing the module never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id INTEGER PRIMARY KEY, source TEXT, name TEXT, started REAL NOT NULL, finished REAL, songs INTEGER);"
+                "CREATE TABLE IF NOT EXISTS songs ("
+                " key TEXT PRIMARY KEY, artist TEXT, title TEXT, actual_track_name TEXT, producers TEXT, label TEXT,"
+                " phonographic_copyright TEXT, copyright TEXT, genius_song_id INTEGER, track_id TEXT,"
+                " youtube_url TEXT, youtube_video_id TEXT, first_seen REAL NOT NULL, last_seen REAL NOT NULL,"
+                " last_run INTEGER);"
+                "CREATE TABLE IF NOT EXISTS song_producers ("
+                " song_key TEXT NOT NULL, producer TEXT NOT NULL COLLATE NOCASE, PRIMARY KEY (song_key, producer));"
+                "CREATE TABLE IF NOT EXISTS song_labels ("
+                " song_key TEXT NOT NULL, label TEXT NOT NULL COLLATE NOCASE, PRIMARY KEY (song_key, label));"
+                "CREATE TABLE IF NOT EXISTS stream_history ("
+                " track_id TEXT PRIMARY KEY, first_day INTEGER NOT NULL, counts BLOB NOT NULL, updated REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " song_key TEXT NOT NULL, run_id INTEGER NOT NULL, taken REAL NOT NULL,"
+                " total_streams INTEGER, daily_streams INTEGER, youtube_views INTEGER, PRIMARY KEY (song_key, run_id));"
+                "CREATE INDEX IF NOT EXISTS idx_song_producers_producer ON song_producers (producer);"
+                "CREATE INDEX IF NOT EXISTS idx_song_labels_label ON song_labels (label);"
+                "CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs (artist COLLATE NOCASE);"
+                "CREATE INDEX IF NOT EXISTS idx_songs_track_id ON songs (track_id);"
+                "CREATE INDEX IF NOT EXISTS idx_snapshots_run ON snapshots (run_id);"
+                "CREATE INDEX IF NOT EXISTS idx_runs_source ON runs (source);"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def configure(self, settings):
+        """Apply a [store] table from secret.toml: enabled, path."""
+        settings = settings or {}
+        with self._lock:
+            if 'enabled' in settings:
+                self.enabled = bool(settings['enabled'])
+            path = os.path.expanduser(settings['path']) if settings.get('path') else None
+            if path and path != self.path:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                self.path = path
+
+    # -- Writing runs --
+    def start_run(self, source, name=None):
+        """Register a run and return its ID (None if the store is off or unavailable)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            try:
+                conn = self._connect()
+                cursor = conn.execute("INSERT INTO runs (source, name, started) VALUES (?, ?, ?)",
+                                      (source, name, time.time()))
+                conn.commit()
+                return cursor.lastrowid
+            except sqlite3.Error as e:
+                print(f"Placements store unavailable: {e}")
+                return None
+
+    def record(self, run_id, row):
+        """Upsert a song from one output row (a SongRecord) and add its stream/view snapshot for `run_id`."""
+        if run_id is None:
+            return
+        key = placement_key(row)
+        artist, title = row.artist, row.title
+        if not (artist or title):
+            # Rows journaled before the ID fields existed
+            artist, _, title = (row.artist_title or '').partition(" - ")
+        youtube_url = row.youtube_url
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connect()
+                values = (artist, title, row.actual_track_name, row.co_producers, row.label,
+                          row.phonographic_copyright, row.copyright, row.genius_song_id,
+                          row.spotify_track_id, youtube_url,
+                          extract_youtube_video_id(youtube_url) if youtube_url else None, now, run_id)
+                # UPDATE then INSERT rather than an upsert, which needs SQLite 3.24
+                updated = conn.execute(
+                    "UPDATE songs SET artist = ?, title = ?, actual_track_name = ?, producers = ?, label = ?,"
+                    " phonographic_copyright = ?, copyright = ?, genius_song_id = COALESCE(?, genius_song_id),"
+                    " track_id = COALESCE(?, track_id), youtube_url = ?, youtube_video_id = ?, last_seen = ?,"
+                    " last_run = ? WHERE key = ?", values + (key,)).rowcount
+                if not updated:
+                    conn.execute(
+                        "INSERT INTO songs (artist, title, actual_track_name, producers, label, phonographic_copyright,"
+                        " copyright, genius_song_id, track_id, youtube_url, youtube_video_id, last_seen, last_run,"
+                        " key, first_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values + (key, now))
+                conn.execute("DELETE FROM song_producers WHERE song_key = ?", (key,))
+                conn.executemany("INSERT OR IGNORE INTO song_producers (song_key, producer) VALUES (?, ?)",
+                                 [(key, name.strip()) for name in (row.co_producers or '').split(',') if name.strip()])
+                conn.execute("DELETE FROM song_labels WHERE song_key = ?", (key,))
+                conn.executemany("INSERT OR IGNORE INTO song_labels (song_key, label) VALUES (?, ?)",
+                                 [(key, name.strip()) for name in (row.label or '').split('&') if name.strip()])
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (song_key, run_id, taken, total_streams, daily_streams, youtube_views)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, run_id, now, _store_int(row.total_streams), _store_int(row.daily_streams),
+                     _store_int(row.youtube_views)))
+                # Committed in batches; finish_run() commits the rest
+                self._pending += 1
+                if self._pending >= 200:
+                    conn.commit()
+                    self._pending = 0
+            except sqlite3.Error as e:
+                print(f"Placements store write failed for {key}: {e}")
+
+    def finish_run(self, run_id, songs):
+        """Mark a run complete with the number of songs it recorded."""
+        if run_id is None:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.execute("UPDATE runs SET finished = ?, songs = ? WHERE id = ?", (time.time(), songs, run_id))
+                conn.commit()
+                self._pending = 0
+            except sqlite3.Error as e:
+                print(f"Placements store write failed for run {run_id}: {e}")
+
+    def flush(self):
+        """Commit recorded rows of a run that will not finish (e.g. it failed)."""
+        with self._lock:
+            if self._conn is not None and self._pending:
+                try:
+                    self._conn.commit()
+                    self._pending = 0
+                except sqlite3.Error as e:
+                    print(f"Placements store write failed: {e}")
+
+    def add_stream_history(self, track_id, series):
+        """
+        Merge a freshly fetched (first_day, counts) series into the track's saved one,
+        stored as a little-endian int64 array. Committed in batches, like record().
+        """
+        if not self.enabled or numpy is None:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                saved = conn.execute("SELECT first_day, counts FROM stream_history WHERE track_id = ?",
+                                     (track_id,)).fetchone()
+                if saved:
+                    saved = (saved[0], numpy.frombuffer(saved[1], dtype='<i8').astype(numpy.int64))
+                first_day, counts = merge_stream_series(saved, series)
+                conn.execute(
+                    "INSERT OR REPLACE INTO stream_history (track_id, first_day, counts, updated) VALUES (?, ?, ?, ?)",
+                    (track_id, first_day, counts.astype('<i8').tobytes(), time.time()))
+                self._pending += 1
+                if self._pending >= 200:
+                    conn.commit()
+                    self._pending = 0
+            except sqlite3.Error as e:
+                print(f"Placements store write failed for stream history of {track_id}: {e}")
+
+    def load_stream_histories(self, track_ids):
+        """Saved (first_day, counts) series for the given track IDs that have one."""
+        if not self.enabled or numpy is None:
+            return {}
+        series = {}
+        with self._lock:
+            try:
+                conn = self._connect()
+                # Stay under SQLite's limit on query parameters
+                for start in range(0, len(track_ids), 500):
+                    chunk = track_ids[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT track_id, first_day, counts FROM stream_history"
+                        f" WHERE track_id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+                    for track_id, first_day, counts in rows:
+                        series[track_id] = (first_day, numpy.frombuffer(counts, dtype='<i8').astype(numpy.int64))
+            except sqlite3.Error as e:
+                print(f"Placements store read failed for stream history: {e}")
+        return series
+
+    # -- Queries --
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._connect().execute(sql, params).fetchall()]
+
+    def placements(self, producer=None, label=None, artist=None, track_id=None, source=None,
+                   sort='daily_streams', descending=True, limit=None):
+        """
+        Songs with their latest snapshot, e.g. placements(label="Republic") for every
+        placement on that label by daily streams. `producer`, `label` and `artist` match
+        a whole name, ignoring case; `source` keeps the songs of that URL's latest run.
+        """
+        if sort not in STORE_SORT_COLUMNS:
+            raise ValueError(f"sort must be one of {', '.join(STORE_SORT_COLUMNS)}")
+        where, params = [], []
+        if producer:
+            where.append("s.key IN (SELECT song_key FROM song_producers WHERE producer = ?)")
+            params.append(producer)
+        if label:
+            where.append("s.key IN (SELECT song_key FROM song_labels WHERE label = ?)")
+            params.append(label)
+        if artist:
+            where.append("s.artist = ? COLLATE NOCASE")
+            params.append(artist)
+        if track_id:
+            where.append("s.track_id = ?")
+            params.append(track_id)
+        if source:
+            where.append("s.key IN (SELECT song_key FROM snapshots WHERE run_id ="
+                         " (SELECT MAX(id) FROM runs WHERE source = ? AND finished IS NOT NULL))")
+            params.append(source)
+        column = STORE_SORT_COLUMNS[sort]
+        sql = ("SELECT s.*, snap.total_streams, snap.daily_streams, snap.youtube_views, snap.taken"
+               " FROM songs s LEFT JOIN snapshots snap ON snap.song_key = s.key AND snap.run_id = s.last_run"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + f" ORDER BY {column} IS NULL, {column} {'DESC' if descending else 'ASC'}, s.key")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self._query(sql, params)
+
+    def history(self, key):
+        """Every snapshot of one song (placement_key()), oldest first."""
+        return self._query("SELECT run_id, taken, total_streams, daily_streams, youtube_views FROM snapshots"
+                           " WHERE song_key = ? ORDER BY taken", (key,))
+
+    def runs(self, limit=None):
+        """Recorded runs, newest first."""
+        sql = "SELECT * FROM runs ORDER BY id DESC"
+        return self._query(sql + " LIMIT ?", (int(limit),)) if limit else self._query(sql)
+
+    def refresh_state(self, source):
+        """
+        The songs of `source`'s latest finished run in the shape of RunJournal.load(), so
+        track_placements(refresh_state=...) can refresh their metrics without a journal.
+        Returns None if the store has no run of `source`.
+        """
+        if not self.enabled:
+            return None
+        try:
+            rows = self.placements(source=source, sort='title', descending=False)
+        except sqlite3.Error as e:
+            print(f"Placements store read failed: {e}")
+            return None
+        songs = {}
+        for row in rows:
+            credits = {
+                "song_name": row['title'], "artist_name": row['artist'], "co-producers": row['producers'],
+                "label": row['label'], "copyright": row['copyright'],
+                "phonographic_copyright": row['phonographic_copyright'], "youtube_url": row['youtube_url'],
+                "spotify_track_id": row['track_id'], "genius_song_id": row['genius_song_id'],
+            }
+            if row['genius_song_id']:
+                song_data = {'song_id': row['genius_song_id']}
+            else:
+                song_data = {'song_name': row['title'], 'artist_name': row['artist']}
+            stages = {'credits': credits}
+            if row['track_id']:
+                stages['track'] = {'track_id': row['track_id'], 'actual_track_name': row['actual_track_name']}
+            songs[row['key']] = {'song': song_data, 'stages': stages, 'result': None, 'error': None}
+        return {'params': None, 'songs': songs, 'listing_complete': True, 'finished': True} if songs else None
+
+
+# Shared by every run; see the [store] table in secret.toml
+placement_store = PlacementStore(os.path.join(get_data_dir(), 'placements.sqlite3'))
+
+
+# --- Stream History Analytics ---
+# RapidAPI returns each track's whole cumulative stream-count history. It is kept
+# as one int64 array per track on a daily grid (first_day = days since
+# 1970-01-01, missing days = -1) and saved in the placements store. At the end of
+# a run, rolling averages, growth and anomaly flags are computed for every track
+# at once with NumPy and exported as "<name> - Trends.csv".
+MISSING_STREAMS = -1
+TREND_LOOKBACK_DAYS = 56  # two 28-day windows
+ANOMALY_Z_SCORE = 3.0
+TRENDS_FIELDNAMES = ["Artist & Title", "Spotify Track ID", "As Of", "Days of History", "Total Spotify Streams",
+                     "Latest Daily Streams", "7-Day Avg Daily Streams", "28-Day Avg Daily Streams",
+                     "7-Day Growth", "28-Day Growth", "Anomaly"]
+
+
+def parse_stream_history(history_json):
+    """
+    RapidAPI history list -> (first_day, counts) on a daily grid, or None if NumPy is
+    missing or the history has no usable points. Undated points count back from today.
+    """
+    if numpy is None or not history_json or not isinstance(history_json, list):
+        return None
+    points = [point for point in history_json if isinstance(point, dict)]
+    try:
+        counts = numpy.array([str(point.get('streams', '')).replace(',', '') for point in points]).astype(numpy.int64)
+    except ValueError:
+        return None
+    try:
+        days = numpy.array([str(point.get('date'))[:10] for point in points], dtype='datetime64[D]').astype(numpy.int64)
+    except ValueError:
+        today = numpy.datetime64('today', 'D').astype(numpy.int64)
+        days = numpy.arange(today - len(counts) + 1, today + 1, dtype=numpy.int64)
+    if not len(counts):
+        return None
+    order = numpy.argsort(days, kind='stable')
+    days, counts = days[order], counts[order]
+    grid = numpy.full(int(days[-1] - days[0]) + 1, MISSING_STREAMS, dtype=numpy.int64)
+    grid[days - days[0]] = counts  # a repeated date keeps its last value
+    return int(days[0]), grid
+
+def merge_stream_series(old, new):
+    """Combine two (first_day, counts) series; `new` wins on days both have."""
+    if old is None:
+        return new
+    if new is None:
+        return old
+    first = min(old[0], new[0])
+    last = max(old[0] + len(old[1]), new[0] + len(new[1]))
+    grid = numpy.full(last - first, MISSING_STREAMS, dtype=numpy.int64)
+    for start, counts in (old, new):
+        window = grid[start - first:start - first + len(counts)]
+        present = counts != MISSING_STREAMS
+        window[present] = counts[present]
+    return first, grid
+
+
+class StreamHistories:
+    """
+    Stream-count series fetched during the current run, by Spotify track ID. Thread-safe.
+    Each series also goes to `store` as it arrives, so an interrupted run keeps it.
+    """
+    def __init__(self, store=None):
+        self.store = store
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def add(self, track_id, history_json):
+        series = parse_stream_history(history_json)
+        if series is not None:
+            with self._lock:
+                self._series[track_id] = series
+            if self.store is not None:
+                self.store.add_stream_history(track_id, series)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._series)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+stream_histories = StreamHistories(placement_store)
+
+
+def fetch_stream_histories(session, track_ids, api_key, max_workers=10):
+    """
+    Fetch the RapidAPI history of tracks that got their row without one (e.g. finished
+    before a resume) into stream_histories. Cached responses are reused.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda track_id: get_rapidapi_stream_data(session, track_id, api_key), track_ids))
+
+
+def stream_trends(series):
+    """
+    Trend figures for many tracks at once from {track_id: (first_day, counts)}:
+    {track_id: {'as_of', 'days', 'total', 'latest_daily', 'avg_7', 'avg_28',
+    'growth_7', 'growth_28', 'z_score', 'anomaly'}}. Averages are taken between
+    cumulative counts, so a missing day in between does not skew them; a figure
+    lacking enough history is None. 'anomaly' is 'spike' or 'drop' when the latest
+    day is ANOMALY_Z_SCORE deviations from the (at least 7 known) days before it.
+    """
+    track_ids = list(series)
+    if numpy is None or not track_ids:
+        return {}
+    width = TREND_LOOKBACK_DAYS + 1
+    # Right-align each track's last `width` days; days before its history are NaN
+    matrix = numpy.full((len(track_ids), width), numpy.nan)
+    for row, track_id in enumerate(track_ids):
+        tail = series[track_id][1][-width:]
+        matrix[row, width - len(tail):] = tail
+    matrix[matrix == MISSING_STREAMS] = numpy.nan
+
+    # Forward-fill gaps along each row
+    present = ~numpy.isnan(matrix)
+    index = numpy.where(present, numpy.arange(width), 0)
+    numpy.maximum.accumulate(index, axis=1, out=index)
+    filled = matrix[numpy.arange(len(track_ids))[:, None], index]
+    filled[~numpy.maximum.accumulate(present, axis=1)] = numpy.nan
+
+    latest = filled[:, -1]
+    def back(days):
+        return filled[:, -1 - days]
+    # A daily figure is only known if both of its days were reported
+    daily = numpy.diff(matrix[:, -29:], axis=1)
+    baseline = daily[:, :-1]
+    known = numpy.count_nonzero(~numpy.isnan(baseline), axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN rows in nanmean/nanstd
+        avg_7 = (latest - back(7)) / 7
+        avg_28 = (latest - back(28)) / 28
+        prior_7 = (back(7) - back(14)) / 7
+        prior_28 = (back(28) - back(56)) / 28
+        growth_7 = numpy.where(prior_7 > 0, avg_7 / prior_7 - 1, numpy.nan)
+        growth_28 = numpy.where(prior_28 > 0, avg_28 / prior_28 - 1, numpy.nan)
+        spread = numpy.nanstd(baseline, axis=1)
+        z_score = (daily[:, -1] - numpy.nanmean(baseline, axis=1)) / spread
+    z_score[(known < 7) | (spread == 0)] = numpy.nan
+    anomaly = numpy.where(z_score >= ANOMALY_Z_SCORE, 'spike', numpy.where(z_score <= -ANOMALY_Z_SCORE, 'drop', ''))
+    as_of = numpy.array([first_day + len(counts) - 1 for first_day, counts in series.values()], dtype='datetime64[D]')
+    days = [int(numpy.count_nonzero(counts != MISSING_STREAMS)) for _, counts in series.values()]
+
+    # One conversion per column; NaN (x != x) becomes None
+    columns = {
+        'total': latest, 'latest_daily': daily[:, -1], 'avg_7': avg_7, 'avg_28': avg_28,
+        'growth_7': growth_7, 'growth_28': growth_28, 'z_score': z_score,
+    }
+    columns = {name: [None if x != x else x for x in values.tolist()] for name, values in columns.items()}
+    for name in ('total', 'latest_daily'):
+        columns[name] = [None if x is None else int(x) for x in columns[name]]
+    columns.update(as_of=as_of.astype(str).tolist(), days=days,
+                   anomaly=[flag or None for flag in anomaly.tolist()])
+    return {track_id: {name: values[row] for name, values in columns.items()}
+            for row, track_id in enumerate(track_ids)}
+
+def format_trend_row(name, track_id, trend):
+    """Trends CSV row: numbers get thousands separators, growth is a percentage, None becomes ''."""
+    def number(x):
+        return f"{round(x):,}" if x is not None else ""
+    def percent(x):
+        return f"{x:+.1%}" if x is not None else ""
+    return {
+        "Artist & Title": name,
+        "Spotify Track ID": track_id,
+        "As Of": trend['as_of'],
+        "Days of History": trend['days'],
+        "Total Spotify Streams": number(trend['total']),
+        "Latest Daily Streams": number(trend['latest_daily']),
+        "7-Day Avg Daily Streams": number(trend['avg_7']),
+        "28-Day Avg Daily Streams": number(trend['avg_28']),
+        "7-Day Growth": percent(trend['growth_7']),
+        "28-Day Growth": percent(trend['growth_28']),
+        "Anomaly": trend['anomaly'] or "",
+    }
+
+def trends_csv_path(save_dir, file_name):
+    return os.path.join(save_dir, f"{file_name} - Trends.csv")
+
+def export_stream_trends(path, tracks, store=None, fetch_missing=None):
+    """
+    Compute trends for `tracks` ({track_id: "Artist & Title"}) from this run's
+    stream_histories, merged with the store's saved series, and write them to `path`.
+    `fetch_missing(track_ids)`, if given, is called first with the tracks that have
+    no series either way and may add theirs to stream_histories.
+    Returns the number of rows written, or None if NumPy is missing.
+    """
+    if numpy is None:
+        return None
+    if not tracks:
+        return 0
+    saved = store.load_stream_histories(list(tracks)) if store is not None else {}
+    fetched = stream_histories.snapshot()
+    missing = [track_id for track_id in tracks if track_id not in fetched and track_id not in saved]
+    if fetch_missing and missing:
+        fetch_missing(missing)
+        fetched = stream_histories.snapshot()
+    fetched = {track_id: s for track_id, s in fetched.items() if track_id in tracks}
+    series = {track_id: merge_stream_series(saved.get(track_id), fetched.get(track_id))
+              for track_id in set(saved) | set(fetched)}
+    trends = stream_trends(series)
+    if not trends:
+        return 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=TRENDS_FIELDNAMES)
+        writer.writeheader()
+        for track_id, name in tracks.items():
+            if track_id in trends:
+                writer.writerow(format_trend_row(name, track_id, trends[track_id]))
+    return len(trends)
+
+
+# --- Placement Tracking API ---
+# GUI-free entry point: track_placements() lists a source, runs it through one
+# of the engines and yields a PlacementResult per song as it completes. The Tk
+# app and the headless runner are thin clients of it.
+REQUIRED_SECRETS = {'spotify_client_id', 'spotify_client_secret', 'genius_token', 'youtube_api_key', 'rapidapi_key'}
+ENGINES = ('pipeline', 'threads', 'asyncio')
+
+
+def read_secrets(config_path):
+    """
+    Load secret.toml and apply its [rate_limits], [http], [adaptive_concurrency],
+    [cache], [metrics], [endpoints], [sheets] and [store] settings. Raises ValueError if a
+    required key is missing.
+    """
+    with open(config_path, 'rb') as f:
+        secrets = tomli.load(f)
+    if not REQUIRED_SECRETS.issubset(secrets):
+        raise ValueError(f"secret.toml is missing one or more required keys: {REQUIRED_SECRETS - set(secrets)}")
+    rate_limiter.configure_from(secrets.get('rate_limits'))
+    http_settings.configure(secrets.get('http'))
+    concurrency_limiter.configure_from(secrets.get('adaptive_concurrency'))
+    response_cache.configure(secrets.get('cache'))
+    endpoint_metrics.configure(secrets.get('metrics'))
+    configure_endpoints(**(secrets.get('endpoints') or {}))
+    sheets_service.configure(secrets.get('sheets'))
+    placement_store.configure(secrets.get('store'))
+    return secrets
+
+
+def configure_endpoints(base_url=None, record=None):
+    """Send provider requests to `base_url` (e.g. mock_providers.py) and/or record responses to a cassette."""
+    if base_url:
+        endpoint_router.configure(base_url)
+    if record:
+        cassette_recorder.start(os.path.expanduser(record))
+
+
+class ProgressEvent(NamedTuple):
+    """Progress report passed to track_placements()'s `on_progress` callback."""
+    kind: str            # 'log', 'listing' (the song list is ready or streaming) or 'song' (one finished)
+    message: str
+    level: str = "info"  # 'info', 'success' or 'error'
+    done: int = 0        # songs finished so far
+    total: int = 0       # current estimate of the number of songs
+
+
+class PlacementResult(NamedTuple):
+    """One finished song: its work item, its output row (None if no data was found) and any error."""
+    song: dict
+    row: Optional[SongRecord]
+    error: Optional[Exception] = None
+    resumed: bool = False  # finished by an earlier, interrupted run (from the journal)
+
+    @property
+    def ok(self):
+        return self.error is None and self.row is not None
+
+
+def list_songs(session, source, spotify_token, genius_token, limit=None, prefetch_pages=GENIUS_PREFETCH_PAGES):
+    """
+    Work items for `source`: a Genius artist, Spotify playlist or Spotify album
+    URL, or 'Song - Artist' lines. Genius listings are lazy and arrive page by page.
+    """
+    source = source.strip()
+    if source.startswith(('http://', 'https://')):
+        if 'genius.com' in source:
+            song_ids = iter_songs_from_genius_producer_api(session, source, limit, genius_token, prefetch_pages)
+            # Lazily yield dicts with just the ID, so processing starts with the first page
+            return ({'song_id': sid} for sid in song_ids)
+        elif 'spotify.com/playlist/' in source:
+            return get_songs_from_spotify_playlist(session, source, limit, spotify_token)
+        elif 'spotify.com/album/' in source:
+            return get_songs_from_spotify_album(session, source, limit, spotify_token)
+        return []
+    return parse_manual_input(source)
+
+def process_single_song(session, song_data, spotify_token, genius_token, youtube_key, rapidapi_key,
+                          youtube_batcher=None, journal=None, fresh=False):
+    """
+    Processes a single song: fetches all its data from various APIs.
+    This function is designed to be run in a thread (see run_thread_pool()).
+    `song_data` is a dictionary that must contain either 'song_id' (from Genius)
+    or both 'song_name' and 'artist_name'. Stages already in its 'checkpoint'
+    (a resumed run) are not fetched again; new ones are recorded in `journal`.
+    """
+    # --- Get base song info (credits, artist, title) ---
+    credits = stage_checkpoint(song_data, 'credits')
+    if credits is None:
+        credits = resolve_song_credits(session, song_data, genius_token)
+        if credits.get('song_name'):
+            record_stage(journal, song_data, 'credits', credits)
+    if not credits.get('song_name'):
+         # If we couldn't get credits, we can't proceed with this song
+        return None
+
+    song_name = credits['song_name']
+    artist_name = credits['artist_name']
+
+    # --- Get Spotify Track ID and Actual Name (search only if Genius/input didn't give one) ---
+    actual_track_name = song_name
+    track = stage_checkpoint(song_data, 'track')
+    if track:
+        track_id, actual_track_name = track['track_id'], track['actual_track_name']
+    else:
+        track_id, source = known_track_id(song_data, credits)
+        if not track_id:
+            track_id, actual_track_name = get_spotify_track_id(session, song_name, artist_name, spotify_token)
+            source = 'spotify_search' if track_id else 'not_found'
+            if track_id:
+                record_stage(journal, song_data, 'track', {'track_id': track_id, 'actual_track_name': actual_track_name})
+        track_id_sources.increment(source)
+
+    # --- Get Stream Data ---
+    stream_stats = stage_checkpoint(song_data, 'streams') or {"stream_count": None, "change_in_streams": None}
+    if track_id and not stage_checkpoint(song_data, 'streams'):
+        stream_data = get_rapidapi_stream_data(session, track_id, rapidapi_key, fresh)
+        if stream_data:
+            stream_stats = calculate_stream_stats(stream_data)
+            record_stage(journal, song_data, 'streams', stream_stats)
+
+    # --- Get YouTube Views ---
+    youtube_views = None
+    youtube = stage_checkpoint(song_data, 'youtube')
+    if youtube:
+        youtube_views = youtube['youtube_views']
+    elif credits.get('youtube_url'):
+        if youtube_batcher:
+            youtube_views = youtube_batcher.get(credits['youtube_url'])
+        else:
+            youtube_views = get_youtube_view_count(session, credits['youtube_url'], youtube_key, fresh)
+        if youtube_views is not None:
+            record_stage(journal, song_data, 'youtube', {'youtube_views': youtube_views})
+
+    # --- Assemble final result ---
+    return build_song_result(credits, actual_track_name, stream_stats, youtube_views, track_id)
+
+
+def run_thread_pool(session, songs, tokens, max_workers=10, journal=None, window=None, fresh=False):
+    """
+    Original engine: one task per song runs every API call in sequence. Yields
+    (song_data, result, error). A feeder thread pulls songs lazily and keeps at
+    most `window` tasks (default THREAD_POOL_WINDOW_FACTOR x max_workers) queued
+    or running, so memory stays flat for any catalog size and processing
+    overlaps with a listing that is still arriving.
+    """
+    window = max(max_workers, window or max_workers * THREAD_POOL_WINDOW_FACTOR)
+    youtube_batcher = YouTubeViewBatcher(session, tokens[2], fresh=fresh)
+    slots = threading.BoundedSemaphore(window)
+    finished = queue.Queue()
+    stop = threading.Event()
+    feed_done = object()
+    feed_error = []
+
+    def feed(executor):
+        count = 0
+        try:
+            for song_data in songs:
+                slots.acquire()
+                if stop.is_set():
+                    break
+                future = executor.submit(process_single_song, session, song_data, *tokens,
+                                         youtube_batcher=youtube_batcher, journal=journal, fresh=fresh)
+                # Hand each future over as it completes; nothing else keeps a reference to it
+                future.add_done_callback(lambda f, song_data=song_data: finished.put((song_data, f)))
+                count += 1
+        except Exception as exc:
+            # Surfaced once the songs already submitted have finished
+            feed_error.append(exc)
+        finally:
+            if stop.is_set():
+                close_songs(songs)
+            finished.put((feed_done, count))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        threading.Thread(target=feed, args=(executor,), name="thread-pool-feed", daemon=True).start()
+        try:
+            done, total = 0, None
+            while total is None or done < total:
+                song_data, future = finished.get()
+                if song_data is feed_done:
+                    total = future
+                    continue
+                done += 1
+                slots.release()
+                try:
+                    yield song_data, future.result(), None
+                except Exception as exc:
+                    yield song_data, None, exc
+            if feed_error:
+                raise feed_error[0]
+        finally:
+            # If the caller stops early, let the feeder exit and drop queued songs
+            stop.set()
+            try:
+                slots.release()
+            except ValueError:
+                pass
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def run_pipeline(session, songs, tokens, stage_workers=None, queue_size=None, journal=None, log=print, fresh=False):
+    """Staged engine: per-provider queues and worker pools. Yields (song_data, result, error)."""
+    pipeline = SongPipeline(session, *tokens, stage_workers=stage_workers,
+                            queue_size=queue_size or DEFAULT_STAGE_QUEUE_SIZE, journal=journal, fresh=fresh)
+    log("Pipeline workers: " + ", ".join(f"{s.name}={s.workers}" for s in pipeline.stages.values()))
+    yield from pipeline.run(songs, report=lambda stats: log("Stages - " + format_stage_stats(stats)))
+    log("Stage summary - " + format_stage_stats(pipeline.stats()))
+
+
+def track_placements(source, credentials, engine='pipeline', limit=None, max_workers=10, session=None,
+                     on_progress=None, journal=None, resume_state=None, stage_workers=None,
+                     stage_queue_size=None, async_concurrency=None, genius_prefetch_pages=None,
+                     adaptive=False, limits_log_interval=5.0, refresh_state=None):
+    """
+    Track every song in `source` and yield a PlacementResult as each one completes.
+
+    `source` is a Genius/Spotify URL, 'Song - Artist' lines, or an iterable of
+    song_data dicts. `credentials` holds the secret.toml keys. `on_progress`,
+    if given, receives ProgressEvents. Requests go through the keep-alive
+    shared_session() unless a `session` is passed. Pass a started RunJournal as `journal` to
+    checkpoint the run. With `resume_state` (from RunJournal.load()), rows that
+    are already finished are yielded first and the remaining songs resume
+    from their last completed stage. With `refresh_state` (a finished run's journal), `source` is
+    ignored: that run's songs are tracked again, reusing their credits and Spotify track IDs and
+    fetching only stream counts and YouTube views, live rather than from the response cache. With `adaptive`, in-flight requests per
+    provider start at `max_workers` and are tuned by concurrency_limiter.
+    Raises ValueError if the source has no songs.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'; expected one of {', '.join(ENGINES)}.")
+    report = on_progress or (lambda event: None)
+
+    def log(message, level="info"):
+        report(ProgressEvent('log', message, level))
+
+    if adaptive:
+        # Pools are sized to the ceiling; the per-provider limits decide how much of it is used
+        concurrency_limiter.start(max_workers)
+        log(f"Adaptive concurrency: providers start at {max_workers} requests in flight, "
+            f"up to {concurrency_limiter.max_concurrency()}.")
+        max_workers = concurrency_limiter.max_concurrency()
+    if session is None:
+        # Enough keep-alive connections per host for every worker plus the listing prefetch
+        pool_size = max([max_workers] + list((stage_workers or {}).values()))
+        session = shared_session(pool_size + (genius_prefetch_pages or GENIUS_PREFETCH_PAGES))
+    try:
+        log("Authenticating with Spotify...")
+        spotify_token = get_spotify_access_token(session, credentials['spotify_client_id'], credentials['spotify_client_secret'])
+        tokens = (spotify_token, credentials['genius_token'], credentials['youtube_api_key'], credentials['rapidapi_key'])
+        log("Authentication successful.", "success")
+
+        log("Fetching initial song list...")
+        prior_results = []
+
+        def fresh_listing():
+            return list_songs(session, source, spotify_token, tokens[1], limit,
+                              genius_prefetch_pages or GENIUS_PREFETCH_PAGES)
+
+        if resume_state:
+            # Songs finished before the interruption come from the journal;
+            # the rest resume from their last completed stage
+            prior_results = resumed_results(resume_state)
+            listing = None
+            # An iterable source was consumed by the interrupted run; only URLs and text can be listed again
+            if not resume_state['listing_complete'] and isinstance(source, str):
+                log("The previous listing was incomplete; listing the source again...")
+                listing = fresh_listing()
+            song_list = resumable_songs(resume_state, listing)
+            log(f"Resuming: {len(prior_results)} songs already done.", "success")
+        elif refresh_state:
+            song_list = refresh_songs(refresh_state)
+            if not song_list:
+                raise ValueError("The previous run has no songs to refresh.")
+            log(f"Refreshing stream counts and YouTube views for {len(song_list)} songs from the previous run.")
+        elif isinstance(source, str):
+            song_list = fresh_listing()
+        else:
+            song_list = source
+        on_item = journal.listed if journal else None
+        if journal and refresh_state:
+            # Journal the reused stages too, so this run can be resumed or refreshed in turn
+            on_item = lambda song_data: journal.listed(song_data, with_checkpoint=True)
+        # The listing is journaled as complete as soon as it runs out, so a resume doesn't list it again
+        songs = SongSource(song_list, expected=limit, on_item=on_item,
+                           on_exhausted=journal.listing_done if journal else None)
+        if songs.exhausted:
+            if not (songs.count or prior_results):
+                raise ValueError("No songs found from the provided input.")
+            report(ProgressEvent('listing', f"Found {songs.count} songs to process.", "success"))
+        else:
+            report(ProgressEvent('listing', "Processing songs as listing pages arrive..."))
+
+        # A refresh must see today's numbers, not the ones cached by the run it refreshes
+        fresh = bool(refresh_state)
+        done = 0
+        for row in prior_results:
+            done += 1
+            report(ProgressEvent('song', f"Processed {done}/{len(prior_results) + songs.total_estimate()} songs...",
+                                 done=done, total=len(prior_results) + songs.total_estimate()))
+            yield PlacementResult({}, row, None, resumed=True)
+
+        if engine == 'pipeline':
+            workers = default_stage_workers(max_workers)
+            workers.update(stage_workers or {})
+            completed = run_pipeline(session, songs, tokens, workers, stage_queue_size, journal, log, fresh)
+        elif engine == 'asyncio':
+            concurrency = async_concurrency or DEFAULT_ASYNC_CONCURRENCY
+            log(f"Asyncio engine: up to {concurrency} songs in flight.")
+            completed = run_async_engine(songs, tokens, concurrency, journal, fresh)
+        else:
+            completed = run_thread_pool(session, songs, tokens, max_workers, journal, fresh=fresh)
+
+        last_limits_log = time.monotonic()
+        for song_data, row, exc in completed:
+            if adaptive and time.monotonic() - last_limits_log >= limits_log_interval:
+                log("Adaptive limits - " + format_concurrency_limits(concurrency_limiter.snapshot()))
+                last_limits_log = time.monotonic()
+            if journal:
+                if exc is not None:
+                    journal.failed(song_data, exc)
+                elif row:
+                    journal.done(song_data, row)
+                else:
+                    journal.failed(song_data, "no data found")
+            done += 1
+            total = len(prior_results) + songs.total_estimate(at_least=done - len(prior_results))
+            report(ProgressEvent('song', f"Processed {done}/{total} songs...", done=done, total=total))
+            yield PlacementResult(song_data, row, exc)
+
+        if not (songs.count or prior_results):
+            raise ValueError("No songs found from the provided input.")
+    finally:
+        if adaptive:
+            log("Adaptive limits - " + format_concurrency_limits(concurrency_limiter.snapshot()))
+            concurrency_limiter.stop()
@@ -2,7 +2,6 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import csv
-import requests
 import os
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -10,9 +9,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
 import time
-import base64
 import json
 import gc
 import psutil
@@ -21,428 +18,363 @@ import sys
 import platform
 import subprocess
 import tomli
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import pickle
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
 import queue
 import threading
-
-# --- Global Configuration ---
-# Google Sheets API scope
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-# Global variable to track last API call time for rate limiting (thread-safe)
-last_api_call_time = 0
-api_call_lock = threading.Lock()
-
-
-# --- Path Management ---
-def get_resource_path(filename):
+import re
+import argparse
+from placement_core import (
+    CSV_FIELDNAMES_RAW, CSV_FIELDNAMES_SIMPLE, ENGINES, EXPORT_FORMATS, EndpointMetrics, RunJournal, StreamingCsvExporter,
+    TypedExporter, configure_endpoints, create_or_update_sheet, endpoint_metrics, export_csv_paths, export_stream_trends,
+    fetch_stream_histories, format_cache_stats, format_endpoint_metrics, format_result_row, format_track_id_sources,
+    format_transport_stats, get_data_dir, get_resource_path, journal_params, metrics_paths, placement_store, read_secrets,
+    response_cache, sheets_service, shared_session, simplified_row, stream_histories, sync_sheets, track_id_sources,
+    track_placements, transport_stats, trends_csv_path, typed_export_paths, write_metrics,
+)
+
+
+# --- Job Runner ---
+class JobRunner:
     """
-    Get the absolute path to a resource, works for dev and for PyInstaller.
-    This is crucial for ensuring the packaged app can find its files.
+    Runs one job (a params dict) end to end: listing, fetching and export.
+    Progress goes to params['gui_queue'], which only needs a put() method, so the
+    same code serves the Tk app and headless runs.
+    If `background_exporter` is set, each job's export is handed to it and
+    processing_worker() returns as soon as fetching is done.
     """
-    # For PyInstaller-created temporary folder
-    if hasattr(sys, '_MEIPASS'):
-        return os.path.join(sys._MEIPASS, filename)
-    
-    # For development (running as a .py script)
-    base_path = os.path.abspath(".")
-    return os.path.join(base_path, filename)
+    background_exporter = None
 
+    def processing_worker(self, params, session=None):
+        """
+        The main worker function that runs in a separate thread. Requests use
+        the shared keep-alive session unless `session` is given.
+        """
+        q = params['gui_queue']
+        response_cache.enabled = params.get('use_cache', True)
+        response_cache.reset_stats()
+        track_id_sources.reset()
+        transport_stats.reset()
+        endpoint_metrics.reset()
+        stream_histories.reset()
+        exporter = None
+        typed = None
+        resume_state = params.get('resume_state')
+        journal = RunJournal(params.get('journal_path'))
+        store_run = None
+        try:
+            journal.start(journal_params(params), resume=bool(resume_state))
+            store_run = placement_store.start_run(params['producer_url'] or params['manual_input'], params['file_name'])
+            results = []
+            exported = 0
+            tracks = {}  # Spotify track ID -> "Artist & Title", for the stream trends
+            unfetched = set()  # Tracks whose stream history was fetched by an interrupted run
+            if params.get('stream_export', True):
+                # Rows are appended to disk as they complete instead of collected in `results`
+                exporter = StreamingCsvExporter(*export_csv_paths(params['save_dir'], params['file_name'])).open()
+                q.put(("log", f"Writing rows to {exporter.raw_path}{exporter.PARTIAL_SUFFIX} as they complete."))
+            if params.get('export_formats'):
+                typed = self._open_typed_export(q, params)
+
+            placements = track_placements(
+                params['producer_url'] or params['manual_input'], params['credentials'],
+                engine=params.get('engine', 'pipeline'), limit=params['limit'], max_workers=params['max_workers'],
+                session=session, on_progress=lambda event: self._report_progress(q, event),
+                journal=journal, resume_state=resume_state,
+                stage_workers=params.get('stage_workers'), stage_queue_size=params.get('stage_queue_size'),
+                async_concurrency=params.get('async_concurrency'), genius_prefetch_pages=params.get('genius_prefetch_pages'),
+                adaptive=params.get('adaptive', False), refresh_state=params.get('refresh_state'))
+            for placement in placements:
+                if placement.error is not None:
+                    q.put(("log", f"Error processing '{placement.song.get('song_name')}': {placement.error}", "error"))
+                elif placement.row:
+                    placement_store.record(store_run, placement.row)
+                    if placement.row.spotify_track_id:
+                        tracks[placement.row.spotify_track_id] = placement.row.artist_title
+                        if placement.resumed or 'streams' in placement.song.get('checkpoint', {}):
+                            unfetched.add(placement.row.spotify_track_id)
+                    if typed:
+                        typed.write(placement.row)
+                    if exporter:
+                        exporter.write(placement.row)
+                    else:
+                        results.append(placement.row)
+                    exported += 1
+
+            q.put(("progress", 90))
+            q.put(("log", f"Finished processing. Found details for {exported} songs."))
+            placement_store.finish_run(store_run, exported)
+            response_cache.flush()
+            if store_run is not None:
+                q.put(("log", f"Recorded the results in the placements store (run {store_run})."))
+            if tracks:
+                # Before any hand-off: the next job resets stream_histories
+                self._export_trends(q, params, tracks, unfetched, session)
+            if typed and exported:
+                self._finish_typed_export(q, typed)
+            elif typed:
+                typed.discard()
+            q.put(("log", "Spotify track IDs: " + format_track_id_sources(track_id_sources.snapshot())))
+            if response_cache.enabled:
+                q.put(("log", "Response cache: " + format_cache_stats(response_cache.stats())))
+            q.put(("log", "Connections: " + format_transport_stats(transport_stats.snapshot())))
+
+            # Export results
+            if exported and self.background_exporter:
+                # The fetch metrics are taken now, before the next job resets them
+                self.background_exporter.submit(
+                    q, self._complete_export, params, exporter, results, exported, journal,
+                    endpoint_metrics.snapshot(response_cache.stats()))
+            elif exported:
+                self._complete_export(params, exporter, results, exported, journal)
+            else:
+                if exporter:
+                    exporter.discard()
+                self._report_metrics(q, params)
+                journal.finish()
+                q.put(("processing_error", "Processing finished, but no data could be exported."))
 
-# --- Google Sheets Integration ---
-def get_google_sheets_credentials():
-    """Get or refresh Google Sheets API credentials."""
-    creds = None
-    token_path = get_resource_path('token.pickle')
-    credentials_path = get_resource_path('credentials.json')
+        except Exception as e:
+            print(f"Error in processing worker: {e}")
+            journal.close()
+            placement_store.flush()
+            response_cache.flush()
+            q.put(("log", "Progress is saved in the run journal; use 'Resume Last Run' to continue.", "error"))
+            if typed and typed.rows:
+                typed.abort()
+            elif typed:
+                typed.discard()
+            if exporter and exporter.rows:
+                exporter.abort()
+                q.put(("log", f"Kept {exporter.rows} completed rows in {exporter.raw_path}{exporter.PARTIAL_SUFFIX}", "error"))
+            elif exporter:
+                exporter.discard()
+            self._report_metrics(q, params)
+            q.put(("processing_error", f"An unexpected error occurred: {e}"))
 
-    if os.path.exists(token_path):
+    def _complete_export(self, params, exporter, results, exported, journal, snapshot=None):
+        """
+        Write the CSVs (and Google Sheets), save the metrics, finish the journal and report success.
+        `snapshot` is given when this runs on the background exporter: its Sheets requests are then
+        measured apart from the next job's and merged into the snapshot.
+        """
+        q = params['gui_queue']
+        metrics = endpoint_metrics if snapshot is None else EndpointMetrics()
         try:
-            with open(token_path, 'rb') as token:
-                creds = pickle.load(token)
-        except (pickle.UnpicklingError, EOFError, FileNotFoundError) as e:
-            print(f"Could not load token.pickle: {e}. It will be regenerated.")
-            if os.path.exists(token_path):
-                os.remove(token_path)
-            creds = None
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Error refreshing credentials: {e}")
-                creds = None
-        
-        if not creds:
-            if not os.path.exists(credentials_path):
-                messagebox.showerror("Google Sheets Error", 
-                    "credentials.json not found. Please place it in the application directory.")
-                return None
-            
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
-                creds = flow.run_local_server(port=0)
-            except Exception as e:
-                messagebox.showerror("Google Sheets Auth Error", f"Failed to authenticate: {e}")
-                return None
-        
+            if exporter:
+                self._finish_streaming_export(exporter, params, metrics)
+            else:
+                self.export_results(results, params, metrics)
+        except Exception:
+            journal.close()
+            raise
+        q.put(("progress", 100))
+        if snapshot is not None:
+            snapshot.update(metrics.snapshot())
+        self._report_metrics(q, params, snapshot)
+        journal.finish()
+        q.put(("processing_done", f"Success! Exported {exported} songs."))
+
+    @staticmethod
+    def _open_typed_export(q, params):
+        """Start the JSON Lines / Parquet / Arrow files picked in params['export_formats']."""
+        paths = typed_export_paths(params['save_dir'], params['file_name'], params['export_formats'])
+        typed = TypedExporter(paths)
+        for fmt in typed.skipped:
+            q.put(("log", f"pyarrow is not installed; skipping the {fmt} export.", "error"))
+        return typed.open() if typed.paths else None
+
+    @staticmethod
+    def _finish_typed_export(q, typed):
         try:
-            with open(token_path, 'wb') as token:
-                pickle.dump(creds, token)
-        except IOError as e:
-            print(f"Error saving new token: {e}")
-    return creds
-
-def create_or_update_sheet(spreadsheet_id, sheet_name, data):
-    """Create or update a Google Sheet with data."""
-    if not data:
-        print(f"No data provided for sheet: {sheet_name}. Skipping update.")
-        return False
-    try:
-        creds = get_google_sheets_credentials()
-        if not creds:
-            print("Failed to get Google Sheets credentials")
-            return False
-            
-        service = build('sheets', 'v4', credentials=creds)
-        
-        headers = list(data[0].keys())
-        values = [headers] + [[row.get(header, '') for header in headers] for row in data]
-        
-        body = {'values': values}
-        
-        # Check if the sheet exists
-        sheet_metadata = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        sheets = sheet_metadata.get('sheets', '')
-        sheet_exists = any(s['properties']['title'] == sheet_name for s in sheets)
-
-        if not sheet_exists:
-            # Create the sheet if it doesn't exist
-            add_sheet_request = {'addSheet': {'properties': {'title': sheet_name}}}
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body={'requests': [add_sheet_request]}
-            ).execute()
-
-        # Clear existing data before writing new data
-        service.spreadsheets().values().clear(
-            spreadsheetId=spreadsheet_id,
-            range=f"'{sheet_name}'"
-        ).execute()
-
-        # Update the sheet with new data
-        result = service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"'{sheet_name}'!A1",
-            valueInputOption='RAW',
-            body=body
-        ).execute()
-        
-        print(f"Successfully updated Google Sheet: {sheet_name}")
-        return True
-        
-    except Exception as e:
-        print(f"Error updating Google Sheet: {e}")
-        return False
+            typed.close()
+        except (OSError, ValueError) as e:  # pyarrow's errors derive from these
+            q.put(("log", f"Error writing typed export: {e}", "error"))
+            return
+        for path in typed.paths.values():
+            q.put(("log", f"Saved typed data to {path}", "success"))
 
+    @staticmethod
+    def _export_trends(q, params, tracks, unfetched=(), session=None):
+        """
+        Compute stream trends for every track of the run at once and save them as '<name> - Trends.csv'.
+        Tracks in `unfetched` that have no saved history (the interrupted run didn't keep it) are fetched again.
+        """
+        path = trends_csv_path(params['save_dir'], params['file_name'])
 
-# --- Core Application Logic (API Calls & Scraping) ---
-def get_spotify_access_token(session, client_id, client_secret):
-    """Get the access token for the Spotify API using a session object."""
-    try:
-        url = "https://accounts.spotify.com/api/token"
-        auth_str = f"{client_id}:{client_secret}"
-        b64_auth = base64.b64encode(auth_str.encode()).decode()
-        
-        headers = {"Authorization": f"Basic {b64_auth}"}
-        data = {"grant_type": "client_credentials"}
-        
-        response = session.post(url, headers=headers, data=data, timeout=10)
-        response.raise_for_status()
-        return response.json().get("access_token")
-    except requests.RequestException as e:
-        print(f"Failed to get Spotify access token: {e}")
-        raise Exception("Could not get Spotify access token.") from e
-
-def get_genius_song_credits_from_api(session, song_id, access_token):
-    """Get song credits using Genius's internal API from a song ID."""
-    if not song_id:
-        return {}
-        
-    url = f"https://genius.com/api/songs/{song_id}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "application/json",
-        "Authorization": f"Bearer {access_token}"
-    }
-    
-    try:
-        response = session.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        song_data = response.json().get('response', {}).get('song', {})
-        
-        custom_performances = song_data.get('custom_performances', [])
-        label_data = next((item for item in custom_performances if item.get('label') == 'Label'), None)
-        copyright_data = next((item for item in custom_performances if item.get('label') == 'Copyright ©'), None)
-        phono_copyright_data = next((item for item in custom_performances if item.get('label') == 'Phonographic Copyright ℗'), None)
+        def fetch_missing(track_ids):
+            track_ids = [track_id for track_id in track_ids if track_id in unfetched]
+            if track_ids:
+                q.put(("log", f"Fetching the stream history of {len(track_ids)} resumed tracks for the trends..."))
+                fetch_stream_histories(session or shared_session(), track_ids, params['credentials']['rapidapi_key'])
+        try:
+            count = export_stream_trends(path, tracks, placement_store if placement_store.enabled else None,
+                                         fetch_missing)
+        except OSError as e:
+            q.put(("log", f"Error writing stream trends: {e}", "error"))
+            return
+        if count is None:
+            q.put(("log", "NumPy is not installed; skipping the stream trends export."))
+        elif count:
+            q.put(("log", f"Saved stream trends for {count} tracks to {path}", "success"))
+
+    @staticmethod
+    def _report_metrics(q, params, snapshot=None):
+        """Log per-endpoint request metrics and save them next to the CSVs (JSON and Prometheus text)."""
+        if snapshot is None:
+            snapshot = endpoint_metrics.snapshot(response_cache.stats())
+        if not snapshot:
+            return
+        q.put(("log", "Requests by endpoint:"))
+        for line in format_endpoint_metrics(snapshot):
+            q.put(("log", "  " + line))
+        try:
+            json_path, prom_path = metrics_paths(params['save_dir'], params['file_name'])
+            write_metrics(snapshot, json_path, prom_path, endpoint_metrics.textfile)
+            q.put(("log", f"Saved request metrics to {json_path}"))
+        except OSError as e:
+            q.put(("log", f"Error writing request metrics: {e}", "error"))
+
+    @staticmethod
+    def _report_progress(q, event):
+        """Translate a ProgressEvent from track_placements() into GUI queue messages."""
+        if event.kind == 'song':
+            q.put(("progress", 10 + event.done * 80.0 / event.total))
+            q.put(("log", event.message))
+            return
+        q.put(("log", event.message, event.level))
+        if event.kind == 'listing':
+            q.put(("progress", 10))
 
-        youtube_url = next((media.get('url') for media in song_data.get('media', []) if media.get('provider') == 'youtube'), None)
-        producer_artists = song_data.get('producer_artists', [])
-        
-        return {
-            "song_name": song_data.get('title'),
-            "artist_name": song_data.get('primary_artist', {}).get('name'),
-            "co-producers": ", ".join(p.get('name') for p in producer_artists) if producer_artists else None,
-            "label": " & ".join(a.get('name') for a in label_data['artists']) if label_data else None,
-            "copyright": " & ".join(a.get('name') for a in copyright_data['artists']) if copyright_data else None,
-            "phonographic_copyright": " & ".join(a.get('name') for a in phono_copyright_data['artists']) if phono_copyright_data else None,
-            "youtube_url": youtube_url
-        }
-    except requests.RequestException as e:
-        print(f"Genius API request failed for song ID {song_id}: {e}")
-        return {} # Return empty dict on failure
+    def export_results(self, data, params, metrics=None):
+        """Writes data (SongRecords) to CSV and optionally Google Sheets, formatting each row once."""
+        q = params['gui_queue']
+        simplified_path, raw_path = export_csv_paths(params['save_dir'], params['file_name'])
+        # Rows are only kept for the Sheets upload
+        simplified_table = [CSV_FIELDNAMES_SIMPLE] if self._sheets_enabled(params) else None
+        raw_table = [CSV_FIELDNAMES_RAW] if simplified_table else None
 
-def get_youtube_view_count(session, video_url, api_key):
-    """Get view count for a YouTube video using the YouTube Data API."""
-    if not video_url or not api_key:
-        return None
-    try:
-        if 'youtu.be' in video_url:
-            video_id = video_url.split('/')[-1].split('?')[0]
-        else:
-            video_id = video_url.split('v=')[1].split('&')[0]
-        
-        url = f"https://www.googleapis.com/youtube/v3/videos?part=statistics&id={video_id}&key={api_key}"
-        response = session.get(url, timeout=10)
-        response.raise_for_status()
-        
-        items = response.json().get('items', [])
-        if items:
-            return int(items[0]['statistics']['viewCount'])
-    except (requests.RequestException, IndexError, KeyError, ValueError) as e:
-        print(f"Failed to get YouTube views for {video_url}: {e}")
-    return None
-
-def get_artist_id_from_url(session, genius_url):
-    """Extract Artist ID from a Genius artist page URL."""
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"}
-    try:
-        response = session.get(genius_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        # Use BeautifulSoup to parse the page properly
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find meta tag containing artist data
-        meta_tag = soup.find('meta', attrs={'itemprop': 'page_data'})
-        if meta_tag and 'content' in meta_tag.attrs:
-            content = json.loads(meta_tag['content'])
-            
-            # Extract Artist ID from tracking_data
-            tracking_data = content.get('tracking_data', [])
-            for item in tracking_data:
-                if item.get('key') == 'Artist ID':
-                    return str(item.get('value'))
-                    
-            # Alternative method - try getting from artist object
-            artist = content.get('artist', {})
-            if artist and 'id' in artist:
-                return str(artist['id'])
-        
-        return None
-    except requests.RequestException as e:
-        print(f"Error getting artist ID from {genius_url}: {e}")
-        return None
+        # Write both CSV files in one pass over the results
+        try:
+            with open(simplified_path, "w", newline="", encoding="utf-8") as simplified_file, \
+                    open(raw_path, "w", newline="", encoding="utf-8") as raw_file:
+                simplified_writer, raw_writer = csv.writer(simplified_file), csv.writer(raw_file)
+                simplified_writer.writerow(CSV_FIELDNAMES_SIMPLE)
+                raw_writer.writerow(CSV_FIELDNAMES_RAW)
+                for record in data:
+                    cells = format_result_row(record)
+                    simplified_cells = simplified_row(cells)
+                    simplified_writer.writerow(simplified_cells)
+                    raw_writer.writerow(cells)
+                    if raw_table:
+                        simplified_table.append(simplified_cells)
+                        raw_table.append(cells)
+            q.put(("log", f"Saved simplified CSV to {simplified_path}", "success"))
+            q.put(("log", f"Saved raw CSV to {raw_path}", "success"))
+        except IOError as e:
+            q.put(("log", f"Error writing CSV file: {e}", "error"))
+            if raw_table:
+                raw_table[1:] = [format_result_row(record) for record in data]
+                simplified_table[1:] = [simplified_row(cells) for cells in raw_table[1:]]
 
-def get_songs_from_genius_producer_api(session, producer_url, limit, access_token):
-    """Get a list of song IDs from a producer's Genius page using the API."""
-    headers = {"Authorization": f"Bearer {access_token}"}
-    try:
-        artist_id = get_artist_id_from_url(session, producer_url)
-        if not artist_id:
-            raise ValueError("Could not extract Genius Artist ID from URL.")
+        if raw_table:
+            self._export_to_sheets(params, simplified_table, raw_table, metrics)
 
-        song_ids = []
-        page = 1
-        while True:
-            if limit and len(song_ids) >= limit:
-                break
-            
-            url = f"https://api.genius.com/artists/{artist_id}/songs"
-            params = {"sort": "popularity", "per_page": 50, "page": page}
-            
-            response = session.get(url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            songs = data.get('response', {}).get('songs', [])
-            
-            if not songs:
-                break # No more songs
-                
-            song_ids.extend([song['id'] for song in songs])
-            page += 1
-            time.sleep(0.1) # Small delay to be nice to the API
-        
-        return song_ids[:limit] if limit else song_ids
+    def _finish_streaming_export(self, exporter, params, metrics=None):
+        """Finalize incrementally written CSVs, then upload them to Google Sheets if requested."""
+        q = params['gui_queue']
+        try:
+            exporter.close()
+            q.put(("log", f"Saved simplified CSV to {exporter.simplified_path}", "success"))
+            q.put(("log", f"Saved raw CSV to {exporter.raw_path}", "success"))
+        except OSError as e:
+            q.put(("log", f"Error writing CSV file: {e}", "error"))
+            return
 
-    except (requests.RequestException, ValueError) as e:
-        print(f"Error getting songs from Genius API: {e}")
-        return []
+        if self._sheets_enabled(params):
+            # Rows were never kept in memory; read the finished files back for the upload
+            try:
+                with open(exporter.simplified_path, newline="", encoding="utf-8") as f:
+                    simplified_table = list(csv.reader(f))
+                with open(exporter.raw_path, newline="", encoding="utf-8") as f:
+                    raw_table = list(csv.reader(f))
+            except OSError as e:
+                q.put(("log", f"Could not read CSV files for Google Sheets export: {e}", "error"))
+                return
+            self._export_to_sheets(params, simplified_table, raw_table, metrics)
+
+    @staticmethod
+    def _sheets_enabled(params):
+        return bool(params['export_to_sheets'] and params['spreadsheet_id'] and params['sheet_name'])
+
+    def _export_to_sheets(self, params, simplified_table, raw_table, metrics=None):
+        """Upload the simplified and raw tables (header row first, then rows of cells) to Google Sheets if enabled."""
+        q = params['gui_queue']
+        if not self._sheets_enabled(params):
+            return
+        q.put(("log", "Exporting to Google Sheets..."))
+        tabs = [("simplified", f"{params['sheet_name']} - Simplified", simplified_table),
+                ("raw", f"{params['sheet_name']} - Raw", raw_table)]
+
+        if sheets_service.mode == 'replace':
+            for label, sheet_name, table in tabs:
+                if create_or_update_sheet(params['spreadsheet_id'], sheet_name, table, metrics):
+                    q.put(("log", f"Successfully exported {label} data to Google Sheets.", "success"))
+                else:
+                    q.put(("log", f"Failed to export {label} data to Google Sheets.", "error"))
+            return
 
-def get_songs_from_spotify_playlist(session, playlist_url, limit, access_token):
-    """Gets a list of songs (name, artist, track_id) from a Spotify playlist."""
-    try:
-        playlist_id = playlist_url.split('/playlist/')[1].split('?')[0]
-        url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        
-        songs = []
-        while url:
-            if limit and len(songs) >= limit:
-                break
-            response = session.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            for item in data.get('items', []):
-                track = item.get('track')
-                if track and track.get('name') and track.get('artists'):
-                    songs.append({
-                        'song_name': track['name'],
-                        'artist_name': track['artists'][0]['name'],
-                        'track_id': track.get('id')
-                    })
-            
-            url = data.get('next')  # For pagination
-        return songs[:limit] if limit else songs
-    except (requests.RequestException, IndexError, KeyError) as e:
-        print(f"Failed to get Spotify playlist songs: {e}")
-        return []
-
-def get_songs_from_spotify_album(session, album_url, limit, access_token):
-    """Gets a list of songs (name, artist, track_id) from a Spotify album."""
-    try:
-        album_id = album_url.split('/album/')[1].split('?')[0]
-        url = f"https://api.spotify.com/v1/albums/{album_id}/tracks"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        
-        songs = []
-        while url:
-            if limit and len(songs) >= limit:
-                break
-            response = session.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            for track in data.get('items', []):
-                if track and track.get('name') and track.get('artists'):
-                    songs.append({
-                        'song_name': track['name'],
-                        'artist_name': track['artists'][0]['name'],
-                        'track_id': track.get('id')
-                    })
-            
-            url = data.get('next')  # For pagination
-        return songs[:limit] if limit else songs
-    except (requests.RequestException, IndexError, KeyError) as e:
-        print(f"Failed to get Spotify album songs: {e}")
-        return []
-
-def parse_manual_input(manual_list_text):
-    """Parses manual 'Song - Artist' input into a list of dicts."""
-    songs = []
-    for line in manual_list_text.strip().splitlines():
-        if "-" in line:
-            parts = line.split("-", 1)
-            songs.append({"song_name": parts[0].strip(), "artist_name": parts[1].strip()})
-    return songs
-
-def get_spotify_track_id(session, song_name, artist_name, access_token):
-    """Search Spotify for a track and return the best match's ID and name."""
-    try:
-        query = f"track:{song_name} artist:{artist_name}"
-        url = f"https://api.spotify.com/v1/search?q={requests.utils.quote(query)}&type=track&limit=5"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = session.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        items = response.json().get("tracks", {}).get("items", [])
-        if not items:
-            return None, None
-
-        # Prefer exact matches, case-insensitive
-        for item in items:
-            if item['name'].lower() == song_name.lower():
-                return item['id'], item['name']
-
-        # Fallback to the first result
-        return items[0]['id'], items[0]['name']
-    except requests.RequestException as e:
-        print(f"Spotify search failed for '{song_name}': {e}")
-        return None, None
-
-def get_rapidapi_stream_data(session, track_id, api_key):
-    """Call the RapidAPI endpoint with thread-safe rate limiting."""
-    global last_api_call_time
-    
-    with api_call_lock:
-        current_time = time.time()
-        time_since_last_call = current_time - last_api_call_time
-        
-        # Enforce rate limit (e.g., max 1 call per 1.1 seconds)
-        wait_time = 1.1
-        if time_since_last_call < wait_time:
-            time.sleep(wait_time - time_since_last_call)
-        
-        # Update the last call time *after* the wait
-        last_api_call_time = time.time()
+        # Both tabs go up together, writing only the cells that changed since the last export
+        summaries = sync_sheets(params['spreadsheet_id'], {sheet_name: table for _, sheet_name, table in tabs}, metrics)
+        if summaries is None:
+            q.put(("log", "Failed to export data to Google Sheets.", "error"))
+            return
+        for label, sheet_name, _ in tabs:
+            summary = summaries.get(sheet_name)
+            if summary is None:
+                q.put(("log", f"Failed to export {label} data to Google Sheets.", "error"))
+            elif summary['rewritten']:
+                q.put(("log", f"Successfully exported {label} data to Google Sheets ({summary['rows']} rows written).", "success"))
+            else:
+                q.put(("log", f"Successfully exported {label} data to Google Sheets "
+                              f"({summary['cells']} cells changed, {summary['appended']} rows appended).", "success"))
 
-    url = f"https://spotify-stream-count.p.rapidapi.com/v1/spotify/tracks/{track_id}/streams"
-    headers = {
-        "x-rapidapi-host": "spotify-stream-count.p.rapidapi.com",
-        "x-rapidapi-key": api_key
-    }
-    params = {"trackId": track_id}
 
-    try:
-        response = session.get(url, headers=headers, params=params, timeout=15)
-        if response.status_code == 200:
-            return response.json()
-        print(f"RapidAPI returned status {response.status_code} for track {track_id}")
-        return None
-    except requests.RequestException as e:
-        print(f"RapidAPI request failed for track {track_id}: {e}")
-        return None
+class BackgroundExporter:
+    """
+    Runs job exports (CSV files, Google Sheets, journal and outcome messages) on one
+    thread of their own, in order, so the next job can start fetching right away.
+    Holds at most `max_pending` waiting exports; submit() blocks beyond that.
+    """
+    def __init__(self, max_pending=2):
+        self._tasks = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="background-exporter", daemon=True)
+        self._thread.start()
 
+    def submit(self, q, fn, *args):
+        """Queue fn(*args); an exception it raises is reported to `q` as a processing_error."""
+        self._tasks.put((q, fn, args))
 
-def calculate_stream_stats(history_json):
-    """Process historical stream data to calculate stats."""
-    if not history_json or not isinstance(history_json, list) or len(history_json) == 0:
-        return {"stream_count": None, "change_in_streams": None}
-        
-    stream_count = int(history_json[-1].get("streams", 0))
-    change_in_streams = None
-    if len(history_json) >= 2:
-        try:
-            # Look at the last two available data points for daily change
-            latest_streams = int(history_json[-1].get("streams"))
-            previous_streams = int(history_json[-2].get("streams"))
-            change_in_streams = latest_streams - previous_streams
-        except (ValueError, TypeError):
-            change_in_streams = None # Handle case where stream data is not a number
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            q, fn, args = task
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Error in background export: {e}")
+                q.put(("log", "Progress is saved in the run journal; use 'Resume Last Run' to continue.", "error"))
+                q.put(("processing_error", f"An unexpected error occurred while exporting: {e}"))
 
-    return {"stream_count": stream_count, "change_in_streams": change_in_streams}
+    def close(self):
+        """Wait for every queued export to finish, then stop the thread."""
+        self._tasks.put(None)
+        self._thread.join()
 
 
 # --- Main Application Class (GUI) ---
-class PlacementTrackerApp:
+class PlacementTrackerApp(JobRunner):
     def __init__(self, root):
         self.root = root
         self.root.title("Placement Tracker (Optimized)")
@@ -450,6 +382,7 @@ class PlacementTrackerApp:
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
         self.gui_queue = queue.Queue()
+        self.stats_window = None
         
         self.credentials = self.load_credentials()
         if not self.credentials:
@@ -466,16 +399,11 @@ class PlacementTrackerApp:
         if not os.path.exists(config_path):
             return None
         try:
-            with open(config_path, 'rb') as f:
-                secrets = tomli.load(f)
-                required = {'spotify_client_id', 'spotify_client_secret', 'genius_token', 'youtube_api_key', 'rapidapi_key'}
-                if required.issubset(secrets):
-                    return secrets
-                else:
-                    messagebox.showerror("Credentials Error", f"secret.toml is missing one or more required keys: {required - set(secrets)}")
-                    return None
+            return read_secrets(config_path)
         except (tomli.TOMLDecodeError, IOError) as e:
             print(f"Error reading secret.toml: {e}")
+        except ValueError as e:
+            messagebox.showerror("Credentials Error", str(e))
         return None
 
     def build_ui(self):
@@ -511,6 +439,17 @@ class PlacementTrackerApp:
         self.limit_enabled_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(options_labelframe, text="Enable", variable=self.limit_enabled_var).grid(row=0, column=4, sticky='w')
 
+        self.use_cache_var = tk.BooleanVar(value=response_cache.enabled)
+        ttk.Checkbutton(options_labelframe, text="Use response cache", variable=self.use_cache_var).grid(row=1, column=3, columnspan=2, sticky='w', pady=(5, 0))
+
+        self.adaptive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_labelframe, text="Adaptive concurrency (tune per provider, starting from Concurrent Tasks)",
+                        variable=self.adaptive_var).grid(row=2, column=0, columnspan=5, sticky='w', pady=(5, 0))
+
+        tk.Label(options_labelframe, text="Engine:").grid(row=1, column=0, sticky='w', pady=(5, 0))
+        self.engine_var = tk.StringVar(value="pipeline")
+        ttk.Combobox(options_labelframe, textvariable=self.engine_var, values=("pipeline", "threads", "asyncio"), state="readonly", width=10).grid(row=1, column=1, columnspan=2, sticky='w', padx=5, pady=(5, 0))
+
         # --- Output Frame ---
         output_labelframe = ttk.LabelFrame(main_frame, text="Output", padding=10)
         output_labelframe.pack(fill='x', pady=5)
@@ -537,14 +476,31 @@ class PlacementTrackerApp:
         self.sheet_name_var = tk.StringVar(value=datetime.date.today().strftime("%Y-%m-%d"))
         ttk.Entry(output_labelframe, textvariable=self.sheet_name_var, width=20).grid(row=4, column=1, sticky='w', padx=5)
         
+        self.stream_export_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(output_labelframe, text="Write CSV rows as they complete (keeps partial results if interrupted)", variable=self.stream_export_var).grid(row=5, column=0, columnspan=3, sticky='w', pady=(5,0))
+
+        tk.Label(output_labelframe, text="Typed Data:").grid(row=6, column=0, sticky='w', pady=2)
+        formats_frame = tk.Frame(output_labelframe)
+        formats_frame.grid(row=6, column=1, columnspan=2, sticky='w', padx=5)
+        self.export_format_vars = {fmt: tk.BooleanVar(value=False) for fmt in EXPORT_FORMATS}
+        for fmt, text in (('jsonl', "JSON Lines"), ('parquet', "Parquet"), ('arrow', "Arrow")):
+            ttk.Checkbutton(formats_frame, text=text, variable=self.export_format_vars[fmt]).pack(side='left', padx=(0, 10))
+
         output_labelframe.grid_columnconfigure(1, weight=1)
 
         # --- Control & Progress Frame ---
         progress_labelframe = ttk.LabelFrame(main_frame, text="Progress", padding=10)
         progress_labelframe.pack(fill='both', expand=True, pady=5)
 
-        self.start_button = ttk.Button(progress_labelframe, text="Start Processing", command=self.start_processing)
-        self.start_button.pack(pady=5)
+        buttons_frame = tk.Frame(progress_labelframe)
+        buttons_frame.pack(pady=5)
+        self.start_button = ttk.Button(buttons_frame, text="Start Processing", command=self.start_processing)
+        self.start_button.pack(side='left', padx=5)
+        self.resume_button = ttk.Button(buttons_frame, text="Resume Last Run", command=self.resume_processing)
+        self.resume_button.pack(side='left', padx=5)
+        self.refresh_button = ttk.Button(buttons_frame, text="Refresh Metrics", command=self.refresh_processing)
+        self.refresh_button.pack(side='left', padx=5)
+        ttk.Button(buttons_frame, text="Stats", command=self.show_stats).pack(side='left', padx=5)
         
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(progress_labelframe, variable=self.progress_var, maximum=100)
@@ -555,6 +511,42 @@ class PlacementTrackerApp:
         self.log_text.tag_configure('error', foreground='red')
         self.log_text.tag_configure('success', foreground='green')
 
+    def show_stats(self):
+        """Open the Stats window: per-endpoint request metrics, refreshed every second."""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        self.stats_window = tk.Toplevel(self.root)
+        self.stats_window.title("Request Stats")
+        self.stats_window.geometry("900x320")
+
+        columns = (("endpoint", "Endpoint", 170), ("requests", "Requests", 70), ("errors", "Errors", 60),
+                   ("retries", "Retries", 60), ("throttled", "429s", 50), ("p50", "p50 ms", 65),
+                   ("p95", "p95 ms", 65), ("max", "Max ms", 65), ("kb", "KB", 70), ("cache", "Cache hits", 90))
+        self.stats_tree = ttk.Treeview(self.stats_window, columns=[c[0] for c in columns], show='headings')
+        for name, heading, width in columns:
+            self.stats_tree.heading(name, text=heading)
+            self.stats_tree.column(name, width=width, anchor='w' if name == 'endpoint' else 'e')
+        self.stats_tree.pack(fill='both', expand=True, padx=10, pady=10)
+        self.refresh_stats()
+
+    def refresh_stats(self):
+        """Redraw the Stats window from endpoint_metrics while it is open."""
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            return
+        def ms(seconds):
+            return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for endpoint, m in endpoint_metrics.snapshot(response_cache.stats()).items():
+            latency = m['latency']
+            lookups = m['cache_hits'] + m['cache_misses']
+            self.stats_tree.insert('', tk.END, values=(
+                endpoint, m['requests'], m['errors'], m['retries'], m['throttled'],
+                ms(latency['p50']), ms(latency['p95']), ms(latency['max'] if m['requests'] else None),
+                f"{m['bytes'] / 1024:.0f}", f"{m['cache_hits']}/{lookups}" if lookups else "-"))
+        self.root.after(1000, self.refresh_stats)
+
     def log_message(self, message, level="info"):
         """Inserts a message into the log text widget."""
         self.log_text.configure(state='normal')
@@ -578,10 +570,14 @@ class PlacementTrackerApp:
                     self.log_message(value, level)
                 elif msg_type == "processing_done":
                     self.start_button.config(state='normal')
+                    self.resume_button.config(state='normal')
+                    self.refresh_button.config(state='normal')
                     self.log_message(value, "success")
                     messagebox.showinfo("Success", value)
                 elif msg_type == "processing_error":
                     self.start_button.config(state='normal')
+                    self.resume_button.config(state='normal')
+                    self.refresh_button.config(state='normal')
                     self.log_message(value, "error")
                     messagebox.showerror("Error", value)
         finally:
@@ -603,6 +599,15 @@ class PlacementTrackerApp:
             'save_dir': self.directory_var.get().strip(),
             'file_name': self.filename_entry.get().strip(),
             'max_workers': self.batch_size_var.get(),
+            'engine': self.engine_var.get(),
+            'use_cache': self.use_cache_var.get(),
+            'adaptive': self.adaptive_var.get(),
+            'stream_export': self.stream_export_var.get(),
+            'export_formats': [fmt for fmt, var in self.export_format_vars.items() if var.get()],
+            'stage_workers': self.credentials.get('pipeline', {}).get('workers'),
+            'stage_queue_size': self.credentials.get('pipeline', {}).get('queue_size'),
+            'async_concurrency': self.credentials.get('async_concurrency'),
+            'genius_prefetch_pages': self.credentials.get('genius_prefetch_pages'),
             'limit': self.limit_var.get() if self.limit_enabled_var.get() else None,
             'credentials': self.credentials,
             'export_to_sheets': self.export_to_sheets_var.get(),
@@ -610,8 +615,30 @@ class PlacementTrackerApp:
             'sheet_name': self.sheet_name_var.get().strip(),
             'gui_queue': self.gui_queue
         }
-        
+        self._launch_worker(params)
+
+    def resume_processing(self):
+        """Continues the last interrupted run from its journal."""
+        state = RunJournal.load()
+        if state is None:
+            return messagebox.showinfo("Resume", "There is no previous run to resume.")
+        if state['finished']:
+            return messagebox.showinfo("Resume", "The last run already finished.")
+        params = dict(state['params'], credentials=self.credentials, gui_queue=self.gui_queue, resume_state=state)
+        self._launch_worker(params)
+
+    def refresh_processing(self):
+        """Re-fetches only stream counts and YouTube views for the songs of the last run."""
+        state = RunJournal.load()
+        if state is None:
+            return messagebox.showinfo("Refresh Metrics", "There is no previous run to refresh.")
+        params = dict(state['params'], credentials=self.credentials, gui_queue=self.gui_queue, refresh_state=state)
+        self._launch_worker(params)
+
+    def _launch_worker(self, params):
         self.start_button.config(state='disabled')
+        self.resume_button.config(state='disabled')
+        self.refresh_button.config(state='disabled')
         self.log_text.config(state='normal')
         self.log_text.delete('1.0', tk.END)
         self.log_text.config(state='disabled')
@@ -619,224 +646,209 @@ class PlacementTrackerApp:
 
         threading.Thread(target=self.processing_worker, args=(params,), daemon=True).start()
 
-    def processing_worker(self, params):
-        """The main worker function that runs in a separate thread."""
-        q = params['gui_queue']
-        try:
-            with requests.Session() as session:
-                q.put(("log", "Authenticating with Spotify..."))
-                spotify_token = get_spotify_access_token(session, params['credentials']['spotify_client_id'], params['credentials']['spotify_client_secret'])
-                genius_token = params['credentials']['genius_token']
-                youtube_key = params['credentials']['youtube_api_key']
-                rapidapi_key = params['credentials']['rapidapi_key']
-                q.put(("log", "Authentication successful.", "success"))
-
-                # Step 1: Obtain initial list of songs/song IDs
-                q.put(("log", "Fetching initial song list..."))
-                initial_song_list = self._get_initial_song_list(session, params, spotify_token, genius_token, rapidapi_key)
-                if not initial_song_list:
-                    raise ValueError("No songs found from the provided input.")
-                q.put(("log", f"Found {len(initial_song_list)} songs to process.", "success"))
-                q.put(("progress", 10))
-                
-                # Step 2: Process all songs concurrently
-                results = []
-                total = len(initial_song_list)
-                
-                with ThreadPoolExecutor(max_workers=params['max_workers']) as executor:
-                    # Create a future for each song to be processed
-                    future_to_song = {
-                        executor.submit(
-                            self._process_single_song, 
-                            session, song_data, spotify_token, genius_token, youtube_key, rapidapi_key
-                        ): song_data for song_data in initial_song_list
-                    }
-
-                    for i, future in enumerate(as_completed(future_to_song)):
-                        try:
-                            result = future.result()
-                            if result:
-                                results.append(result)
-                        except Exception as exc:
-                            song_info = future_to_song[future]
-                            q.put(("log", f"Error processing '{song_info.get('song_name')}': {exc}", "error"))
-                        
-                        # Update progress
-                        progress = 10 + (i + 1) * 80.0 / total
-                        q.put(("progress", progress))
-                        q.put(("log", f"Processed {i+1}/{total} songs..."))
-
-                q.put(("progress", 90))
-                q.put(("log", f"Finished processing. Found details for {len(results)} songs."))
-
-                # Step 3: Export results
-                if results:
-                    self.export_results(results, params)
-                    q.put(("progress", 100))
-                    q.put(("processing_done", f"Success! Exported {len(results)} songs."))
-                else:
-                    q.put(("processing_error", "Processing finished, but no data could be exported."))
-
-        except Exception as e:
-            print(f"Error in processing worker: {e}")
-            q.put(("processing_error", f"An unexpected error occurred: {e}"))
-
-    def _get_initial_song_list(self, session, params, spotify_token, genius_token, rapidapi_key):
-        """Helper to determine input source and fetch the initial song list."""
-        if params['producer_url']:
-            if 'genius.com' in params['producer_url']:
-                song_ids = get_songs_from_genius_producer_api(session, params['producer_url'], params['limit'], genius_token)
-                # Return list of dicts with just the ID to be processed later
-                return [{'song_id': sid} for sid in song_ids]
-            elif 'spotify.com/playlist/' in params['producer_url']:
-                return get_songs_from_spotify_playlist(session, params['producer_url'], params['limit'], spotify_token)
-            elif 'spotify.com/album/' in params['producer_url']:
-                return get_songs_from_spotify_album(session, params['producer_url'], params['limit'], spotify_token)
-        elif params['manual_input']:
-            return parse_manual_input(params['manual_input'])
-        return []
-
-    def _process_single_song(self, session, song_data, spotify_token, genius_token, youtube_key, rapidapi_key):
-        """
-        Processes a single song: fetches all its data from various APIs.
-        This function is designed to be run in a thread.
-        `song_data` is a dictionary that must contain either 'song_id' (from Genius)
-        or both 'song_name' and 'artist_name'.
-        """
-        # --- Get base song info (credits, artist, title) ---
-        credits = {}
-        if 'song_id' in song_data:
-            credits = get_genius_song_credits_from_api(session, song_data['song_id'], genius_token)
-        elif 'song_name' in song_data and 'artist_name' in song_data:
-            # For manual input, we need to search for the song ID first
-            song_name = song_data['song_name']
-            artist_name = song_data['artist_name']
-            
-            # Search for the song ID using Genius search API
-            search_url = f"https://api.genius.com/search?q={requests.utils.quote(f'{song_name} {artist_name}')}"
-            headers = {"Authorization": f"Bearer {genius_token}"}
-            try:
-                response = session.get(search_url, headers=headers, timeout=10)
-                response.raise_for_status()
-                songs = response.json().get('response', {}).get('hits', [])
-                song_id = None
-                for song in songs:
-                    if song.get('result', {}).get('primary_artist', {}).get('name').lower() == artist_name.lower() \
-                        and song.get('result', {}).get('title').lower() == song_name.lower():
-                        song_id = song.get('result', {}).get('id')
-                        break
-                
-                if song_id:
-                    credits = get_genius_song_credits_from_api(session, song_id, genius_token)
-                else:
-                    # Fallback: use the provided names
-                    credits = {'song_name': song_name, 'artist_name': artist_name}
-            except:
-                # Fallback: use the provided names
-                credits = {'song_name': song_name, 'artist_name': artist_name}
-        
-        if not credits.get('song_name'):
-             # If we couldn't get credits, we can't proceed with this song
-            return None
+    def on_closing(self):
+        """Handles application shutdown."""
+        if messagebox.askokcancel("Quit", "Do you want to quit?"):
+            self.root.destroy()
 
-        song_name = credits['song_name']
-        artist_name = credits['artist_name']
+# --- Headless Batch Runner ---
+# `placement_tracker.py --manifest jobs.toml` runs every job in a TOML/JSON
+# manifest without the GUI, sharing one HTTP session, response cache and rate
+# limiter across jobs. Logs go to stderr, a JSON summary to stdout.
+EXIT_OK = 0
+EXIT_JOB_FAILED = 1      # at least one job failed, others succeeded
+EXIT_USAGE = 2           # bad arguments or manifest
+EXIT_CREDENTIALS = 3     # secret.toml missing or invalid
+EXIT_ALL_FAILED = 4      # every job failed
+EXIT_INTERRUPTED = 130   # Ctrl+C
 
-        # --- Get Spotify Track ID and Actual Name ---
-        track_id, actual_track_name = song_data.get('track_id'), song_name
-        if not track_id:
-            track_id, actual_track_name = get_spotify_track_id(session, song_name, artist_name, spotify_token)
-        
-        # --- Get Stream Data ---
-        stream_stats = {"stream_count": None, "change_in_streams": None}
-        if track_id:
-            stream_data = get_rapidapi_stream_data(session, track_id, rapidapi_key)
-            if stream_data:
-                stream_stats = calculate_stream_stats(stream_data)
-        
-        # --- Get YouTube Views ---
-        youtube_views = None
-        if credits.get('youtube_url'):
-            youtube_views = get_youtube_view_count(session, credits['youtube_url'], youtube_key)
-
-        # --- Assemble final result ---
-        return {
-            "Artist & Title": f"{artist_name} - {song_name}",
-            "Co-Producers": credits.get("co-producers"),
-            "Actual Track Name": actual_track_name,
-            "Total Spotify Streams": stream_stats["stream_count"],
-            "Daily Spotify Streams": stream_stats["change_in_streams"],
-            "Label": credits.get("label"),
-            "Phonographic_copyright": credits.get("phonographic_copyright"),
-            "Copyright": credits.get("copyright"),
-            "YouTube URL": credits.get("youtube_url"),
-            "YouTube Views": youtube_views,
-        }
+MANIFEST_KEYS = {'name', 'url', 'songs_file', 'songs', 'limit', 'save_dir', 'file_name', 'engine', 'max_workers',
+                 'use_cache', 'stream_export', 'async_concurrency', 'adaptive', 'spreadsheet_id', 'sheet_name',
+                 'refresh', 'formats'}
+MANIFEST_SOURCES = ('url', 'songs_file', 'songs')
 
-    def export_results(self, data, params):
-        """Writes data to CSV and optionally Google Sheets."""
-        q = params['gui_queue']
-        filepath = os.path.join(params['save_dir'], f"{params['file_name']}.csv")
 
-        # Format data for output
-        fieldnames_raw = ["Artist & Title", "Co-Producers", "Actual Track Name", "Label", "Phonographic_copyright", "Copyright", "Total Spotify Streams", "Daily Spotify Streams", "YouTube URL", "YouTube Views"]
-        fieldnames_simple = ["Artist & Title", "Co-Producers", "Label", "Total Spotify Streams", "Daily Spotify Streams", "YouTube Views"]
-        
-        formatted_data = []
-        for item in data:
-            formatted_item = {k: item.get(k) for k in fieldnames_raw}
-            for field in ['Total Spotify Streams', 'Daily Spotify Streams', 'YouTube Views']:
-                if isinstance(item.get(field), int):
-                    formatted_item[field] = f"{item[field]:,}" # Add commas
-                elif item.get(field) is None:
-                     formatted_item[field] = "" # Use empty string for None
-            formatted_data.append(formatted_item)
-            
-        simplified_data = [{k: item.get(k, '') for k in fieldnames_simple} for item in formatted_data]
+def load_manifest(path):
+    """
+    Read a job manifest: optional [defaults] plus a [[jobs]] list (TOML), or the
+    same shape as JSON. Returns the jobs with defaults applied.
+    Raises ValueError if the manifest is invalid.
+    """
+    with open(path, 'rb') as f:
+        data = json.load(f) if path.lower().endswith('.json') else tomli.load(f)
+    defaults = data.get('defaults', {})
+    jobs = []
+    names = set()
+    for i, job in enumerate(data.get('jobs') or [], 1):
+        job = {**defaults, **job}
+        job.setdefault('name', f"job{i}")
+        unknown = set(job) - MANIFEST_KEYS
+        if unknown:
+            raise ValueError(f"Job '{job['name']}': unknown keys {sorted(unknown)}")
+        if sum(1 for key in MANIFEST_SOURCES if job.get(key)) != 1:
+            raise ValueError(f"Job '{job['name']}': give exactly one of 'url', 'songs_file' or 'songs'.")
+        if job.get('engine', 'pipeline') not in ENGINES:
+            raise ValueError(f"Job '{job['name']}': engine must be one of {', '.join(ENGINES)}.")
+        if not isinstance(job.get('formats', []), list) or set(job.get('formats', [])) - set(EXPORT_FORMATS):
+            raise ValueError(f"Job '{job['name']}': formats must be a list of {', '.join(EXPORT_FORMATS)}.")
+        if job['name'] in names:
+            raise ValueError(f"Duplicate job name '{job['name']}'.")
+        names.add(job['name'])
+        jobs.append(job)
+    if not jobs:
+        raise ValueError("The manifest has no jobs.")
+    return jobs
+
+def manifest_job_params(job, credentials, base_dir, reporter):
+    """Turn one manifest job into the params dict JobRunner.processing_worker() expects."""
+    today = datetime.date.today().isoformat()
+    name = job['name']
+    manual_input = ''
+    if job.get('songs_file'):
+        with open(os.path.join(base_dir, os.path.expanduser(job['songs_file'])), encoding="utf-8") as f:
+            manual_input = f.read().strip()
+    elif job.get('songs'):
+        manual_input = "\n".join(job['songs'])
+    return {
+        'producer_url': job.get('url', ''),
+        'manual_input': manual_input,
+        'save_dir': os.path.join(base_dir, os.path.expanduser(job.get('save_dir', '.'))),
+        'file_name': job.get('file_name', "{name}_{date}").format(name=name, date=today),
+        'max_workers': job.get('max_workers', 10),
+        'engine': job.get('engine', 'pipeline'),
+        'use_cache': job.get('use_cache', True),
+        'adaptive': job.get('adaptive', False),
+        'stream_export': job.get('stream_export', True),
+        'export_formats': job.get('formats', []),
+        'stage_workers': credentials.get('pipeline', {}).get('workers'),
+        'stage_queue_size': credentials.get('pipeline', {}).get('queue_size'),
+        'async_concurrency': job.get('async_concurrency', credentials.get('async_concurrency')),
+        'genius_prefetch_pages': credentials.get('genius_prefetch_pages'),
+        'limit': job.get('limit'),
+        'credentials': credentials,
+        'export_to_sheets': bool(job.get('spreadsheet_id')),
+        'spreadsheet_id': job.get('spreadsheet_id', ''),
+        'sheet_name': job.get('sheet_name', "{date}").format(name=name, date=today),
+        'gui_queue': reporter,
+        'journal_path': os.path.join(get_data_dir(), 'journal', re.sub(r'[^\w.-]+', '_', name) + '.jsonl'),
+    }
 
-        # Write CSV files
-        try:
-            # Simplified CSV
-            simplified_path = filepath.replace(".csv", " - Simplified.csv")
-            with open(simplified_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames_simple)
-                writer.writeheader()
-                writer.writerows(simplified_data)
-            q.put(("log", f"Saved simplified CSV to {simplified_path}", "success"))
-            
-            # Raw CSV
-            raw_path = filepath.replace(".csv", " - Raw.csv")
-            with open(raw_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames_raw)
-                writer.writeheader()
-                writer.writerows(formatted_data)
-            q.put(("log", f"Saved raw CSV to {raw_path}", "success"))
-        except IOError as e:
-            q.put(("log", f"Error writing CSV file: {e}", "error"))
 
-        # Export to Google Sheets
-        if params['export_to_sheets'] and params['spreadsheet_id'] and params['sheet_name']:
-            q.put(("log", "Exporting to Google Sheets..."))
-            # Simplified Sheet
-            if create_or_update_sheet(params['spreadsheet_id'], f"{params['sheet_name']} - Simplified", simplified_data):
-                q.put(("log", "Successfully exported simplified data to Google Sheets.", "success"))
-            else:
-                q.put(("log", "Failed to export simplified data to Google Sheets.", "error"))
-            
-            # Raw Sheet
-            if create_or_update_sheet(params['spreadsheet_id'], f"{params['sheet_name']} - Raw", formatted_data):
-                q.put(("log", "Successfully exported raw data to Google Sheets.", "success"))
-            else:
-                q.put(("log", "Failed to export raw data to Google Sheets.", "error"))
+class ConsoleReporter:
+    """Stands in for the GUI queue in headless runs: prints log lines to stderr and keeps the outcome."""
+    def __init__(self, job_name, verbose=False):
+        self.job_name = job_name
+        self.verbose = verbose
+        self.outcome = None
+        self.message = None
+        self.finished = None  # time.monotonic() when the outcome arrived
+
+    def put(self, msg):
+        msg_type, value, *extra = msg
+        if msg_type == "log":
+            level = extra[0] if extra else "info"
+            # Per-song progress lines are only shown with --verbose
+            if self.verbose or level != "info" or not value.startswith("Processed "):
+                print(f"[{self.job_name}] {value}", file=sys.stderr)
+        elif msg_type in ("processing_done", "processing_error"):
+            self.outcome, self.message = msg_type, value
+            self.finished = time.monotonic()
+            print(f"[{self.job_name}] {value}", file=sys.stderr)
+
+
+def run_manifest(manifest_path, secrets_path=None, resume=False, verbose=False, endpoint=None, record=None):
+    """
+    Run every job in a manifest one after another. Returns a process exit code.
+    Each job's export runs in the background while the next job fetches.
+    `endpoint` and `record` override secret.toml's [endpoints] table.
+    """
+    try:
+        jobs = load_manifest(manifest_path)
+    except (OSError, ValueError) as e:
+        print(f"Invalid manifest {manifest_path}: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        credentials = read_secrets(secrets_path or get_resource_path('secret.toml'))
+    except (OSError, ValueError) as e:
+        print(f"Error reading secret.toml: {e}", file=sys.stderr)
+        return EXIT_CREDENTIALS
+    configure_endpoints(endpoint, record)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    runner = JobRunner()
+    runner.background_exporter = BackgroundExporter()
+    summary = []
+    pending = []  # (summary entry, reporter, start time), filled in once the exports finish
+    try:
+        for job in jobs:
+            reporter = ConsoleReporter(job['name'], verbose)
+            started = time.monotonic()
+            try:
+                params = manifest_job_params(job, credentials, base_dir, reporter)
+                os.makedirs(params['save_dir'], exist_ok=True)
+            except OSError as e:
+                reporter.put(("processing_error", f"Could not prepare job: {e}"))
+                params = None
+            if params and resume:
+                # Continue an interrupted batch: finished jobs are skipped, unfinished ones resumed
+                state = RunJournal.load(params['journal_path'])
+                if state and state['finished']:
+                    summary.append({'name': job['name'], 'status': 'skipped', 'message': "Already finished"})
+                    continue
+                params['resume_state'] = state
+            if params and job.get('refresh') and not params.get('resume_state'):
+                # Re-fetch only the volatile metrics for the songs of the job's previous run
+                state = RunJournal.load(params['journal_path'])
+                if state is None:
+                    # No journal (e.g. a new machine): the placements store may know the songs
+                    state = placement_store.refresh_state(params['producer_url'] or params['manual_input'])
+                if state is None:
+                    reporter.put(("log", "No previous run to refresh; fetching everything."))
+                else:
+                    params['refresh_state'] = state
+            if params:
+                runner.processing_worker(params)
+            entry = {'name': job['name']}
+            summary.append(entry)
+            pending.append((entry, reporter, started))
+        runner.background_exporter.close()
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with --resume to continue.", file=sys.stderr)
+        return EXIT_INTERRUPTED
+
+    for entry, reporter, started in pending:
+        entry.update({
+            'status': 'ok' if reporter.outcome == "processing_done" else 'failed',
+            'message': reporter.message,
+            'seconds': round((reporter.finished or time.monotonic()) - started, 2),
+        })
+
+    failed = sum(1 for job in summary if job['status'] == 'failed')
+    if not failed:
+        exit_code = EXIT_OK
+    elif failed == len(summary):
+        exit_code = EXIT_ALL_FAILED
+    else:
+        exit_code = EXIT_JOB_FAILED
+    print(json.dumps({'exit_code': exit_code, 'jobs': summary}, indent=2))
+    return exit_code
 
-    def on_closing(self):
-        """Handles application shutdown."""
-        if messagebox.askokcancel("Quit", "Do you want to quit?"):
-            self.root.destroy()
 
 # --- Main Execution ---
 def main():
     """Main function to set up and run the application."""
+    parser = argparse.ArgumentParser(description="Placement Tracker. Opens the GUI unless --manifest is given.")
+    parser.add_argument('--manifest', help="TOML or JSON job manifest to run headless")
+    parser.add_argument('--secrets', help="path to secret.toml (default: next to the app)")
+    parser.add_argument('--resume', action='store_true', help="resume unfinished jobs and skip finished ones")
+    parser.add_argument('--verbose', '-v', action='store_true', help="log every processed song")
+    parser.add_argument('--endpoint', help="send all provider requests to this base URL (see mock_providers.py)")
+    parser.add_argument('--record', metavar='CASSETTE', help="record provider responses to a JSON Lines cassette")
+    # Ignore anything else the platform passes in (e.g. macOS -psn_* arguments)
+    args, _ = parser.parse_known_args()
+    if args.manifest:
+        sys.exit(run_manifest(args.manifest, args.secrets, args.resume, args.verbose, args.endpoint, args.record))
+
     # This allows Ctrl+C to close the app from the terminal
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     
@@ -844,6 +856,7 @@ def main():
     app = PlacementTrackerApp(root)
     # The app will only run if credentials load successfully
     if hasattr(app, 'credentials') and app.credentials:
+        configure_endpoints(args.endpoint, args.record)
         root.mainloop()
 
 if __name__ == "__main__":
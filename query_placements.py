@@ -0,0 +1,109 @@
+"""
+Query the placements store: every song the tracker has exported, with its
+latest stream and view counts, across all runs and producers.
+
+    python query_placements.py --label "Republic Records" --sort daily_streams --limit 20
+    python query_placements.py --producer "Metro Boomin" --format csv > metro.csv
+    python query_placements.py --history genius:123456
+    python query_placements.py --runs
+
+Filters match a whole producer, label or artist name, ignoring case. Results go
+to stdout; the row count and query time go to stderr.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+
+from placement_core import STORE_SORT_COLUMNS, placement_store
+
+# --- Output ---
+TABLE_COLUMNS = [
+    ('key', "Key"), ('artist', "Artist"), ('title', "Title"), ('label', "Label"), ('producers', "Producers"),
+    ('total_streams', "Total Streams"), ('daily_streams', "Daily Streams"), ('youtube_views', "YouTube Views"),
+    ('taken', "As Of"),
+]
+NUMBER_COLUMNS = {'total_streams', 'daily_streams', 'youtube_views'}
+TIME_COLUMNS = {'taken', 'started', 'finished', 'first_seen', 'last_seen'}
+MAX_CELL_WIDTH = 40
+
+
+def format_cell(column, value):
+    """Text for one table cell: numbers get thousands separators, timestamps become dates."""
+    if value is None:
+        return ""
+    if column in NUMBER_COLUMNS:
+        return f"{value:,}"
+    if column in TIME_COLUMNS:
+        return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M")
+    text = str(value).replace("\n", " | ")  # manual-input sources are one song per line
+    return text if len(text) <= MAX_CELL_WIDTH else text[:MAX_CELL_WIDTH - 1] + "…"
+
+def print_table(rows, columns):
+    """Plain aligned columns; numbers are right-aligned."""
+    cells = [[format_cell(name, row.get(name)) for name, _ in columns] for row in rows]
+    widths = [max([len(heading)] + [len(line[i]) for line in cells]) for i, (_, heading) in enumerate(columns)]
+    def line(values):
+        return "  ".join(value.rjust(width) if name in NUMBER_COLUMNS else value.ljust(width)
+                         for (name, _), value, width in zip(columns, values, widths)).rstrip()
+    print(line([heading for _, heading in columns]))
+    print(line(["-" * width for width in widths]))
+    for values in cells:
+        print(line(values))
+
+def write_rows(rows, output_format, columns):
+    if output_format == 'json':
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+    elif output_format == 'csv':
+        fieldnames = list(rows[0].keys()) if rows else [name for name, _ in columns]
+        writer = csv.DictWriter(sys.stdout, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        print_table(rows, columns)
+
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Query the placements store.")
+    parser.add_argument('--producer', help="songs credited to this producer")
+    parser.add_argument('--label', help="songs on this label")
+    parser.add_argument('--artist', help="songs by this primary artist")
+    parser.add_argument('--track-id', help="the song with this Spotify track ID")
+    parser.add_argument('--source', help="songs of the latest run of this URL")
+    parser.add_argument('--sort', default='daily_streams', choices=sorted(STORE_SORT_COLUMNS))
+    parser.add_argument('--ascending', action='store_true', help="smallest first (default: largest first)")
+    parser.add_argument('--limit', type=int, help="at most this many rows")
+    parser.add_argument('--history', metavar='KEY', help="every snapshot of one song (the 'key' column)")
+    parser.add_argument('--runs', action='store_true', help="list recorded runs")
+    parser.add_argument('--format', default='table', choices=('table', 'csv', 'json'))
+    parser.add_argument('--db', help=f"store path (default: {placement_store.path})")
+    args = parser.parse_args()
+
+    if args.db:
+        placement_store.configure({'path': args.db})
+    started = time.perf_counter()
+    if args.runs:
+        rows = placement_store.runs(args.limit)
+        columns = [('id', "Run"), ('name', "Name"), ('source', "Source"), ('songs', "Songs"),
+                   ('started', "Started"), ('finished', "Finished")]
+    elif args.history:
+        rows = placement_store.history(args.history)
+        columns = [('run_id', "Run"), ('taken', "As Of"), ('total_streams', "Total Streams"),
+                   ('daily_streams', "Daily Streams"), ('youtube_views', "YouTube Views")]
+    else:
+        rows = placement_store.placements(producer=args.producer, label=args.label, artist=args.artist,
+                                          track_id=args.track_id, source=args.source, sort=args.sort,
+                                          descending=not args.ascending, limit=args.limit)
+        columns = TABLE_COLUMNS
+    elapsed = time.perf_counter() - started
+    write_rows(rows, args.format, columns)
+    print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())